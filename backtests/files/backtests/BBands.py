@@ -5,27 +5,35 @@
 from __future__ import print_function
 
 from pyalgotrade import strategy
-from pyalgotrade.barfeed import yahoofeed
-
-from pyalgotrade.technical import bollinger
-
-from pyalgotrade.stratanalyzer import sharpe
-from pyalgotrade.stratanalyzer import drawdown
-from pyalgotrade.stratanalyzer import trades
-from pyalgotrade import plotter
-import pyalgotrade
 
 from pyalgotrade import broker as basebroker
 
 from _functions import GenerateJSONReport 
+from _functions import AttachAnalyzers
+from _functions import RunResumable
+from _functions import AddDataSeries
+from _functions import CreatePlotter
 
-import argparse
-import sys
-import os
+from _broker import CreateBroker
+
+from _memo import RunMemoized
 
-import time
+from _store import RecordRun
+from _store import RunRecord
 
-import pandas as pd
+from _resample import Resample
+from _resample import DataFrequency
+from _resample import frequencies
+
+import _indicators
+
+from _profile import PhaseTimer
+from _profile import Perfdata
+from _profile import WriteProfile
+from _profile import RunCProfiled
+
+import argparse
+import sys
 
 # Nagios constants. 
 
@@ -38,10 +46,13 @@ strategy_name = "from pyalgotrade.technical import bollinger"
 
 class BBands(strategy.BacktestingStrategy):
 
-    def __init__(self, feed, instrument, shares, capital, dataFile, bandsPeriod):
-        super(BBands, self).__init__(feed)
+    def __init__(self, feed, instrument, shares, capital, dataFile, bandsPeriod, commission=0.0, slippage=0.0):
+        super(BBands, self).__init__(feed, capital)
         self.__instrument = instrument
-        self.__bbands = bollinger.BollingerBands(feed[instrument].getCloseDataSeries(), bandsPeriod, 2)
+        # What a share costs at the close, once the broker's slippage and commission are added.
+        self.__costFactor = (1 + slippage) * (1 + commission)
+        # The feed's bars hold the adjusted values (see _datacache.py).
+        self.__bbands = _indicators.BollingerBands(feed[instrument].getCloseDataSeries(), bandsPeriod, 2, dataFile)
         self.setDebugMode(False)
 
 
@@ -63,56 +74,82 @@ class BBands(strategy.BacktestingStrategy):
         shares = self.getBroker().getShares(self.__instrument)
         bar = bars[self.__instrument]
         if shares == 0 and bar.getClose() < lower:
-            sharesToBuy = int(self.getBroker().getCash(False) / bar.getClose())
+            sharesToBuy = int(self.getBroker().getCash(False) / (bar.getClose() * self.__costFactor))
             self.marketOrder(self.__instrument, sharesToBuy)
         elif shares > 0 and bar.getClose() > upper:
             self.marketOrder(self.__instrument, -1*shares)
 
 
-def run_strategy(ticker, shares, capital, dataFile, bandsPeriod):
+def run_strategy(ticker, shares, capital, dataFile, bandsPeriod, engine="event", resume=True, plot=True, bounded=False, broker="stock", commission=0.0, slippage=0.0):
 
-    # Load the bar feed from the CSV file
-    feed = yahoofeed.Feed()
-    feed.addBarsFromCSV(ticker, dataFile)
+    timer = PhaseTimer()
 
-    # Evaluate the strategy with the feed.
-    strat = BBands(feed, ticker, shares, capital, dataFile, bandsPeriod)
-    
-    # Attach  analyzers to the strategy before executing it.
-    retAnalyzer = pyalgotrade.stratanalyzer.returns.Returns()
-    strat.attachAnalyzer(retAnalyzer)
-
-    sharpeRatioAnalyzer = sharpe.SharpeRatio()
-    strat.attachAnalyzer(sharpeRatioAnalyzer)
-   
-    drawDownAnalyzer = drawdown.DrawDown()
-    strat.attachAnalyzer(drawDownAnalyzer)
-    
-    tradesAnalyzer = trades.Trades()
-    strat.attachAnalyzer(tradesAnalyzer)
+    if engine == "vectorized":
 
-    # Attach the plotter
-    plt = plotter.StrategyPlotter(strat, True, True, True)
-    plt.getInstrumentSubplot(ticker).addDataSeries("upper", strat.getBollingerBands().getUpperBand())
-    plt.getInstrumentSubplot(ticker).addDataSeries("middle", strat.getBollingerBands().getMiddleBand())
-    plt.getInstrumentSubplot(ticker).addDataSeries("lower", strat.getBollingerBands().getLowerBand())
+        # Run the array based engine instead of the pyalgotrade event loop.
+        with timer.phase("load"):
+            import _vectorized
+            columns = _vectorized.LoadColumns(dataFile)
 
-    # Run the strategy.
-    strat.run()
-    
-    # Print out our findings.
-    print("Sharpe Ratio: %.2f" % sharpeRatioAnalyzer.getSharpeRatio(0.05))
+        with timer.phase("run"):
+            strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt = _vectorized.RunBBands(
+                columns, capital, bandsPeriod)
+
+        if not plot:
+            plt = None
+
+    else:
+
+        def build(feed):
+
+            # Evaluate the strategy with the feed.
+            strat = BBands(feed, ticker, shares, CreateBroker(broker, capital, feed, commission, slippage), dataFile, bandsPeriod, commission, slippage)
+
+            # Attach  analyzers to the strategy before executing it.
+            retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
 
+            # Attach the plotter
+            plt = None
+            if plot:
+                plt = CreatePlotter(strat, True, True, True)
+                AddDataSeries(plt.getInstrumentSubplot(ticker), "upper", strat.getBollingerBands().getUpperBand())
+                AddDataSeries(plt.getInstrumentSubplot(ticker), "middle", strat.getBollingerBands().getMiddleBand())
+                AddDataSeries(plt.getInstrumentSubplot(ticker), "lower", strat.getBollingerBands().getLowerBand())
+
+            return strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt
+
+        # Run the strategy over the historical data (through the binary cache), picking up
+        # from the last run's checkpoint when the data file only gained new bars.
+        strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt = RunResumable(
+            __file__, [ticker, shares, capital, bandsPeriod, plot, broker, commission, slippage], ticker, dataFile, build, resume, timer, bounded)
+    
     # Generate the JSON report
-    GenerateJSONReport(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt, ticker, capital, dataFile)
+    report = GenerateJSONReport(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt, ticker, capital, dataFile, timer)
+
+    sharpeRatio = sharpeRatioAnalyzer.getSharpeRatio(0.05)
+    maxDrawDown = drawDownAnalyzer.getMaxDrawDown()
+    totalTrades = tradesAnalyzer.getCount()
+
+    # Keep the timings for graphing the backtest cost.
+    WriteProfile(ticker, __file__, engine, timer, sharpeRatio, maxDrawDown, totalTrades)
+
+    # And the run's history (see _store.py).
+    RecordRun(RunRecord(ticker, __file__, engine, {'shares': shares, 'capital': capital, 'bandsPeriod': bandsPeriod,
+                                'broker': broker, 'commission': commission, 'slippage': slippage, 'frequency': DataFrequency(dataFile)},
+                        dataFile, timer, report))
+
+    # Print out our findings, with the results and timings as Nagios perfdata.
+    print("Sharpe Ratio: %.2f | %s" % (sharpeRatio, Perfdata(timer, sharpeRatio, maxDrawDown, totalTrades)))
     
-    if sharpeRatioAnalyzer.getSharpeRatio(0.05) > 0: 
-       sys.exit(OK)
+    if sharpeRatio > 0: 
+       return OK
     else:
-       sys.exit(CRITICAL)
+       return CRITICAL
 
 
-if __name__ == "__main__":
+# Parse and validate the Nagios arguments, then run the backtest.
+# Returns the Nagios exit code.
+def main(argv=None):
 
     parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
     
@@ -121,28 +158,37 @@ if __name__ == "__main__":
     parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).")
     parser.add_argument("-n", "--data_format", help="The provider of the historical data.")
     parser.add_argument("-b", "--bandsPeriod", help="The sma period that we will use as the basis for entry into a trade")
-
-    args = parser.parse_args()
+    parser.add_argument("--engine", help="The backtest engine to use: event (pyalgotrade, default) or vectorized (NumPy).", choices=["event", "vectorized"], default="event")
+    parser.add_argument("--no_plot", "--no-plot", help="Skip the plot (no <ticker>.png is written).", action="store_true")
+    parser.add_argument("--bounded", help="Stream the bars and keep only rolling or downsampled series, so memory stays flat however long the history (event engine, not checkpointed).", action="store_true")
+    parser.add_argument("--broker", help="The broker the event engine trades with: stock (pyalgotrade, default) or market (market orders only, lighter, see _broker.py).", choices=["stock", "market"], default="stock")
+    parser.add_argument("--commission", help="Commission charged on every fill, as a share of its value (e.g. 0.001, event engine).", default="0")
+    parser.add_argument("--slippage", help="Slippage of every fill, as a share of its price (e.g. 0.0005, event engine).", default="0")
+    parser.add_argument("--frequency", help="Run on bars of another frequency, aggregated once from the historical data: " + ", ".join(frequencies) + " (default the data's own).")
+    parser.add_argument("--cprofile", help="Profile the run with cProfile, dumping the stats to /shark/.tmp/backtest.profile.<ticker>.pstats (implies --no_cache).", action="store_true")
+    parser.add_argument("--no_cache", help="Always run the backtest from the start, ignoring (and not storing) memoized results.", action="store_true")
+
+    args = parser.parse_args(argv)
 
     if not args.ticker:
         print ("UNKNOWN - No ticker specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.shares:
         print("UNKNOWN - No shares specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.capital:
         print("UNKNOWN - No capital amount specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.data_format:
         print("UNKNOWN - No data_format specified")
-        sys.exit(UNKNOWN)       
+        return UNKNOWN       
 
     if not args.bandsPeriod:
         print("UNKNOWN - No bandsPeriod specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
         
     ticker = args.ticker 
@@ -158,4 +204,37 @@ if __name__ == "__main__":
 
         dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
         
-    run_strategy(ticker, shares, capital, dataFile, bandsPeriod)
+    commission = float(args.commission)
+    slippage = float(args.slippage)
+
+    # Weekly, monthly or N minute bars are built once, next to the historical data (see _resample.py).
+    if args.frequency and dataFile:
+        try:
+            dataFile = Resample(dataFile, args.frequency)
+        except (OSError, ValueError) as e:
+            print("UNKNOWN - " + str(e))
+            return UNKNOWN
+
+    if args.engine == "vectorized" and (commission or slippage):
+        print("UNKNOWN - Commission and slippage need the event engine")
+        return UNKNOWN
+
+    if args.cprofile:
+        return RunCProfiled(ticker, lambda: run_strategy(ticker, shares, capital, dataFile, bandsPeriod, args.engine, resume=False, plot=not args.no_plot, bounded=args.bounded,
+            broker=args.broker, commission=commission, slippage=slippage))
+
+    if args.no_cache:
+        return run_strategy(ticker, shares, capital, dataFile, bandsPeriod, args.engine, resume=False, plot=not args.no_plot, bounded=args.bounded,
+            broker=args.broker, commission=commission, slippage=slippage)
+
+    # Reuse the result of an identical earlier run (same code, arguments and data).
+    memoArgs = {name: value for name, value in vars(args).items() if name != 'no_cache'}
+
+    return RunMemoized(__file__, memoArgs, ticker, dataFile,
+        lambda: run_strategy(ticker, shares, capital, dataFile, bandsPeriod, args.engine, plot=not args.no_plot, bounded=args.bounded,
+            broker=args.broker, commission=commission, slippage=slippage))
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
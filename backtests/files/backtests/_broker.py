@@ -0,0 +1,294 @@
+#!/usr/bin/python3.9
+
+# A lightweight broker for the event driven backtests.
+#
+# RSI2, BBands and Moving Averages only trade market orders (enterLong,
+# enterShort, marketOrder, exitMarket) on their one instrument, so the stock
+# pyalgotrade broker's generic machinery (a fill strategy refreshed on every
+# bar, the double dispatch per order type, stop/limit bookkeeping) is mostly
+# overhead. MarketBroker is that subset:
+#
+# * Nothing happens on a bar without pending orders.
+# * Orders are filled at the next bar's open (its close for market-on-close
+#   orders), at most volumeLimit of the bar's volume, partially filled
+#   otherwise, and not at all when the cash wouldn't cover the fill.
+# * Day orders are canceled after their first day, as the stock broker does.
+# * Commissions are pyalgotrade Commission objects, slippage a fixed share of
+#   the price against the order (see FixedSlippage).
+#
+# It keeps the pyalgotrade broker interface and order objects, so positions,
+# analyzers, plotters and checkpoints work unchanged, and fills exactly as the
+# stock broker with the same commission and slippage (see broker_parity.py).
+# Any other order type is refused.
+
+import pyalgotrade.bar
+
+from pyalgotrade import broker
+from pyalgotrade import logger
+from pyalgotrade.broker import backtesting
+from pyalgotrade.broker import slippage
+
+##############################################################
+# Slippage as a fixed share of the price: buys fill higher, sells lower.
+class FixedSlippage(slippage.SlippageModel):
+
+    def __init__(self, share):
+        super(FixedSlippage, self).__init__()
+        self.__share = share
+
+    def calculatePrice(self, order, price, quantity, bar, volumeUsed):
+        if order.isBuy():
+            return price * (1 + self.__share)
+        return price * (1 - self.__share)
+
+##############################################################
+class MarketBroker(broker.Broker):
+
+    LOGGER_NAME = "broker.market"
+
+    def __init__(self, cash, barFeed, commission=None, slippageShare=0.0, volumeLimit=0.25):
+
+        super(MarketBroker, self).__init__()
+
+        assert(cash >= 0)
+        self.__cash = cash
+        self.__commission = commission if commission is not None else backtesting.NoCommission()
+        self.__slippageShare = slippageShare
+        self.__volumeLimit = volumeLimit
+        self.__shares = {}
+        self.__activeOrders = {}
+        self.__nextOrderId = 1
+        self.__traits = broker.IntegerTraits()
+        self.__logger = logger.getLogger(MarketBroker.LOGGER_NAME)
+
+        # Volume left in the bars being processed, per instrument.
+        self.__volumeLeft = {}
+
+        # As the stock broker, subscribe to the feed before the strategy does.
+        barFeed.getNewValuesEvent().subscribe(self.onBars)
+        self.__barFeed = barFeed
+        self.__daily = barFeed.getFrequency() >= pyalgotrade.bar.Frequency.DAY
+
+    def getLogger(self):
+        return self.__logger
+
+    def getCommission(self):
+        return self.__commission
+
+    def getUseAdjustedValues(self):
+        return False
+
+    def getInstrumentTraits(self, instrument):
+        return self.__traits
+
+    def getCash(self, includeShort=True):
+
+        ret = self.__cash
+        bars = self.__barFeed.getCurrentBars()
+        if not includeShort and bars is not None:
+            for instrument, shares in self.__shares.items():
+                if shares < 0:
+                    bar = bars.getBar(instrument) or self.__barFeed.getLastBar(instrument)
+                    ret += bar.getPrice() * shares
+
+        return ret
+
+    def getShares(self, instrument):
+        return self.__shares.get(instrument, 0)
+
+    def getPositions(self):
+        return self.__shares
+
+    def getActiveInstruments(self):
+        return [instrument for instrument, shares in self.__shares.items() if shares != 0]
+
+    def getEquity(self):
+
+        ret = self.__cash
+        for instrument, shares in self.__shares.items():
+            ret += self.__barFeed.getLastBar(instrument).getPrice() * shares
+
+        return ret
+
+    def getActiveOrders(self, instrument=None):
+
+        if instrument is None:
+            return list(self.__activeOrders.values())
+        return [order for order in self.__activeOrders.values() if order.getInstrument() == instrument]
+
+    ##############################################################
+    def createMarketOrder(self, action, instrument, quantity, onClose=False):
+
+        if onClose and self.__barFeed.isIntraday():
+            raise Exception("Market-on-close not supported with intraday feeds")
+
+        return backtesting.MarketOrder(action, instrument, quantity, onClose, self.__traits)
+
+    def createLimitOrder(self, action, instrument, limitPrice, quantity):
+        raise Exception("The market broker only supports market orders")
+
+    def createStopOrder(self, action, instrument, stopPrice, quantity):
+        raise Exception("The market broker only supports market orders")
+
+    def createStopLimitOrder(self, action, instrument, stopPrice, limitPrice, quantity):
+        raise Exception("The market broker only supports market orders")
+
+    def submitOrder(self, order):
+
+        if not order.isInitial():
+            raise Exception("The order was already processed")
+
+        order.setSubmitted(self.__nextOrderId, self.__barFeed.getCurrentDateTime())
+        self.__nextOrderId += 1
+        self.__activeOrders[order.getId()] = order
+
+        order.switchState(broker.Order.State.SUBMITTED)
+        self.notifyOrderEvent(broker.OrderEvent(order, broker.OrderEvent.Type.SUBMITTED, None))
+
+    def cancelOrder(self, order):
+
+        activeOrder = self.__activeOrders.get(order.getId())
+        if activeOrder is None:
+            raise Exception("The order is not active anymore")
+        if activeOrder.isFilled():
+            raise Exception("Can't cancel order that has already been filled")
+
+        self.__cancel(activeOrder, "User requested cancellation")
+
+    def __cancel(self, order, reason):
+
+        del self.__activeOrders[order.getId()]
+        order.switchState(broker.Order.State.CANCELED)
+        self.notifyOrderEvent(broker.OrderEvent(order, broker.OrderEvent.Type.CANCELED, reason))
+
+    ##############################################################
+    def onBars(self, dateTime, bars):
+
+        if not self.__activeOrders:
+            return
+
+        self.__volumeLeft = {}
+
+        # Orders submitted while these are processed wait for the next bars.
+        for order in list(self.__activeOrders.values()):
+
+            bar = bars.getBar(order.getInstrument())
+            if bar is None:
+                continue
+
+            if order.isSubmitted():
+                order.setAcceptedDateTime(bar.getDateTime())
+                order.switchState(broker.Order.State.ACCEPTED)
+                self.notifyOrderEvent(broker.OrderEvent(order, broker.OrderEvent.Type.ACCEPTED, None))
+
+            if not order.isActive():
+                # Canceled by an ACCEPTED event handler.
+                continue
+
+            goodTillCanceled = order.getGoodTillCanceled()
+            if not goodTillCanceled and bar.getDateTime().date() > order.getAcceptedDateTime().date():
+                self.__cancel(order, "Expired")
+                continue
+
+            self.__fill(order, bar)
+
+            # A day order on daily bars won't see another bar of its day.
+            if order.isActive() and not goodTillCanceled and self.__daily and bar.getDateTime().date() >= order.getAcceptedDateTime().date():
+                self.__cancel(order, "Expired")
+
+    def __fill(self, order, bar):
+
+        instrument = order.getInstrument()
+        trade = bar.getFrequency() == pyalgotrade.bar.Frequency.TRADE
+
+        volumeLeft = self.__volumeLeft.get(instrument)
+        if volumeLeft is None:
+            if trade:
+                volumeLeft = bar.getVolume()
+            elif self.__volumeLimit is not None:
+                volumeLeft = bar.getVolume() * self.__volumeLimit
+            volumeLeft = self.__volumeLeft[instrument] = self.__traits.roundQuantity(volumeLeft) if volumeLeft is not None else None
+
+        remaining = order.getRemaining()
+        maxVolume = volumeLeft if volumeLeft is not None else remaining
+        if not order.getAllOrNone():
+            quantity = min(maxVolume, remaining)
+        else:
+            quantity = remaining if remaining <= maxVolume else 0
+
+        if quantity == 0:
+            self.__logger.debug("Not enough volume to fill %s market order [%s] for %s share/s", instrument, order.getId(), remaining)
+            return
+
+        price = bar.getClose() if order.getFillOnClose() else bar.getOpen()
+        if not trade and self.__slippageShare:
+            price = price * (1 + self.__slippageShare) if order.isBuy() else price * (1 - self.__slippageShare)
+
+        if order.isBuy():
+            cost = -price * quantity
+            sharesDelta = quantity
+        else:
+            cost = price * quantity
+            sharesDelta = -quantity
+
+        commission = self.__commission.calculate(order, price, quantity)
+        resultingCash = self.__cash + cost - commission
+        if resultingCash < 0:
+            self.__logger.debug("Not enough cash to fill %s order [%s] for %s share/s", instrument, order.getId(), remaining)
+            return
+
+        execInfo = broker.OrderExecutionInfo(price, quantity, commission, bar.getDateTime())
+        order.addExecutionInfo(execInfo)
+
+        self.__cash = resultingCash
+        shares = self.__traits.roundQuantity(self.__shares.get(instrument, 0) + sharesDelta)
+        if shares == 0:
+            self.__shares.pop(instrument, None)
+        else:
+            self.__shares[instrument] = shares
+
+        if volumeLeft is not None:
+            self.__volumeLeft[instrument] = self.__traits.roundQuantity(volumeLeft - quantity)
+
+        if order.isFilled():
+            del self.__activeOrders[order.getId()]
+            self.notifyOrderEvent(broker.OrderEvent(order, broker.OrderEvent.Type.FILLED, execInfo))
+        else:
+            self.notifyOrderEvent(broker.OrderEvent(order, broker.OrderEvent.Type.PARTIALLY_FILLED, execInfo))
+
+    ##############################################################
+    # Every event was emitted while the feed's were handled.
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def join(self):
+        pass
+
+    def eof(self):
+        return self.__barFeed.eof()
+
+    def dispatch(self):
+        pass
+
+    def peekDateTime(self):
+        return None
+
+##############################################################
+# The broker a backtest's strategy is built with: the stock pyalgotrade
+# broker or the MarketBroker, charging commission (a share of each fill's
+# value) and slippage (a share of the price).
+def CreateBroker(name, capital, feed, commission=0.0, slippageShare=0.0):
+
+    commissionModel = backtesting.TradePercentage(commission) if commission else None
+
+    if name == "market":
+        return MarketBroker(capital, feed, commissionModel, slippageShare)
+
+    brk = backtesting.Broker(capital, feed, commissionModel)
+    if slippageShare:
+        brk.getFillStrategy().setSlippageModel(FixedSlippage(slippageShare))
+
+    return brk
@@ -0,0 +1,240 @@
+#!/usr/bin/python3.9
+
+# Rendering of a backtest's plot, downsampled, and export of its series.
+#
+# pyalgotrade's StrategyPlotter draws every bar of every series, so the cost of
+# <ticker>.png grows with the history while the picture is only a few hundred
+# pixels wide. Instead, the series are taken out of the plotter and the bars to
+# draw are picked with LTTB (Largest-Triangle-Three-Buckets, which keeps the
+# peaks and troughs a plain stride drops) on the line of each subplot, plus
+# every bar with a buy or sell marker. The plotter's own subplots then draw
+# just those bars, so the plot looks as before.
+#
+# The series are also exported for the web page to draw them itself:
+#
+#   <ticker>.series.json  the downsampled bars of every series, and a
+#                         description of the binary file
+#   <ticker>.series.bin   every bar: the dates as int64 seconds, then each
+#                         series as float32 (NaN where it has no value)
+#
+# The series file keeps a digest of the series, and when a run's series are
+# the same as those of the plot on disk (e.g. a rerun without new bars) nothing
+# is rendered or exported again.
+#
+# Imports matplotlib (through pyalgotrade's plotter), import it only to plot.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from _report import SeriesFile
+from _report import SeriesBinaryFile
+
+from pyalgotrade import plotter
+
+chartVersion = 1
+
+# Bars kept per line, well over the width of a saved plot (640 pixels at
+# matplotlib's default size).
+maxPoints = 1024
+
+##############################################################
+# Indices of the threshold points of y (at positions x, the bar index by
+# default) LTTB keeps: the first and last, and in each of threshold - 2 even
+# buckets in between the one forming the largest triangle with the point kept
+# before it and the average of the next bucket. NaNs are skipped.
+def LTTB(y, threshold, x=None):
+
+    y = np.asarray(y, dtype=np.float64)
+    x = np.arange(len(y), dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+    valid = np.flatnonzero(np.isfinite(y))
+    n = len(valid)
+    if threshold >= n or threshold < 3:
+        return valid
+
+    xs = x[valid]
+    ys = y[valid]
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+
+        if i + 2 < len(edges):
+            nextX = xs[end:edges[i + 2]].mean() if edges[i + 2] > end else xs[end]
+            nextY = ys[end:edges[i + 2]].mean() if edges[i + 2] > end else ys[end]
+        else:
+            nextX, nextY = xs[n - 1], ys[n - 1]
+
+        areas = np.abs((xs[a] - nextX) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (nextY - ys[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+
+    return valid[np.unique(selected)]
+
+##############################################################
+# The series of a plotter: the dates of its bars (datetime64[s]) and a column
+# per series, as {'subplot', 'name', 'kind' ('line', 'buy' or 'sell'),
+# 'values' (NaN where a series has no value)}, in drawing order.
+def _strategy_subplots(plot):
+
+    subplots = [(name, subplot) for name, subplot in plot._StrategyPlotter__barSubplots.items()]
+    subplots += [(name, subplot) for name, subplot in plot._StrategyPlotter__namedSubplots.items()]
+    if plot.getPortfolioSubplot() is not None:
+        subplots.append(("portfolio", plot.getPortfolioSubplot()))
+
+    return subplots
+
+def _kind(series):
+
+    if isinstance(series, plotter.BuyMarker):
+        return 'buy'
+    if isinstance(series, plotter.SellMarker):
+        return 'sell'
+    return 'line'
+
+def PlotSeries(plot):
+
+    if not isinstance(plot, plotter.StrategyPlotter):
+        return plot.getSeries()
+
+    dateTimes = sorted(plot._StrategyPlotter__dateTimes)
+
+    columns = []
+    for subplotName, subplot in _strategy_subplots(plot):
+        for name, series in subplot.getAllSeries().items():
+            values = [series.getValue(dateTime) for dateTime in dateTimes]
+            columns.append({'subplot': str(subplotName), 'name': str(name), 'kind': _kind(series),
+                            'values': np.array([np.nan if value is None else value for value in values], dtype=np.float64)})
+
+    return np.array(dateTimes, dtype='datetime64[s]'), columns
+
+def Digest(dates, columns):
+
+    h = hashlib.sha256()
+    h.update(("chart-%d-%d\n" % (chartVersion, maxPoints)).encode('utf-8'))
+    h.update(np.ascontiguousarray(dates.astype(np.int64)).tobytes())
+    for column in columns:
+        h.update(("%s\n%s\n%s\n" % (column['subplot'], column['name'], column['kind'])).encode('utf-8'))
+        h.update(np.ascontiguousarray(column['values']).tobytes())
+
+    return h.hexdigest()
+
+# The bars to draw: LTTB over the first line of each subplot, and every marker.
+def SelectPoints(dates, columns, threshold=maxPoints):
+
+    points = [np.array([0, len(dates) - 1], dtype=np.int64)] if len(dates) else []
+
+    lined = set()
+    for column in columns:
+        if column['kind'] == 'line' and column['subplot'] not in lined:
+            lined.add(column['subplot'])
+            points.append(LTTB(column['values'], threshold))
+        elif column['kind'] != 'line':
+            points.append(np.flatnonzero(np.isfinite(column['values'])))
+
+    return np.unique(np.concatenate(points)) if points else np.array([], dtype=np.int64)
+
+##############################################################
+def _render_strategy_plotter(plot, fileName, dateTimes):
+
+    from matplotlib import pyplot
+
+    subplots = _strategy_subplots(plot)
+
+    # As StrategyPlotter.savePlot(), over the selected bars only.
+    fig, axes = pyplot.subplots(nrows=len(subplots), sharex=True, squeeze=False)
+    for i, (name, subplot) in enumerate(subplots):
+        if not subplot.isEmpty():
+            subplot.plot(axes[i][0], dateTimes)
+            axes[i][0].grid(True)
+
+    fig.autofmt_xdate()
+    fig.savefig(fileName, bbox_inches="tight", format="png")
+
+def _write_atomic(path, write):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'wb') as f:
+            write(f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+def ExportSeries(ticker, dates, columns, points, digest):
+
+    jsonFile, binFile = SeriesFile(ticker), SeriesBinaryFile(ticker)
+
+    def write_bin(f):
+        f.write(dates.astype('<i8').tobytes())
+        for column in columns:
+            f.write(column['values'].astype('<f4').tobytes())
+
+    _write_atomic(binFile, write_bin)
+
+    subplots = []
+    for column in columns:
+        if not subplots or subplots[-1]['name'] != column['subplot']:
+            subplots.append({'name': column['subplot'], 'series': []})
+        subplots[-1]['series'].append({'name': column['name'], 'kind': column['kind'],
+                                       'values': [None if value != value else float("%.6g" % value) for value in column['values'][points].tolist()]})
+
+    doc = {
+        'version': chartVersion,
+        'ticker': ticker,
+        'digest': digest,
+        'rows': len(dates),
+        'points': len(points),
+        'dates': dates[points].astype(np.int64).tolist(),
+        'subplots': subplots,
+        'binary': {
+            'file': os.path.basename(binFile),
+            'rows': len(dates),
+            'layout': "int64 dates (seconds), then each series' values as float32, little endian",
+            'series': [column['subplot'] + "/" + column['name'] for column in columns],
+        },
+    }
+
+    _write_atomic(jsonFile, lambda f: f.write(json.dumps(doc).encode('utf-8')))
+
+##############################################################
+# Render a plotter to fileName and export its series next to it, unless its
+# series are those of the last render. Returns whether it rendered.
+def RenderPlot(plot, fileName, ticker):
+
+    dates, columns = PlotSeries(plot)
+    digest = Digest(dates, columns)
+
+    # The series file carries the digest of the plot it was exported with, and
+    # is restored together with it from the memo (see _memo.py).
+    try:
+        with open(SeriesFile(ticker), 'r', encoding='utf-8') as f:
+            unchanged = json.load(f).get('digest') == digest and os.path.exists(fileName) and os.path.exists(SeriesBinaryFile(ticker))
+    except (OSError, ValueError):
+        unchanged = False
+
+    if unchanged:
+        return False
+
+    points = SelectPoints(dates, columns)
+
+    if isinstance(plot, plotter.StrategyPlotter):
+        dateTimes = sorted(plot._StrategyPlotter__dateTimes)
+        _render_strategy_plotter(plot, fileName, [dateTimes[i] for i in points])
+    else:
+        plot.savePlot(fileName, points)
+
+    ExportSeries(ticker, dates, columns, points, digest)
+
+    return True
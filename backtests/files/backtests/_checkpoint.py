@@ -0,0 +1,181 @@
+#!/usr/bin/python3.9
+
+# Checkpoints of finished event driven backtests.
+#
+# After a run the strategy, its broker, indicators, analyzers and plotter are
+# pickled together with the number of bars processed and a fingerprint of
+# those bars. When the data file has only grown since (the daily refresh
+# appends a row), the next run restores the checkpoint and feeds it just the
+# new bars. Any other change to the history, e.g. a restated adjusted close,
+# changes the fingerprint and the backtest is replayed from the start.
+#
+# Checkpoints are keyed by strategy script and ticker; a change to the code or
+# the arguments also forces a full replay.
+
+import copyreg
+import hashlib
+import importlib
+import io
+import json
+import os
+import pickle
+import sys
+import types
+
+from _datacache import columnNames
+from _memo import HashSources
+
+checkpointVersion = 1
+
+checkpointDir = "/shark/.tmp/backtest.checkpoint"
+
+def CheckpointFile(scriptFile, ticker):
+    return os.path.join(checkpointDir, "%s.%s.pickle" % (os.path.splitext(os.path.basename(scriptFile))[0], ticker))
+
+def CheckpointKey(scriptFile, params):
+
+    import pyalgotrade
+
+    h = hashlib.sha256()
+    h.update(("checkpoint-%d-%s\n" % (checkpointVersion, pyalgotrade.__version__)).encode('utf-8'))
+    HashSources(h, scriptFile)
+    h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+
+    return h.hexdigest()
+
+##############################################################
+# Fingerprint of the first n bars of the data file's columns.
+def Fingerprint(columns, n):
+
+    h = hashlib.sha256()
+    for name in columnNames:
+        h.update(columns[name][:n].tobytes())
+
+    return h.hexdigest()
+
+##############################################################
+# pyalgotrade subscribes name-mangled private methods (e.g. __onNewValue) to
+# its events, which the stock pickler can't look up again.
+def _reduce_method(method):
+
+    name = method.__func__.__name__
+    if name.startswith('__') and not name.endswith('__'):
+        name = '_' + method.__func__.__qualname__.split('.')[-2].lstrip('_') + name
+
+    return getattr, (method.__self__, name)
+
+def _find_class(moduleName, qualName):
+    return getattr(importlib.import_module(moduleName), qualName)
+
+class _Pickler(pickle.Pickler):
+
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[types.MethodType] = _reduce_method
+
+    def __init__(self, file, scriptFile):
+        pickle.Pickler.__init__(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.moduleName = os.path.splitext(os.path.basename(scriptFile))[0]
+
+    # A strategy class of a script run from the command line lives in __main__,
+    # save it under the script's module name so the daemon can load it too.
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and obj.__module__ == '__main__':
+            return _find_class, (self.moduleName, obj.__qualname__)
+        return NotImplemented
+
+##############################################################
+# Save the objects of a finished run that consumed the first n bars.
+def SaveCheckpoint(scriptFile, ticker, key, columns, n, objects):
+
+    buf = io.BytesIO()
+    _Pickler(buf, scriptFile).dump({
+        'key': key,
+        'bars': n,
+        'fingerprint': Fingerprint(columns, n),
+        'objects': objects,
+    })
+
+    path = CheckpointFile(scriptFile, ticker)
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        os.makedirs(checkpointDir, exist_ok=True)
+        with open(tmpPath, 'wb') as f:
+            f.write(buf.getvalue())
+        os.replace(tmpPath, path)
+    except OSError:
+        # Checkpoints are only an optimization.
+        pass
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+##############################################################
+# Returns (objects, bars processed) when the checkpoint can be resumed with
+# the current columns, None when the backtest has to be replayed.
+def LoadCheckpoint(scriptFile, ticker, key, columns):
+
+    try:
+        with open(CheckpointFile(scriptFile, ticker), 'rb') as f:
+            checkpoint = pickle.load(f)
+    except Exception:
+        # Missing, truncated or written by an incompatible version.
+        return None
+
+    n = checkpoint['bars']
+    if checkpoint['key'] != key or n > len(columns['date']) or checkpoint['fingerprint'] != Fingerprint(columns, n):
+        return None
+
+    return checkpoint['objects'], n
+
+##############################################################
+# Resuming hands the new bars to the restored feed through pyalgotrade's name
+# mangled privates. Assigning a renamed one would quietly add a new attribute
+# instead, so the installed pyalgotrade's feed and dispatcher are checked for
+# them first (a restored one has them from its pickle), and without them runs
+# are neither resumed nor checkpointed.
+feedAttributes = ['_BarFeed__started', '_BarFeed__bars', '_BarFeed__nextPos']
+dispatcherAttributes = ['_Dispatcher__stop']
+
+_resumable = None
+
+def Resumable():
+
+    global _resumable
+
+    if _resumable is None:
+
+        from pyalgotrade import bar
+        from pyalgotrade import dispatcher
+        from pyalgotrade.barfeed import csvfeed
+
+        feed = csvfeed.GenericBarFeed(bar.Frequency.DAY)
+        missing = [name for name in feedAttributes if not hasattr(feed, name)] + \
+            [name for name in dispatcherAttributes if not hasattr(dispatcher.Dispatcher(), name)]
+        if missing:
+            print("Checkpoints disabled, this pyalgotrade lacks " + ", ".join(missing), file=sys.stderr)
+
+        _resumable = not missing
+
+    return _resumable
+
+# Feed a restored strategy the bars after its checkpoint and let its
+# dispatcher run again.
+def ResumeFeed(strat, ticker, bars):
+
+    feed = strat.getFeed()
+    feed._BarFeed__started = False
+    feed.addBarsFromSequence(ticker, bars)
+    strat.getDispatcher()._Dispatcher__stop = False
+
+# The bars themselves are not part of the checkpoint, only the state built from them.
+def DetachBars(strat, ticker):
+
+    feed = strat.getFeed()
+    feed._BarFeed__bars[ticker] = []
+    feed._BarFeed__nextPos[ticker] = 0
+
+def RemoveCheckpoint(scriptFile, ticker):
+
+    path = CheckpointFile(scriptFile, ticker)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,269 @@
+#!/usr/bin/python3.9
+
+# Binary columnar cache for the historical CSV files.
+#
+# Each CSV is converted once into a .npy file next to it, holding one row per
+# column (date, open, high, low, close, adj close, volume, and the adjusted
+# open, high and low) so every column is contiguous and can be memory mapped. A small JSON file records the size and
+# mtime of the CSV the cache was built from; when either changes the cache is
+# rebuilt on the next read.
+#
+# The cache is built from the CSV a chunk of rows at a time, and ReadColumns
+# reads a range of rows back with plain file reads, so neither side needs the
+# whole history in memory (see _streaming.py).
+#
+# The digest of a CSV (its SHA-256) is kept the same way, in a JSON file next
+# to it, for everything keyed on the data's contents (the memo, the indicator
+# cache and the results store), so a run reads the CSV for it at most once.
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+cacheVersion = 2
+
+columnNames = ['date', 'open', 'high', 'low', 'close', 'adj_close', 'volume', 'adj_open', 'adj_high', 'adj_low']
+
+csvColumns = {'date': 'Date', 'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'adj_close': 'Adj Close', 'volume': 'Volume'}
+
+# CSV rows parsed at a time while building the cache.
+chunkRows = 1 << 18
+
+def CachePaths(dataFile):
+    return dataFile + ".npy", dataFile + ".meta.json"
+
+def _source_stamp(dataFile):
+    st = os.stat(dataFile)
+    return {'version': cacheVersion, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+# The table of a parsed CSV (or a chunk of it): its columns in the given order,
+# plus the adjusted open, high and low.
+#
+# These are computed as pyalgotrade's BasicBar does on every call when a
+# strategy uses adjusted values (adj close * price / close). The high and low
+# are kept around the adjusted open and close, which a rounding difference
+# could otherwise put out of the bar.
+def _to_table(df, dates, order):
+
+    table = np.empty((len(columnNames), len(dates)), dtype=np.float64)
+    table[0] = dates[order].astype(np.int64)
+    for row, name in enumerate(columnNames[1:7], 1):
+        table[row] = df[csvColumns[name]].values.astype(np.float64)[order]
+
+    columns = _to_columns(table)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in ['open', 'high', 'low']:
+            columns['adj_' + name][:] = columns['adj_close'] * columns[name] / columns['close']
+    columns['adj_high'][:] = np.maximum(np.maximum(columns['adj_high'], columns['adj_open']), columns['adj_close'])
+    columns['adj_low'][:] = np.minimum(np.minimum(columns['adj_low'], columns['adj_open']), columns['adj_close'])
+
+    return table
+
+def _parse_csv(dataFile):
+
+    import pandas as pd
+
+    df = pd.read_csv(dataFile)
+
+    # Same ordering as the pyalgotrade feed.
+    dates = pd.to_datetime(df[csvColumns['date']]).values.astype('datetime64[s]')
+
+    return _to_table(df, dates, np.argsort(dates, kind='stable'))
+
+def _write_atomic(path, write):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'wb') as f:
+            write(f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+def _to_columns(table):
+
+    columns = {name: table[row] for row, name in enumerate(columnNames)}
+    columns['date'] = table[0].astype(np.int64).astype('datetime64[s]')
+    return columns
+
+##############################################################
+# Build the cache a chunk of CSV rows at a time, spilling every column to its
+# own temporary file before joining them behind the .npy header. Returns False
+# (having written nothing) when the dates are out of order, which needs the
+# whole file in memory to sort.
+def _build_cache(dataFile, cacheFile):
+
+    import pandas as pd
+
+    tmpPaths = ["%s.%s.%d.tmp" % (cacheFile, name, os.getpid()) for name in columnNames]
+    try:
+        rows = 0
+        lastDate = None
+        files = [open(path, 'wb') for path in tmpPaths]
+        try:
+            for df in pd.read_csv(dataFile, chunksize=chunkRows):
+
+                dates = pd.to_datetime(df[csvColumns['date']]).values.astype('datetime64[s]')
+                if len(dates) == 0:
+                    continue
+                if np.any(dates[1:] < dates[:-1]) or (lastDate is not None and dates[0] < lastDate):
+                    return False
+
+                for f, values in zip(files, _to_table(df, dates, slice(None))):
+                    f.write(values.tobytes())
+
+                rows += len(dates)
+                lastDate = dates[-1]
+        finally:
+            for f in files:
+                f.close()
+
+        def write(f):
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                                                     'fortran_order': False, 'shape': (len(columnNames), rows)})
+            for path in tmpPaths:
+                with open(path, 'rb') as src:
+                    shutil.copyfileobj(src, f, 1 << 20)
+
+        _write_atomic(cacheFile, write)
+        return True
+
+    finally:
+        for path in tmpPaths:
+            if os.path.exists(path):
+                os.remove(path)
+
+# Make sure the cache of a CSV is up to date, returning its path, or None
+# when it can't be written.
+def UpdateCache(dataFile):
+
+    cacheFile, metaFile = CachePaths(dataFile)
+    stamp = _source_stamp(dataFile)
+
+    try:
+        with open(metaFile, 'r') as f:
+            if json.load(f) == stamp:
+                return cacheFile
+    except (OSError, ValueError):
+        pass
+
+    # The cache is only an optimization, carry on without it if it can't be written.
+    try:
+        if not _build_cache(dataFile, cacheFile):
+            table = _parse_csv(dataFile)
+            _write_atomic(cacheFile, lambda f: np.save(f, table))
+        _write_atomic(metaFile, lambda f: f.write(json.dumps(stamp).encode('utf-8')))
+    except OSError:
+        return None
+
+    return cacheFile
+
+##############################################################
+# Load the columns of a historical CSV through the cache.
+def LoadColumns(dataFile):
+
+    cacheFile = UpdateCache(dataFile)
+    if cacheFile is None:
+        return _to_columns(_parse_csv(dataFile))
+
+    return _to_columns(np.load(cacheFile, mmap_mode='r'))
+
+def _read_header(f):
+
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(f)
+
+    return shape[1], f.tell()
+
+# Number of bars in a historical CSV.
+def CountRows(dataFile):
+
+    cacheFile = UpdateCache(dataFile)
+    if cacheFile is None:
+        return len(LoadColumns(dataFile)['date'])
+
+    with open(cacheFile, 'rb') as f:
+        return _read_header(f)[0]
+
+##############################################################
+# Read the columns (all, or just the given names) of rows [start, stop) of a
+# historical CSV through the cache, without mapping (and so touching) the rest
+# of the file. As with a slice, a negative start counts from the end and a
+# stop of None reads to the end.
+def ReadColumns(dataFile, start, stop, names=None):
+
+    names = names or columnNames
+
+    cacheFile = UpdateCache(dataFile)
+    if cacheFile is None:
+        return {name: column[start:stop] for name, column in LoadColumns(dataFile).items() if name in names}
+
+    with open(cacheFile, 'rb') as f:
+
+        rows, offset = _read_header(f)
+        start, stop, step = slice(start, stop).indices(rows)
+        stop = max(start, stop)
+
+        table = np.empty((len(names), stop - start), dtype=np.float64)
+        for i, name in enumerate(names):
+            f.seek(offset + (columnNames.index(name) * rows + start) * table.itemsize)
+            table[i] = np.fromfile(f, dtype='<f8', count=stop - start)
+
+    columns = dict(zip(names, table))
+    if 'date' in columns:
+        columns['date'] = columns['date'].astype(np.int64).astype('datetime64[s]')
+
+    return columns
+
+def RemoveCache(dataFile):
+
+    for path in list(CachePaths(dataFile)) + [DigestFile(dataFile)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+##############################################################
+# SHA-256 of a CSV's contents, kept per file stamp (in memory, and in its
+# digest file for the next runs). Raises OSError when the CSV can't be read.
+_digests = {}
+
+def DigestFile(dataFile):
+    return dataFile + ".digest.json"
+
+def DataDigest(dataFile):
+
+    stamp = _source_stamp(dataFile)
+
+    cached = _digests.get(dataFile)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        with open(DigestFile(dataFile), 'r') as f:
+            entry = json.load(f)
+        digest = entry['sha256'] if entry['stamp'] == stamp else None
+    except (OSError, ValueError, KeyError, TypeError):
+        digest = None
+
+    if digest is None:
+
+        h = hashlib.sha256()
+        with open(dataFile, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+
+        # Only an optimization, like the cache.
+        try:
+            _write_atomic(DigestFile(dataFile), lambda f: f.write(json.dumps({'stamp': stamp, 'sha256': digest}).encode('utf-8')))
+        except OSError:
+            pass
+
+    _digests[dataFile] = (stamp, digest)
+    return digest
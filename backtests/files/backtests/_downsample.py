@@ -0,0 +1,79 @@
+#!/usr/bin/python3.9
+
+# A pyalgotrade StrategyPlotter that keeps at most maxPoints bars, for bounded
+# memory runs (see _streaming.py).
+#
+# Only every stride-th bar is handed to the plotter. Whenever maxPoints bars
+# have been plotted every other one is dropped and the stride doubles, so the
+# plot always covers the whole history at an even spacing. Bars with a buy or
+# sell marker are always kept.
+#
+# Imports pyalgotrade's plotter (and so matplotlib), import it only to plot.
+
+from pyalgotrade import broker
+from pyalgotrade import plotter
+
+# Roughly the pixel width of a saved plot.
+maxPoints = 4096
+
+class DownsampledPlotter(plotter.StrategyPlotter):
+
+    def __init__(self, strat, plotAllInstruments=True, plotBuySell=True, plotPortfolio=True, maxPoints=maxPoints):
+
+        super(DownsampledPlotter, self).__init__(strat, plotAllInstruments, plotBuySell, plotPortfolio)
+
+        self.__maxPoints = maxPoints
+        self.__limit = maxPoints
+        self.__stride = 1
+        self.__bars = 0
+        self.__filled = False
+
+        # Stand between the strategy and the plotter.
+        strat.getBarsProcessedEvent().unsubscribe(self._StrategyPlotter__onBarsProcessed)
+        strat.getBarsProcessedEvent().subscribe(self.__onBarsProcessed)
+        strat.getBroker().getOrderUpdatedEvent().subscribe(self.__onOrderEvent)
+
+    def __onOrderEvent(self, broker_, orderEvent):
+        if orderEvent.getEventType() in (broker.OrderEvent.Type.PARTIALLY_FILLED, broker.OrderEvent.Type.FILLED):
+            self.__filled = True
+
+    def __onBarsProcessed(self, strat, bars):
+
+        if self.__bars % self.__stride == 0 or self.__filled:
+            self._StrategyPlotter__onBarsProcessed(strat, bars)
+            if len(self._StrategyPlotter__dateTimes) >= self.__limit:
+                self.__thin()
+
+        self.__bars += 1
+        self.__filled = False
+
+    def __subplots(self):
+
+        subplots = list(self._StrategyPlotter__barSubplots.values()) + list(self._StrategyPlotter__namedSubplots.values())
+        if self.getPortfolioSubplot() is not None:
+            subplots.append(self.getPortfolioSubplot())
+
+        return subplots
+
+    # Drop every other plotted bar, keeping the ones with markers.
+    def __thin(self):
+
+        series = [s for subplot in self.__subplots() for s in subplot.getAllSeries().values()]
+
+        keep = set()
+        for s in series:
+            if isinstance(s, (plotter.BuyMarker, plotter.SellMarker)):
+                keep.update(s.getValues())
+
+        dateTimes = sorted(self._StrategyPlotter__dateTimes)
+        dropped = [dateTime for dateTime in dateTimes[1::2] if dateTime not in keep]
+
+        for dateTime in dropped:
+            self._StrategyPlotter__dateTimes.discard(dateTime)
+            for s in series:
+                s.getValues().pop(dateTime, None)
+
+        self.__stride *= 2
+
+        # Leave room for maxPoints / 2 more bars even when markers pile up.
+        self.__limit = len(self._StrategyPlotter__dateTimes) + self.__maxPoints // 2
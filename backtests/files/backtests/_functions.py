@@ -1,135 +1,367 @@
 #!/usr/bin/python3.9
 
-from pyalgotrade import strategy
+# pyalgotrade's plotter (and with it matplotlib) and the yahoo feed (which
+# pulls in pandas) are imported where they are used, so that runs which fail
+# validation, hit the memo or skip the plot don't pay for them.
+
+from pyalgotrade import stratanalyzer
+from pyalgotrade.stratanalyzer import returns
 from pyalgotrade.stratanalyzer import sharpe
 from pyalgotrade.stratanalyzer import drawdown
 from pyalgotrade.stratanalyzer import trades
-from pyalgotrade import plotter
-from pyalgotrade import plotter
 
-import argparse
-import sys
 import os
-import time
-
-import pandas as pd
-import json
-
-def GenerateJSONReport(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plot, ticker, capital, dataFile):
-
-    plotFileName = "/shark/reports/" + ticker + ".png"
-    plot.savePlot(plotFileName)
-    
-    jsonBacktestSummary = "/shark/reports/" + ticker + ".backtest.summary.json"          
-    with open(jsonBacktestSummary, 'w', encoding='utf-8') as f:
-
-        sharpeRatio = sharpeRatioAnalyzer.getSharpeRatio(0.05)
-
-        json_obj = {}
-        json_obj['backtest_summary'] = []
-
-        json_obj['backtest_summary'].append({
-            'ticker': ticker,
-            'starting_capital': capital,
-            'final_portfolio_value': "{:.2f}".format(strat.getResult()),
-            'cumulative_returns': "{:.2f}".format((retAnalyzer.getCumulativeReturns()[-1] * 100)),
-            'sharpe_ratio': "{:.2f}".format(sharpeRatio),
-            'max_drawdown': "{:.2f}".format((drawDownAnalyzer.getMaxDrawDown() * 100)),
-            'longest_drawdown_duration': str(drawDownAnalyzer.getLongestDrawDownDuration()),
-            'total_trades': str(tradesAnalyzer.getCount()), 
-            'wins': str(tradesAnalyzer.getProfitableCount()),
-            'losses': str(tradesAnalyzer.getUnprofitableCount())
-            })
 
-        json.dump(json_obj, f)
+import numpy as np
 
-    jsonBacktestTotalTrades = "/shark/reports/" + ticker + ".backtest.totaltrades.json"
-    with open(jsonBacktestTotalTrades, 'w', encoding='utf-8') as f:
+from _datacache import LoadColumns
+from _datacache import CountRows
+from _datacache import ReadColumns
 
-        if tradesAnalyzer.getCount() > 0:
+from _resample import DataFrequency
+from _resample import BarFrequency
+from _resample import FrequencyLabel
+from _resample import TradingPeriods
 
-            profits = tradesAnalyzer.getAll()          
-            returns = tradesAnalyzer.getAllReturns()
+import _streaming
 
-            json_obj = {}
-            json_obj['total_trades'] = []
+from _montecarlo import MonteCarloReport
 
-            json_obj['total_trades'].append({
-                'avg_profit': "{:.2f}".format(profits.mean()),
-                'profits_std_dev': "{:.2f}".format(profits.std()),
-                'max_profit': "{:.2f}".format(profits.max()),
-                'min_profit': "{:.2f}".format(profits.min()),
-                'avg_return': "{:.2f}".format((returns.mean() * 100)),
-                'returns_std_dev': "{:.2f}".format((returns.std() * 100)),
-                'max_return': "{:.2f}".format((returns.max() * 100)),
-                'min_return': "{:.2f}".format((returns.min() * 100))
-                })
+from _report import WriteReport
+from _report import PlotFile
+from _report import SeriesFile
+from _report import SeriesBinaryFile
 
-            json.dump(json_obj, f)
+import _checkpoint
 
-    jsonBacktestProfitableTrades = "/shark/reports/" + ticker + ".backtest.profitabletrades.json"
-    with open(jsonBacktestProfitableTrades, 'w', encoding='utf-8') as f:
+from _profile import PhaseTimer
 
-        if tradesAnalyzer.getProfitableCount() > 0:
+##############################################################
+# Load the bars of a Yahoo CSV file (through the binary cache), so that
+# many feeds can be built from them without re-reading the file.
+#
+# Long running processes (backtestd.py) keep the bars of recently used
+# files in memory, keyed on the file's size and mtime.
+_barsCache = {}
+_barsCacheSize = 64
 
-            profits = tradesAnalyzer.getProfits()
-            returns = tradesAnalyzer.getPositiveReturns()
+def LoadBars(dataFile):
 
-            json_obj = {}
-            json_obj['profitable_trades'] = []
+    st = os.stat(dataFile)
+    key = (st.st_size, st.st_mtime_ns)
 
-            json_obj['profitable_trades'].append({
-                'avg_profit':  "{:.2f}".format(profits.mean()),
-                'profits_std_dev': "{:.2f}".format(profits.std()), 
-                'max_profit': "{:.2f}".format(profits.max()),
-                'min_profit': "{:.2f}".format(profits.min()),
-                'avg_return': "{:.2f}".format((returns.mean() * 100)),
-                'returns_std_dev': "{:.2f}".format((returns.std() * 100)),
-                'max_return': "{:.2f}".format((returns.max() * 100)),
-                'min_return': "{:.2f}".format((returns.min() * 100))
-                })
+    cached = _barsCache.pop(dataFile, None)
+    if cached is None or cached[0] != key:
+        cached = (key, _load_bars(dataFile))
 
-            json.dump(json_obj, f)
+    _barsCache[dataFile] = cached
+    while len(_barsCache) > _barsCacheSize:
+        del _barsCache[next(iter(_barsCache))]
 
-    jsonBacktestUnprofitableTrades = "/shark/reports/" + ticker + ".backtest.unprofitabletrades.json"
-    with open(jsonBacktestUnprofitableTrades, 'w', encoding='utf-8') as f:
+    return cached[1]
 
-        if tradesAnalyzer.getUnprofitableCount() > 0:
-            
-            losses = tradesAnalyzer.getLosses()
-            returns = tradesAnalyzer.getNegativeReturns()
-
-            json_obj = {}
-            json_obj['unprofitable_trades'] = []
-
-            json_obj['unprofitable_trades'].append({
-                'avg_loss': "{:.2f}".format(losses.mean()),
-                'losses_std_dev': "{:.2f}".format(losses.std()),
-                'max_loss': "{:.2f}".format(losses.min()),
-                'min_loss': "{:.2f}".format(losses.max()),
-                'avg_return': "{:.2f}".format((returns.mean() * 100)),
-                'returns_std_dev': "{:.2f}".format((returns.std() * 100)),
-                'max_return': "{:.2f}".format((returns.max() * 100)),
-                'min_return': "{:.2f}".format((returns.min() * 100))
-                })
-
-            json.dump(json_obj, f)
-            
-    dataFrameInfo = "/shark/reports/" + ticker + ".backtest.dataFrameInfo.json"
-    with open(dataFrameInfo, 'w', encoding='utf-8') as f:
+def _load_bars(dataFile):
+    return _streaming.BarsFromColumns(LoadColumns(dataFile), BarFrequency(DataFrequency(dataFile)))
+
+##############################################################
+# Build a fresh (unconsumed) feed from previously loaded bars, of their
+# frequency (the yahoo feed only takes daily and weekly bars).
+def BuildFeed(ticker, bars):
+
+    from pyalgotrade import bar
+    from pyalgotrade.barfeed import csvfeed
+    from pyalgotrade.barfeed import yahoofeed
+
+    frequency = bars[0].getFrequency() if bars else bar.Frequency.DAY
+    if frequency in [bar.Frequency.DAY, bar.Frequency.WEEK]:
+        feed = yahoofeed.Feed(frequency)
+    else:
+        feed = csvfeed.GenericBarFeed(frequency)
+    feed.addBarsFromSequence(ticker, bars)
+
+    return feed
+
+##############################################################
+# Plot callbacks. Unlike the lambdas plotter.Subplot.addDataSeries/addLine
+# register, these can be pickled into a checkpoint.
+class _LastValue(object):
+
+    def __init__(self, dataSeries):
+        self.dataSeries = dataSeries
+
+    def __call__(self, bars):
+        try:
+            return self.dataSeries[-1]
+        except IndexError:
+            return None
+
+class _Level(object):
+
+    def __init__(self, level):
+        self.level = level
+
+    def __call__(self, bars):
+        return self.level
+
+def AddDataSeries(subplot, label, dataSeries):
+    subplot.addCallback(label, _LastValue(dataSeries))
+
+def AddLine(subplot, label, level):
+    subplot.addCallback(label, _Level(level))
+
+##############################################################
+# Run an event driven backtest, resuming from its checkpoint when the data
+# file only gained bars since the last run (see _checkpoint.py).
+#
+# build(feed) creates the strategy, attaches the analyzers and plotter and
+# returns (strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer,
+# tradesAnalyzer, plot), which is also what is returned.
+#
+# When bounded is set the bars are streamed from the cache instead (see
+# _streaming.py); such runs hold no bars to resume from and aren't checkpointed.
+def RunResumable(scriptFile, params, ticker, dataFile, build, resume=True, timer=None, bounded=False):
+
+    timer = timer or PhaseTimer()
+
+    if bounded:
+
+        with timer.phase("load"):
+            feed = _streaming.StreamingFeed(ticker, dataFile, BarFrequency(DataFrequency(dataFile)))
+
+        with timer.phase("setup"):
+            objects = build(feed)
+
+        with timer.phase("run"):
+            objects[0].run()
+
+        return objects
+
+    with timer.phase("load"):
+        columns = LoadColumns(dataFile)
+        bars = LoadBars(dataFile)
+        key = _checkpoint.CheckpointKey(scriptFile, params)
+
+        checkpoint = _checkpoint.LoadCheckpoint(scriptFile, ticker, key, columns) if resume and _checkpoint.Resumable() else None
+
+    with timer.phase("setup"):
+        if checkpoint is None:
+            objects = build(BuildFeed(ticker, bars))
+        else:
+            objects, start = checkpoint
+            _checkpoint.ResumeFeed(objects[0], ticker, bars[start:])
+
+    with timer.phase("run"):
+        objects[0].run()
+
+    with timer.phase("checkpoint"):
+        if _checkpoint.Resumable():
+            _checkpoint.DetachBars(objects[0], ticker)
+            _checkpoint.SaveCheckpoint(scriptFile, ticker, key, columns, len(bars), objects)
+
+    return objects
+
+##############################################################
+# pyalgotrade's Sharpe ratio analyzer with daily returns, annualized over the
+# returns per year of the bars (it assumes 252 daily ones). The returns can
+# also be added without a strategy (walk_forward.py's stitched curve).
+class SharpeRatio(stratanalyzer.StrategyAnalyzer):
+
+    def __init__(self, tradingPeriods=252):
+
+        super(SharpeRatio, self).__init__()
+
+        self.__tradingPeriods = tradingPeriods
+        self.__returns = []
+        self.__currentDate = None
+
+    def beforeAttach(self, strat):
+        analyzer = returns.ReturnsAnalyzerBase.getOrCreateShared(strat)
+        analyzer.getEvent().subscribe(self.__onReturns)
+
+    def __onReturns(self, dateTime, returnsAnalyzerBase):
+        self.addReturn(dateTime, returnsAnalyzerBase.getNetReturn())
+
+    # Compound the returns of bars that share a date.
+    def addReturn(self, dateTime, netReturn):
+
+        if dateTime.date() == self.__currentDate:
+            self.__returns[-1] = (1 + self.__returns[-1]) * (1 + netReturn) - 1
+        else:
+            self.__currentDate = dateTime.date()
+            self.__returns.append(netReturn)
+
+    def getReturns(self):
+        return self.__returns
+
+    def getSharpeRatio(self, riskFreeRate, annualized=True):
+        return sharpe.sharpe_ratio(self.__returns, riskFreeRate, self.__tradingPeriods, annualized)
+
+# Attach the analyzers every backtest reports on. A streamed (bounded) run
+# gets a Sharpe ratio analyzer that doesn't keep every daily return.
+def AttachAnalyzers(strat):
+
+    retAnalyzer = returns.Returns()
+    strat.attachAnalyzer(retAnalyzer)
+
+    # Weekly and monthly bars aren't annualized as daily ones (see _resample.py).
+    tradingPeriods = TradingPeriods(strat.getFeed().getFrequency())
+    if isinstance(strat.getFeed(), _streaming.StreamingFeed):
+        sharpeRatioAnalyzer = _streaming.SharpeRatio(tradingPeriods)
+    else:
+        sharpeRatioAnalyzer = SharpeRatio(tradingPeriods)
+    strat.attachAnalyzer(sharpeRatioAnalyzer)
+
+    drawDownAnalyzer = drawdown.DrawDown()
+    strat.attachAnalyzer(drawDownAnalyzer)
+
+    tradesAnalyzer = trades.Trades()
+    strat.attachAnalyzer(tradesAnalyzer)
+
+    return retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer
+
+##############################################################
+# pyalgotrade's StrategyPlotter, downsampled for a streamed (bounded) run.
+def CreatePlotter(strat, plotAllInstruments=True, plotBuySell=True, plotPortfolio=True):
+
+    if isinstance(strat.getFeed(), _streaming.StreamingFeed):
+        from _downsample import DownsampledPlotter
+        return DownsampledPlotter(strat, plotAllInstruments, plotBuySell, plotPortfolio)
+
+    from pyalgotrade import plotter
+
+    return plotter.StrategyPlotter(strat, plotAllInstruments, plotBuySell, plotPortfolio)
+
+##############################################################
+# Generate the JSON report under /shark/reports (see _report.py), and return
+# it. sections adds to the usual ones (e.g. the portfolio's legs).
+
+def GenerateJSONReport(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plot, ticker, capital, dataFile, timer=None, sections=None):
+
+    timer = timer or PhaseTimer()
+
+    with timer.phase("plot"):
+        plotFileName = SavePlot(plot, ticker)
+
+    with timer.phase("report"):
+        report = _ReportSections(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, ticker, capital, dataFile)
+        report.update(sections or {})
+        return WriteReport(ticker, report, plotFileName)
+
+def SavePlot(plot, ticker):
+
+    plotFileName = PlotFile(ticker)
+    if plot is not None:
+
+        import _chart
+        from matplotlib import pyplot
+
+        # Downsampled, and skipped when the series are those of the last plot.
+        _chart.RenderPlot(plot, plotFileName, ticker)
+
+        # Release the figure, worker processes run many backtests.
+        pyplot.close('all')
+
+        return plotFileName
+
+    # Don't leave an earlier run's plot and series next to this report.
+    for path in [plotFileName, SeriesFile(ticker), SeriesBinaryFile(ticker)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    return None
+
+def _ReportSections(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, ticker, capital, dataFile):
+
+    report = {}
+
+    sharpeRatio = sharpeRatioAnalyzer.getSharpeRatio(0.05)
+
+    report['backtest_summary'] = [{
+        'ticker': ticker,
+        'starting_capital': capital,
+        'final_portfolio_value': "{:.2f}".format(strat.getResult()),
+        'cumulative_returns': "{:.2f}".format((retAnalyzer.getCumulativeReturns()[-1] * 100)),
+        'sharpe_ratio': "{:.2f}".format(sharpeRatio),
+        'max_drawdown': "{:.2f}".format((drawDownAnalyzer.getMaxDrawDown() * 100)),
+        'longest_drawdown_duration': str(drawDownAnalyzer.getLongestDrawDownDuration()),
+        'total_trades': str(tradesAnalyzer.getCount()), 
+        'wins': str(tradesAnalyzer.getProfitableCount()),
+        'losses': str(tradesAnalyzer.getUnprofitableCount())
+        }]
+
+    # Sections without trades are left empty.
+    report['total_trades'] = []
+    if tradesAnalyzer.getCount() > 0:
+
+        profits = tradesAnalyzer.getAll()          
+        returns = tradesAnalyzer.getAllReturns()
+
+        report['total_trades'].append({
+            'avg_profit': "{:.2f}".format(profits.mean()),
+            'profits_std_dev': "{:.2f}".format(profits.std()),
+            'max_profit': "{:.2f}".format(profits.max()),
+            'min_profit': "{:.2f}".format(profits.min()),
+            'avg_return': "{:.2f}".format((returns.mean() * 100)),
+            'returns_std_dev': "{:.2f}".format((returns.std() * 100)),
+            'max_return': "{:.2f}".format((returns.max() * 100)),
+            'min_return': "{:.2f}".format((returns.min() * 100))
+            })
+
+    report['profitable_trades'] = []
+    if tradesAnalyzer.getProfitableCount() > 0:
+
+        profits = tradesAnalyzer.getProfits()
+        returns = tradesAnalyzer.getPositiveReturns()
+
+        report['profitable_trades'].append({
+            'avg_profit':  "{:.2f}".format(profits.mean()),
+            'profits_std_dev': "{:.2f}".format(profits.std()), 
+            'max_profit': "{:.2f}".format(profits.max()),
+            'min_profit': "{:.2f}".format(profits.min()),
+            'avg_return': "{:.2f}".format((returns.mean() * 100)),
+            'returns_std_dev': "{:.2f}".format((returns.std() * 100)),
+            'max_return': "{:.2f}".format((returns.max() * 100)),
+            'min_return': "{:.2f}".format((returns.min() * 100))
+            })
+
+    report['unprofitable_trades'] = []
+    if tradesAnalyzer.getUnprofitableCount() > 0:
             
-        df = pd.read_csv(dataFile)
-
-        json_obj = {}
-        json_obj['dataframe_info'] = []
-        
-        json_obj['dataframe_info'].append({
-                'rows': df.shape[0],
-                'frequency': "Daily",
-                'start_date': df['Date'].iloc[0],
-                'end_date': df['Date'].iloc[-1],
+        losses = tradesAnalyzer.getLosses()
+        returns = tradesAnalyzer.getNegativeReturns()
+
+        report['unprofitable_trades'].append({
+            'avg_loss': "{:.2f}".format(losses.mean()),
+            'losses_std_dev': "{:.2f}".format(losses.std()),
+            'max_loss': "{:.2f}".format(losses.min()),
+            'min_loss': "{:.2f}".format(losses.max()),
+            'avg_return': "{:.2f}".format((returns.mean() * 100)),
+            'returns_std_dev': "{:.2f}".format((returns.std() * 100)),
+            'max_return': "{:.2f}".format((returns.max() * 100)),
+            'min_return': "{:.2f}".format((returns.min() * 100))
+            })
+
+    # A portfolio (portfolio.py) describes its aligned timeline itself.
+    years = None
+    if dataFile is not None:
+
+        # Just the first and last dates, bounded runs never hold all of them.
+        rows = CountRows(dataFile)
+        startDate = ReadColumns(dataFile, 0, 1)['date'][0]
+        endDate = ReadColumns(dataFile, rows - 1, rows)['date'][0]
+
+        report['dataframe_info'] = [{
+                'rows': rows,
+                'frequency': FrequencyLabel(DataFrequency(dataFile)),
+                'start_date': str(np.datetime_as_string(startDate, unit='D')),
+                'end_date': str(np.datetime_as_string(endDate, unit='D')),
                 'adjusted_close': "true",
                 'provider': "yahoo_finance"
-                })
-        
-        json.dump(json_obj, f)        
+                }]
+
+        years = (endDate - startDate) / np.timedelta64(365, 'D')
+
+    # Confidence intervals from resampling the trade returns.
+    report['montecarlo'] = MonteCarloReport(tradesAnalyzer.getAllReturns() if tradesAnalyzer.getCount() > 0 else [], capital, years)
+
+    return report
@@ -0,0 +1,278 @@
+#!/usr/bin/python3.9
+
+# Indicators shared between runs and strategies through an on disk cache.
+#
+# pyalgotrade's SMA, RSI and Bollinger Bands are recomputed bar by bar in
+# every run, even when a sweep only changes a threshold. These drop-in
+# versions look the whole series up in /shark/.tmp/indicator.cache instead,
+# keyed by a fingerprint of the data file, the indicator and its
+# period. A missing series is computed once, by running pyalgotrade's own
+# indicator over the prices, so the values are the very same, and stored as a
+# .npy array (NaN where pyalgotrade gives None) for the next run or strategy.
+# The prices are read and the series written a chunk at a time, so computing a
+# series doesn't hold the whole history either (see _streaming.py).
+#
+# pyalgotrade's indicators keep running sums, so a series only holds for a
+# feed that starts at the first bar of the data file. Any other feed (e.g. a
+# walk-forward window, see walk_forward.py) gets the live indicator.
+#
+# The least recently used series are evicted once the cache grows beyond
+# diskBudget bytes.
+
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+from pyalgotrade import dataseries
+from pyalgotrade.technical import bollinger
+from pyalgotrade.technical import ma
+from pyalgotrade.technical import rsi
+
+from _datacache import CountRows
+from _datacache import DataDigest
+from _datacache import ReadColumns
+
+cacheVersion = 1
+
+cacheDir = "/shark/.tmp/indicator.cache"
+
+diskBudget = 256 << 20
+
+# Cached values read at a time.
+chunkValues = 1 << 16
+
+##############################################################
+# pyalgotrade's indicator of a kind ('sma', 'rsi' or 'bbands<numStdDev>') over
+# a data series, as the list of its output series.
+def _build(kind, ds, period, maxLen):
+
+    if kind == 'sma':
+        return [ma.SMA(ds, period, maxLen)]
+    if kind == 'rsi':
+        return [rsi.RSI(ds, period, maxLen)]
+
+    bbands = bollinger.BollingerBands(ds, period, int(kind[len('bbands'):]), maxLen)
+    return [bbands.getUpperBand(), bbands.getMiddleBand(), bbands.getLowerBand()]
+
+##############################################################
+# Fingerprint of a data file's contents, from the digest the memo key already
+# took (see _datacache.py).
+def Fingerprint(dataFile):
+
+    h = hashlib.sha256()
+    h.update(("indicator-%d\n" % cacheVersion).encode('utf-8'))
+    h.update(DataDigest(dataFile).encode('utf-8'))
+
+    return h.hexdigest()
+
+def CacheFile(fingerprint, kind, period):
+    return os.path.join(cacheDir, "%s.%s.%d.npy" % (fingerprint[:32], kind, period))
+
+def _write_atomic(path, write):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'wb') as f:
+            write(f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+# Run pyalgotrade's indicator over the data file's prices into the cache file,
+# a chunk of prices at a time. The data series only keep the last values the
+# indicator needs, and every output series is spilled to its own temporary
+# file before they are joined behind the .npy header.
+def _compute(dataFile, kind, period, path):
+
+    rows = CountRows(dataFile)
+
+    ds = dataseries.SequenceDataSeries(period + 1)
+    outputs = _build(kind, ds, period, period + 1)
+
+    tmpPaths = ["%s.%d.%d.tmp" % (path, i, os.getpid()) for i in range(len(outputs))]
+    try:
+        files = [open(tmpPath, 'wb') for tmpPath in tmpPaths]
+        try:
+            for start in range(0, rows, chunkValues):
+
+                values = [[] for output in outputs]
+                for price in ReadColumns(dataFile, start, start + chunkValues, ['adj_close'])['adj_close'].tolist():
+                    ds.append(price)
+                    for output, column in zip(outputs, values):
+                        column.append(output[-1])
+
+                for f, column in zip(files, values):
+                    f.write(np.array([np.nan if value is None else value for value in column], dtype=np.float64).tobytes())
+        finally:
+            for f in files:
+                f.close()
+
+        def write(f):
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                                                     'fortran_order': False, 'shape': (len(outputs), rows)})
+            for tmpPath in tmpPaths:
+                with open(tmpPath, 'rb') as src:
+                    shutil.copyfileobj(src, f, 1 << 20)
+
+        _write_atomic(path, write)
+
+    finally:
+        for tmpPath in tmpPaths:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+# Remove the least recently used series beyond the disk budget.
+def _evict():
+
+    entries = []
+    for name in os.listdir(cacheDir):
+        path = os.path.join(cacheDir, name)
+        if name.endswith(".npy"):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= diskBudget:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+##############################################################
+# The cached series of an indicator over a data file (computing and storing
+# it on a miss), memory mapped, or None when it can't be cached.
+def LoadSeries(dataFile, kind, period):
+
+    path = CacheFile(Fingerprint(dataFile), kind, period)
+
+    try:
+        table = np.load(path, mmap_mode='r')
+        # The file's mtime is its last use, for the LRU eviction.
+        os.utime(path)
+        return table
+    except (OSError, ValueError):
+        pass
+
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        _compute(dataFile, kind, period, path)
+        table = np.load(path, mmap_mode='r')
+        _evict()
+    except (OSError, ValueError):
+        return None
+
+    return table
+
+##############################################################
+# The output series of an indicator, filled from the cache as the data series
+# gets new values (like pyalgotrade's EventBasedFilter), or by the live
+# indicator when the feed doesn't start at the data file's first bar or the
+# series can't be cached.
+class CachedIndicator(object):
+
+    def __init__(self, dataSeries, kind, period, dataFile, maxLen=None):
+
+        self.__kind = kind
+        self.__period = period
+        self.__dataFile = dataFile
+        self.__maxLen = maxLen
+        self.__outputs = [dataseries.SequenceDataSeries(maxLen) for i in range(3 if kind.startswith('bbands') else 1)]
+        self.__pos = 0
+        self.__live = None
+        self.__table = None
+        self.__chunk = None
+        self.__chunkStart = 0
+
+        dataSeries.getNewValueEvent().subscribe(self.__onNewValue)
+
+    def __cached(self, dateTime, value):
+
+        if not self.__dataFile or not os.path.exists(self.__dataFile):
+            return False
+
+        first = ReadColumns(self.__dataFile, 0, 1)
+        if not (len(first['date']) > 0 and first['date'][0] == np.datetime64(dateTime) and first['adj_close'][0] == value):
+            return False
+
+        # Kept mapped for the whole run, another process may evict the file.
+        self.__table = LoadSeries(self.__dataFile, self.__kind, self.__period)
+        return self.__table is not None
+
+    def __startLive(self):
+
+        self.__liveSeries = dataseries.SequenceDataSeries(self.__maxLen)
+        self.__live = _build(self.__kind, self.__liveSeries, self.__period, self.__maxLen)
+
+    def __values(self, pos):
+
+        if self.__chunk is None or not self.__chunkStart <= pos < self.__chunkStart + len(self.__chunk):
+
+            if self.__table is None:
+                self.__table = LoadSeries(self.__dataFile, self.__kind, self.__period)
+                if self.__table is None:
+                    raise Exception("Unable to read the cached %s(%d) series of %s" % (self.__kind, self.__period, self.__dataFile))
+
+            # Read by chunks, a bounded run (see _streaming.py) never holds the whole series.
+            self.__chunkStart = pos
+            self.__chunk = list(zip(*[[None if v != v else v for v in output[pos:pos + chunkValues].tolist()] for output in self.__table]))
+
+        return self.__chunk[pos - self.__chunkStart]
+
+    def __onNewValue(self, dataSeries, dateTime, value):
+
+        if self.__pos == 0 and self.__live is None and not self.__cached(dateTime, value):
+            self.__startLive()
+
+        if self.__live is not None:
+            self.__liveSeries.appendWithDateTime(dateTime, value)
+            values = [output[-1] for output in self.__live]
+        else:
+            values = self.__values(self.__pos)
+
+        self.__pos += 1
+
+        for output, value in zip(self.__outputs, values):
+            output.appendWithDateTime(dateTime, value)
+
+    # Checkpoints (see _checkpoint.py) leave the cached values out, a restored
+    # indicator maps them again for the data file it resumes on.
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state['_CachedIndicator__table'] = None
+        state['_CachedIndicator__chunk'] = None
+        return state
+
+    def getOutputs(self):
+        return self.__outputs
+
+##############################################################
+# Drop-in replacements of pyalgotrade's indicators.
+def SMA(dataSeries, period, dataFile, maxLen=None):
+    return CachedIndicator(dataSeries, 'sma', period, dataFile, maxLen).getOutputs()[0]
+
+def RSI(dataSeries, period, dataFile, maxLen=None):
+    return CachedIndicator(dataSeries, 'rsi', period, dataFile, maxLen).getOutputs()[0]
+
+class BollingerBands(CachedIndicator):
+
+    def __init__(self, dataSeries, period, numStdDev, dataFile, maxLen=None):
+        super(BollingerBands, self).__init__(dataSeries, 'bbands%d' % numStdDev, period, dataFile, maxLen)
+
+    def getUpperBand(self):
+        return self.getOutputs()[0]
+
+    def getMiddleBand(self):
+        return self.getOutputs()[1]
+
+    def getLowerBand(self):
+        return self.getOutputs()[2]
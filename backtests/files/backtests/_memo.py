@@ -0,0 +1,250 @@
+#!/usr/bin/python3.9
+
+# Content-addressed memoization of backtest results.
+#
+# A backtest's outcome only depends on the strategy code, its arguments and
+# the historical data, so results are stored under a hash of those three.
+# Each entry is a directory holding the Nagios output and exit code of the run
+# and a copy of the /shark/reports/<ticker>.* files it produced. On a hit the
+# report files are put back in place and the stored output is replayed,
+# without running the strategy or plotting. The timings and peak memory in
+# the output's perfdata are those of the run itself, so they aren't stored:
+# a replay reports its own, with memo_hit=1. The run's record in the history
+# (see _store.py) is stored with it too, and recorded again on a hit.
+#
+# Like _results.py this module stays free of pyalgotrade/pandas imports.
+
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import _report
+import _store
+
+from _datacache import DataDigest
+
+from _profile import PhaseTimer
+from _profile import CostPerfdata
+
+memoVersion = 1
+
+memoDir = "/shark/.tmp/backtest.memo"
+
+# Least recently used entries beyond this count, or unused for longer than
+# maxAge seconds, are evicted whenever a new entry is stored.
+maxEntries = 256
+maxAge = 30 * 24 * 3600
+
+entryFile = "entry.json"
+
+# The cost part of a run's perfdata (see _profile.py).
+costPerfdata = re.compile(r" (?:\w+_time=[0-9.]+s|peak_rss=\d+KB)")
+
+##############################################################
+# The report files a backtest writes for a ticker (the report document, its
+# plot and its series, and the legacy per section files, see _report.py).
+def ReportFiles(ticker):
+
+    return [_report.PlotFile(ticker), _report.SeriesFile(ticker), _report.SeriesBinaryFile(ticker), _report.ReportFile(ticker)] + [
+        _report.LegacyFile(ticker, suffix) for key, suffix in _report.legacySections]
+
+def _hash_file(h, path):
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+# Hash the script and the helper modules next to it.
+def HashSources(h, scriptFile):
+
+    scriptDir = os.path.dirname(os.path.abspath(scriptFile))
+    for path in [os.path.abspath(scriptFile)] + sorted(glob.glob(os.path.join(scriptDir, "_*.py"))):
+        h.update(os.path.basename(path).encode('utf-8'))
+        _hash_file(h, path)
+
+##############################################################
+# Key of a backtest run: the script and the helper modules next to it, the
+# parsed arguments and the contents of the data file. Returns None when the
+# data file can't be read (the run itself will report the problem).
+def MemoKey(scriptFile, args, dataFile):
+
+    h = hashlib.sha256()
+    h.update(("memo-%d\n" % memoVersion).encode('utf-8'))
+
+    HashSources(h, scriptFile)
+    h.update(json.dumps(args, sort_keys=True).encode('utf-8'))
+
+    try:
+        h.update(DataDigest(dataFile).encode('utf-8'))
+    except OSError:
+        return None
+
+    return h.hexdigest()
+
+def EntryDir(key):
+    return os.path.join(memoDir, key)
+
+def _copy_atomic(src, dst):
+
+    tmpPath = "%s.%d.tmp" % (dst, os.getpid())
+    try:
+        shutil.copyfile(src, tmpPath)
+        os.replace(tmpPath, dst)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+##############################################################
+# Restore a memoized run: put its report files back in place and return the
+# entry (with 'output' and 'exit_code'), or None on a miss.
+def RestoreMemo(key, ticker):
+
+    if key is None:
+        return None
+
+    entryPath = os.path.join(EntryDir(key), entryFile)
+    try:
+        with open(entryPath, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        for name in entry['files']:
+            _copy_atomic(os.path.join(EntryDir(key), name), os.path.join(_report.reportsDir, name))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    _report.UpdateIndex(ticker)
+
+    # The entry's mtime is its last use, for the LRU eviction.
+    try:
+        os.utime(entryPath)
+    except OSError:
+        pass
+
+    return entry
+
+##############################################################
+# Store a finished run (and its record, if it made one) under its key, then
+# evict old entries.
+def StoreMemo(key, ticker, scriptFile, args, dataFile, exitCode, output, record=None):
+
+    if key is None:
+        return
+
+    entry = {
+        'ticker': ticker,
+        'file': os.path.basename(scriptFile),
+        'args': args,
+        'data_file': dataFile,
+        'exit_code': exitCode,
+        'output': costPerfdata.sub("", output),
+        'record': record,
+        'created': time.time(),
+        'files': [],
+    }
+
+    tmpDir = "%s.%d.tmp" % (EntryDir(key), os.getpid())
+    try:
+        os.makedirs(tmpDir)
+        for path in ReportFiles(ticker):
+            if os.path.exists(path):
+                shutil.copyfile(path, os.path.join(tmpDir, os.path.basename(path)))
+                entry['files'].append(os.path.basename(path))
+        with open(os.path.join(tmpDir, entryFile), 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+
+        # Another process may have stored the same run meanwhile, keep theirs.
+        if not os.path.exists(EntryDir(key)):
+            os.rename(tmpDir, EntryDir(key))
+    except OSError:
+        # The memo is only an optimization.
+        pass
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+    EvictMemo()
+
+##############################################################
+# List the stored entries, most recently used first.
+def ListMemo():
+
+    entries = []
+    for path in glob.glob(os.path.join(memoDir, "*", entryFile)):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            entry['key'] = os.path.basename(os.path.dirname(path))
+            entry['last_used'] = os.path.getmtime(path)
+        except (OSError, ValueError):
+            continue
+        entries.append(entry)
+
+    return sorted(entries, key=lambda entry: entry['last_used'], reverse=True)
+
+def PurgeMemo(key):
+    shutil.rmtree(EntryDir(key), ignore_errors=True)
+
+def EvictMemo(maxEntries=maxEntries, maxAge=maxAge):
+
+    evicted = 0
+    now = time.time()
+    for i, entry in enumerate(ListMemo()):
+        if i >= maxEntries or now - entry['last_used'] > maxAge:
+            PurgeMemo(entry['key'])
+            evicted += 1
+
+    return evicted
+
+##############################################################
+# Run a backtest through the memo. run() prints the Nagios output and returns
+# the exit code, exactly as without memoization.
+class _Tee(io.StringIO):
+
+    def __init__(self, stream):
+        io.StringIO.__init__(self)
+        self.stream = stream
+
+    def write(self, s):
+        self.stream.write(s)
+        return io.StringIO.write(self, s)
+
+# The stored output of a run, with the cost of the replay in place of the
+# run's on its perfdata line.
+def _replay_output(output, timer):
+
+    lines = costPerfdata.sub("", output).split("\n")
+    for i in reversed(range(len(lines))):
+        if " | " in lines[i]:
+            lines[i] += " memo_hit=1 " + CostPerfdata(timer)
+            break
+
+    return "\n".join(lines)
+
+def RunMemoized(scriptFile, args, ticker, dataFile, run):
+
+    timer = PhaseTimer()
+
+    with timer.phase("memo"):
+        key = MemoKey(scriptFile, args, dataFile)
+        entry = RestoreMemo(key, ticker)
+
+    if entry is not None:
+        print(_replay_output(entry['output'], timer))
+        if entry.get('record'):
+            _store.RecordRun(_store.ReplayRecord(entry['record'], timer))
+        return entry['exit_code']
+
+    _store.lastRecord = None
+
+    output = _Tee(sys.stdout)
+    with contextlib.redirect_stdout(output):
+        exitCode = run()
+
+    StoreMemo(key, ticker, scriptFile, args, dataFile, exitCode, output.getvalue().strip(), _store.lastRecord)
+
+    return exitCode
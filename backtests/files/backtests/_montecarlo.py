@@ -0,0 +1,115 @@
+#!/usr/bin/python3.9
+
+# Monte Carlo robustness of a backtest's trade sequence.
+#
+# The backtest gives one ordering of its trades. Resampling the trade returns
+# (with replacement, or reshuffling them) many times over gives a spread of
+# the final value, max drawdown and Sharpe ratio the strategy could as well
+# have ended up with, reported as confidence intervals in the 'montecarlo'
+# section of the report (see _report.py).
+#
+# Each simulated sequence (method "bootstrap" or "shuffle") compounds the
+# trade returns on the whole equity, starting from the backtest's capital. The
+# simulations run as NumPy arrays, batchRows sequences at a time, so the check
+# stays cheap enough to run with every backtest.
+
+import numpy as np
+
+# Simulated sequences per report.
+simulations = 20000
+
+# Fixed, so a backtest's report doesn't change from one run to the next.
+seed = 0
+
+# Two sided confidence of the reported intervals.
+confidence = 0.9
+
+# Bound the arrays of a batch (sequences x trades) to about 16MB.
+batchElements = 1 << 21
+
+##############################################################
+# The final value, max drawdown and per trade Sharpe ratio (mean over the
+# standard deviation of the trade returns, annualized with tradesPerYear when
+# given) of each simulated sequence.
+def Simulate(returns, capital, method="bootstrap", count=simulations, tradesPerYear=None, riskFreeRate=0.05):
+
+    returns = np.asarray(returns, dtype=np.float64)
+    trades = len(returns)
+
+    rng = np.random.default_rng(seed)
+
+    finalValues = np.empty(count)
+    maxDrawDowns = np.empty(count)
+    sharpeRatios = np.empty(count)
+
+    batchRows = max(1, batchElements // max(1, trades))
+    for start in range(0, count, batchRows):
+
+        rows = min(batchRows, count - start)
+
+        if method == "shuffle":
+            sample = rng.permuted(np.broadcast_to(returns, (rows, trades)), axis=1)
+        else:
+            sample = returns[rng.integers(0, trades, (rows, trades))]
+
+        equity = capital * np.cumprod(1 + sample, axis=1)
+        highs = np.maximum(np.maximum.accumulate(equity, axis=1), capital)
+
+        finalValues[start:start + rows] = equity[:, -1]
+        maxDrawDowns[start:start + rows] = np.max(1 - equity / highs, axis=1)
+
+        mean = sample.mean(axis=1)
+        std = sample.std(axis=1, ddof=1) if trades > 1 else np.zeros(rows)
+
+        # 0 without volatility, like pyalgotrade's sharpe_ratio().
+        sharpe = np.zeros(rows)
+        if tradesPerYear:
+            excess = mean - riskFreeRate / tradesPerYear
+            np.divide(excess * np.sqrt(tradesPerYear), std, out=sharpe, where=std > 0)
+        else:
+            np.divide(mean, std, out=sharpe, where=std > 0)
+        sharpeRatios[start:start + rows] = sharpe
+
+    return finalValues, maxDrawDowns, sharpeRatios
+
+def _interval(values, scale=1.0):
+
+    low, median, high = np.percentile(values, [50 * (1 - confidence), 50, 50 * (1 + confidence)])
+
+    return ["{:.2f}".format(value * scale) for value in (low, median, high)]
+
+##############################################################
+# The Monte Carlo section of the report (see _report.py) for a backtest's
+# trade returns. years is the span of the backtest, to annualize the Sharpe
+# ratio (None leaves it per trade). Fewer than two trades leave the section
+# empty, like the trade sections.
+def MonteCarloReport(returns, capital, years=None, method="bootstrap", count=simulations):
+
+    if len(returns) < 2:
+        return []
+
+    tradesPerYear = len(returns) / years if years else None
+
+    finalValues, maxDrawDowns, sharpeRatios = Simulate(returns, capital, method, count, tradesPerYear)
+
+    finalValue = _interval(finalValues)
+    maxDrawDown = _interval(maxDrawDowns, 100)
+    sharpeRatio = _interval(sharpeRatios)
+
+    return [{
+        'method': method,
+        'simulations': str(count),
+        'trades': str(len(returns)),
+        'confidence': "{:.0f}".format(confidence * 100),
+        'final_value_low': finalValue[0],
+        'final_value_median': finalValue[1],
+        'final_value_high': finalValue[2],
+        'max_drawdown_low': maxDrawDown[0],
+        'max_drawdown_median': maxDrawDown[1],
+        'max_drawdown_high': maxDrawDown[2],
+        'sharpe_ratio_low': sharpeRatio[0],
+        'sharpe_ratio_median': sharpeRatio[1],
+        'sharpe_ratio_high': sharpeRatio[2],
+        'sharpe_ratio_annualized': "true" if tradesPerYear else "false",
+        'probability_of_loss': "{:.2f}".format(np.mean(finalValues < capital) * 100)
+        }]
@@ -0,0 +1,248 @@
+#!/usr/bin/python3.9
+
+# Several backtest strategies trading one portfolio (see portfolio.py).
+#
+# Every instrument's bars go into one feed, and one PortfolioBroker (a
+# pyalgotrade backtesting broker) holds the portfolio's cash and shares. The
+# strategies (legs) are the regular RSI2, BBands and Moving Averages classes,
+# each constructed with the shared feed and a LegBroker in place of their own
+# broker:
+#   - a LegBroker passes orders on to the shared broker and hands its leg only
+#     the events of the leg's own orders,
+#   - it keeps the leg's own cash (its allocation, then moved by the leg's
+#     fills) and shares, which is what the leg sizes its orders with,
+#   - the PortfolioBroker doesn't fill a leg's order beyond the leg's cash,
+#     just as a broker of its own wouldn't.
+# A Portfolio strategy owns the shared broker and runs the single event loop;
+# every leg is subscribed to the same feed, so each pass over the aligned
+# timeline drives all of them. The analyzers and plotter are attached to it
+# and so report on the whole portfolio.
+
+from pyalgotrade import broker
+from pyalgotrade import strategy
+from pyalgotrade.broker import backtesting
+
+# How the portfolio's capital is split between the legs:
+#   capital - in proportion to the capital configured for each instrument,
+#   equal   - evenly,
+#   shared  - not at all, every leg sizes its orders from the portfolio's cash.
+allocationPolicies = ["capital", "equal", "shared"]
+
+def Allocate(policy, capital, weights):
+
+    if policy == "equal":
+        return [capital / float(len(weights))] * len(weights)
+    if policy == "capital":
+        return [capital * weight / float(sum(weights)) for weight in weights]
+
+    return [None] * len(weights)
+
+##############################################################
+# The shared broker.
+class PortfolioBroker(backtesting.Broker):
+
+    def __init__(self, cash, barFeed, commission=None):
+
+        super(PortfolioBroker, self).__init__(cash, barFeed, commission)
+
+        self.__orderLegs = {}
+
+    def setOrderLeg(self, order, legBroker):
+        self.__orderLegs[order.getId()] = legBroker
+
+    def commitOrderExecution(self, order, dateTime, fillInfo):
+
+        legBroker = self.__orderLegs.get(order.getId())
+        if legBroker is not None and not legBroker.canAfford(order, fillInfo):
+            self.getLogger().debug("Not enough cash in the %s leg to fill %s order [%s] for %s share/s" % (
+                order.getInstrument(), order.getType(), order.getId(), order.getRemaining()))
+            return
+
+        super(PortfolioBroker, self).commitOrderExecution(order, dateTime, fillInfo)
+
+        if not order.isActive():
+            self.__orderLegs.pop(order.getId(), None)
+
+##############################################################
+# The broker a leg sees.
+class LegBroker(broker.Broker):
+
+    def __init__(self, sharedBroker, feed, instrument, cash):
+
+        super(LegBroker, self).__init__()
+
+        self.__broker = sharedBroker
+        self.__feed = feed
+        self.__instrument = instrument
+        self.__cash = cash
+        self.__shares = {}
+        self.__orderIds = set()
+        self.__filledOrders = 0
+
+        sharedBroker.getOrderUpdatedEvent().subscribe(self.__onOrderEvent)
+
+    def __onOrderEvent(self, broker_, orderEvent):
+
+        order = orderEvent.getOrder()
+        if order.getId() not in self.__orderIds:
+            return
+
+        if orderEvent.getEventType() in (broker.OrderEvent.Type.PARTIALLY_FILLED, broker.OrderEvent.Type.FILLED):
+
+            execInfo = orderEvent.getEventInfo()
+            quantity = execInfo.getQuantity()
+            if order.isSell():
+                quantity = -quantity
+
+            if self.__cash is not None:
+                self.__cash -= quantity * execInfo.getPrice() + execInfo.getCommission()
+
+            instrument = order.getInstrument()
+            self.__shares[instrument] = order.getInstrumentTraits().roundQuantity(self.__shares.get(instrument, 0) + quantity)
+            if self.__shares[instrument] == 0:
+                del self.__shares[instrument]
+
+            if orderEvent.getEventType() == broker.OrderEvent.Type.FILLED:
+                self.__filledOrders += 1
+
+        if not order.isActive():
+            self.__orderIds.discard(order.getId())
+
+        self.notifyOrderEvent(orderEvent)
+
+    def getFilledOrders(self):
+        return self.__filledOrders
+
+    # Whether the leg's cash covers a fill, as backtesting.Broker checks its own.
+    def canAfford(self, order, fillInfo):
+
+        if self.__cash is None:
+            return True
+
+        price = fillInfo.getPrice()
+        quantity = fillInfo.getQuantity()
+        cost = price * quantity if order.isSell() else -price * quantity
+        cost -= self.__broker.getCommission().calculate(order, price, quantity)
+
+        return self.__cash + cost >= 0
+
+    def getLogger(self):
+        return self.__broker.getLogger()
+
+    def getInstrumentTraits(self, instrument):
+        return self.__broker.getInstrumentTraits(instrument)
+
+    def getCash(self, includeShort=True):
+
+        if self.__cash is None:
+            return self.__broker.getCash(includeShort)
+
+        ret = self.__cash
+        bars = self.__feed.getCurrentBars()
+        if not includeShort and bars is not None:
+            for instrument, shares in self.__shares.items():
+                if shares < 0 and instrument in bars.getInstruments():
+                    ret += bars[instrument].getPrice() * shares
+
+        # Never more than the portfolio actually holds.
+        return min(ret, self.__broker.getCash(includeShort))
+
+    def getShares(self, instrument):
+        return self.__shares.get(instrument, 0)
+
+    def getPositions(self):
+        return self.__shares
+
+    # The leg's value: its cash and its shares at the last price seen.
+    def getEquity(self):
+
+        ret = self.__cash if self.__cash is not None else 0.0
+        for instrument, shares in self.__shares.items():
+            ret += self.__feed.getLastBar(instrument).getPrice() * shares
+
+        return ret
+
+    def getActiveOrders(self, instrument=None):
+        return [order for order in self.__broker.getActiveOrders(instrument) if order.getId() in self.__orderIds]
+
+    def submitOrder(self, order):
+        self.__broker.submitOrder(order)
+        self.__broker.setOrderLeg(order, self)
+        self.__orderIds.add(order.getId())
+
+    def createMarketOrder(self, action, instrument, quantity, onClose=False):
+        return self.__broker.createMarketOrder(action, instrument, quantity, onClose)
+
+    def createLimitOrder(self, action, instrument, limitPrice, quantity):
+        return self.__broker.createLimitOrder(action, instrument, limitPrice, quantity)
+
+    def createStopOrder(self, action, instrument, stopPrice, quantity):
+        return self.__broker.createStopOrder(action, instrument, stopPrice, quantity)
+
+    def createStopLimitOrder(self, action, instrument, stopPrice, limitPrice, quantity):
+        return self.__broker.createStopLimitOrder(action, instrument, stopPrice, limitPrice, quantity)
+
+    def cancelOrder(self, order):
+        self.__broker.cancelOrder(order)
+
+    # The shared broker is dispatched by the Portfolio strategy's event loop.
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def join(self):
+        pass
+
+    def eof(self):
+        return self.__broker.eof()
+
+    def dispatch(self):
+        return False
+
+    def peekDateTime(self):
+        return None
+
+##############################################################
+# A leg of strategyClass. Instruments trade on different calendars, so a leg
+# sits out the bars that don't include its instrument.
+def LegClass(strategyClass):
+
+    class Leg(strategyClass):
+
+        def onBars(self, bars):
+            if self.legInstrument in bars.getInstruments():
+                strategyClass.onBars(self, bars)
+
+    Leg.__name__ = strategyClass.__name__ + "Leg"
+
+    return Leg
+
+##############################################################
+# The strategy that runs the portfolio's event loop.
+class Portfolio(strategy.BacktestingStrategy):
+
+    def __init__(self, feed, sharedBroker):
+
+        super(Portfolio, self).__init__(feed, sharedBroker)
+
+        self.__legs = []
+        self.setDebugMode(False)
+
+    # Add a leg built by build(legBroker), trading instrument with the given
+    # cash (None to share the portfolio's).
+    def addLeg(self, instrument, cash, build):
+
+        legBroker = LegBroker(self.getBroker(), self.getFeed(), instrument, cash)
+        leg = build(legBroker)
+        leg.legInstrument = instrument
+        self.__legs.append(leg)
+
+        return leg
+
+    def getLegs(self):
+        return self.__legs
+
+    def onBars(self, bars):
+        pass
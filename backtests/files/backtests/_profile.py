@@ -0,0 +1,100 @@
+#!/usr/bin/python3.9
+
+# Phase timing and memory figures of a backtest run.
+#
+# run_strategy times its phases (load, setup, run, checkpoint, plot, report)
+# with a PhaseTimer, appends them with the results as Nagios perfdata to its
+# output line and writes them to /shark/.tmp/backtest.profile.<ticker>.json.
+# With --cprofile the whole run is profiled and the stats are dumped next to it.
+
+import contextlib
+import os
+import resource
+import time
+
+from _results import WriteJSONAtomic
+
+profileDir = "/shark/.tmp"
+
+phaseNames = ["memo", "load", "setup", "run", "checkpoint", "plot", "report"]
+
+def ProfileFile(ticker):
+    return os.path.join(profileDir, "backtest.profile." + ticker + ".json")
+
+def CProfileFile(ticker):
+    return os.path.join(profileDir, "backtest.profile." + ticker + ".pstats")
+
+##############################################################
+# Accumulates wall time per named phase.
+class PhaseTimer(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+# Peak resident set size of this process in KB (for a daemon or batch worker,
+# over its lifetime so far).
+def PeakRSS():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+##############################################################
+# Nagios perfdata for a finished backtest: results first, then the cost.
+def Perfdata(timer, sharpeRatio, maxDrawDown, totalTrades):
+
+    perfdata = [
+        "sharpe_ratio=%.4f" % sharpeRatio,
+        "max_drawdown=%.2f%%" % (maxDrawDown * 100),
+        "total_trades=%d" % totalTrades,
+    ]
+
+    return " ".join(perfdata) + " " + CostPerfdata(timer)
+
+# Just the cost: the phase timings and the peak memory of this process.
+def CostPerfdata(timer):
+
+    perfdata = []
+    for name in phaseNames:
+        if name in timer.phases:
+            perfdata.append("%s_time=%.4fs" % (name, timer.phases[name]))
+    perfdata.append("total_time=%.4fs" % timer.total())
+    perfdata.append("peak_rss=%dKB" % PeakRSS())
+
+    return " ".join(perfdata)
+
+def WriteProfile(ticker, scriptFile, engine, timer, sharpeRatio, maxDrawDown, totalTrades):
+
+    WriteJSONAtomic(ProfileFile(ticker), {
+        'ticker': ticker,
+        'file': os.path.basename(scriptFile),
+        'engine': engine,
+        'finished': time.time(),
+        'phases': {name: round(seconds, 6) for name, seconds in timer.phases.items()},
+        'total_time': round(timer.total(), 6),
+        'peak_rss_kb': PeakRSS(),
+        'sharpe_ratio': sharpeRatio,
+        'max_drawdown': maxDrawDown,
+        'total_trades': totalTrades,
+    })
+
+##############################################################
+# Run fn() under cProfile, dumping the stats for the ticker.
+def RunCProfiled(ticker, fn):
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn)
+    finally:
+        profiler.dump_stats(CProfileFile(ticker))
@@ -0,0 +1,168 @@
+#!/usr/bin/python3.9
+
+# The backtest report of a ticker as one document.
+#
+# A run's report is written once, to /shark/reports/<ticker>.backtest.json,
+# through a temporary file renamed into place, so the web page never reads it
+# half written. It holds every section under its usual key (backtest_summary,
+# total_trades, ...), an empty list for a section without data (e.g. no
+# losing trades), and the report's version and time.
+#
+# /shark/reports/backtest.index.json lists the tickers with a report, their
+# document, plot and plot series, so the BacktestReport page fetches one file
+# per ticker.
+#
+# The old per section files (<ticker>.backtest.summary.json, ...) are still
+# written from the document while legacyFiles is set, each only when its
+# contents changed. An empty section is an empty file, as before.
+#
+# Like _memo.py this module stays free of pyalgotrade/pandas imports.
+
+import datetime
+import fcntl
+import json
+import os
+
+reportVersion = 1
+
+reportsDir = "/shark/reports"
+
+indexFileName = "backtest.index.json"
+
+indexLockFile = "/shark/.tmp/backtest.index.lock"
+
+# Keep writing the per section files for the readers of the old layout.
+legacyFiles = True
+
+# The document's sections and the per section files they used to be.
+legacySections = [
+    ('backtest_summary', "summary"),
+    ('total_trades', "totaltrades"),
+    ('profitable_trades', "profitabletrades"),
+    ('unprofitable_trades', "unprofitabletrades"),
+    ('dataframe_info', "dataFrameInfo"),
+    ('montecarlo', "montecarlo"),
+    ('portfolio_instruments', "instruments"),
+]
+
+def ReportFile(ticker):
+    return os.path.join(reportsDir, ticker + ".backtest.json")
+
+def PlotFile(ticker):
+    return os.path.join(reportsDir, ticker + ".png")
+
+def LegacyFile(ticker, suffix):
+    return os.path.join(reportsDir, ticker + ".backtest." + suffix + ".json")
+
+# The plot's series, for the web page to draw (see _chart.py).
+def SeriesFile(ticker):
+    return os.path.join(reportsDir, ticker + ".series.json")
+
+def SeriesBinaryFile(ticker):
+    return os.path.join(reportsDir, ticker + ".series.bin")
+
+def IndexFile():
+    return os.path.join(reportsDir, indexFileName)
+
+# The default output of the sweep, optimize and walk-forward tools, e.g.
+# <ticker>.rsi2.sweep.csv.
+def ResultsFile(ticker, suffix):
+    return os.path.join(reportsDir, ticker + "." + suffix + ".csv")
+
+def _write_atomic(path, data):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+def _write_if_changed(path, data):
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == data:
+                return
+    except OSError:
+        pass
+
+    _write_atomic(path, data)
+
+##############################################################
+# Write a ticker's report document from its sections ({key: [entries]}, an
+# empty list for a section without data), and its legacy files and index
+# entry. plot is the plot file written with it, if any, its series are
+# exported next to it.
+def WriteReport(ticker, sections, plot=None):
+
+    report = {
+        'version': reportVersion,
+        'ticker': ticker,
+        'generated': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'plot': os.path.basename(plot) if plot else None,
+        'series': os.path.basename(SeriesFile(ticker)) if plot else None,
+    }
+    report.update(sections)
+
+    _write_atomic(ReportFile(ticker), json.dumps(report))
+
+    if legacyFiles:
+        WriteLegacyFiles(ticker, report)
+
+    UpdateIndex(ticker, report)
+
+    return report
+
+def ReadReport(ticker):
+
+    with open(ReportFile(ticker), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def WriteLegacyFiles(ticker, report):
+
+    for key, suffix in legacySections:
+        if key in report:
+            _write_if_changed(LegacyFile(ticker, suffix), json.dumps({key: report[key]}) if report[key] else "")
+
+##############################################################
+# Point the index entry of a ticker at its report document (read back from
+# disk when not given, e.g. after a memo restore). The index is shared by
+# parallel runs, its update is serialized by a lock file.
+def UpdateIndex(ticker, report=None):
+
+    if report is None:
+        try:
+            report = ReadReport(ticker)
+        except (OSError, ValueError):
+            return
+
+    entry = {
+        'report': os.path.basename(ReportFile(ticker)),
+        'plot': report.get('plot'),
+        'series': report.get('series'),
+        'version': report.get('version'),
+        'generated': report.get('generated'),
+    }
+
+    os.makedirs(os.path.dirname(indexLockFile), exist_ok=True)
+    with open(indexLockFile, 'a') as lock:
+
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(IndexFile(), 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+
+            if index.get('version') != reportVersion:
+                index = {'version': reportVersion, 'reports': {}}
+
+            if index['reports'].get(ticker) != entry:
+                index['reports'][ticker] = entry
+                _write_atomic(IndexFile(), json.dumps(index, sort_keys=True))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
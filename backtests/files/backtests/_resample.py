@@ -0,0 +1,223 @@
+#!/usr/bin/python3.9
+
+# Bars of another frequency (weekly, monthly, daily or N minutes) aggregated
+# from a historical CSV.
+#
+# The bars are built once into a CSV next to the source, <ticker>.<frequency>.csv
+# (e.g. BTC-USD.weekly.csv), which the backtests then read like any other data
+# file, through the binary, indicator, memo and checkpoint caches. A small JSON
+# file records the size and mtime of the source the bars were built from; when
+# either changes the bars are rebuilt on the next run, and the CSV is only
+# rewritten when they changed, so the caches keyed on it stay valid.
+#
+# Each bar holds the first open, highest high, lowest low, last close and
+# total volume of the source bars it covers, and is dated on the last of them,
+# so a strategy never sees a bar before every source bar in it has happened.
+# Weeks start on Monday.
+#
+# Like _datacache.py this module stays free of pyalgotrade/pandas imports.
+
+import json
+import os
+import re
+
+import numpy as np
+
+from _datacache import LoadColumns
+from _datacache import ReadColumns
+
+resampleVersion = 1
+
+frequencies = ["daily", "weekly", "monthly", "<N>min"]
+
+# Source bars looked at to tell the frequency of a data file.
+sampleRows = 64
+
+def StampFile(dataFile):
+    return dataFile + ".resample.json"
+
+def ResampledFile(dataFile, frequency):
+    return os.path.splitext(dataFile)[0] + "." + frequency + ".csv"
+
+##############################################################
+# The length of a frequency's bars in seconds (a month counting as 31 days, as
+# for pyalgotrade), or ValueError when it isn't one of frequencies.
+def _seconds(frequency):
+
+    if frequency == "daily":
+        return 86400
+    if frequency == "weekly":
+        return 7 * 86400
+    if frequency == "monthly":
+        return 31 * 86400
+
+    match = re.match(r"^(\d+)min$", frequency or "")
+    if match and int(match.group(1)) > 0:
+        return int(match.group(1)) * 60
+
+    raise ValueError("Unsupported frequency " + str(frequency) + " (" + ", ".join(frequencies) + ")")
+
+# The frequency of a data file: the one it was resampled to, or else the
+# typical spacing of its first bars.
+def DataFrequency(dataFile):
+
+    try:
+        with open(StampFile(dataFile), 'r') as f:
+            return json.load(f)['frequency']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    return DatesFrequency(ReadColumns(dataFile, 0, sampleRows, ['date'])['date'])
+
+def DatesFrequency(dates):
+
+    dates = dates[:sampleRows].astype('datetime64[s]').astype(np.int64)
+    if len(dates) < 2:
+        return "daily"
+
+    spacing = np.median(np.diff(dates))
+    if spacing < 43200:
+        return "%dmin" % max(1, int(round(spacing / 60)))
+    if spacing < 4 * 86400:
+        return "daily"
+    if spacing < 20 * 86400:
+        return "weekly"
+    return "monthly"
+
+# As the report shows it.
+def FrequencyLabel(frequency):
+
+    if frequency in ["daily", "weekly", "monthly"]:
+        return frequency.capitalize()
+
+    return "%d Minute" % (_seconds(frequency) // 60)
+
+# The returns per year a Sharpe ratio of bars of a frequency, or of a
+# pyalgotrade bar frequency (their length in seconds), is annualized over.
+# Intraday returns are compounded per day, as pyalgotrade's analyzer does, so
+# they count as daily.
+def TradingPeriods(frequency):
+
+    seconds = frequency if isinstance(frequency, int) else _seconds(frequency)
+    if seconds >= _seconds("monthly"):
+        return 12
+    if seconds >= _seconds("weekly"):
+        return 52
+
+    return 252
+
+# The pyalgotrade bar frequency of a frequency.
+def BarFrequency(frequency):
+
+    from pyalgotrade import bar
+
+    return {"daily": bar.Frequency.DAY, "weekly": bar.Frequency.WEEK, "monthly": bar.Frequency.MONTH}.get(frequency) or _seconds(frequency)
+
+##############################################################
+# The bar each source bar falls in, as an increasing key.
+def _bar_keys(dates, frequency):
+
+    if frequency == "monthly":
+        return dates.astype('datetime64[M]').astype(np.int64)
+
+    seconds = dates.astype('datetime64[s]').astype(np.int64)
+    if frequency == "weekly":
+        # 1970-01-01 was a Thursday.
+        return (seconds // 86400 + 3) // 7
+
+    return seconds // _seconds(frequency)
+
+# The CSV of the bars of a source's columns.
+#
+# The feed takes the adjusted open, high and low from the close, adjusted
+# close and unadjusted prices (see _datacache.py), so the unadjusted prices are
+# written back from the adjusted ones of the bar and its last close: a bar
+# covering a split or dividend then reads back with exactly the adjusted prices
+# aggregated here.
+def _aggregate(columns, frequency):
+
+    lines = ["Date,Open,High,Low,Close,Adj Close,Volume"]
+
+    keys = _bar_keys(columns['date'], frequency)
+    if len(keys) == 0:
+        return (lines[0] + "\n").encode('utf-8')
+
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    ends = np.concatenate([starts[1:], [len(keys)]]) - 1
+
+    close = columns['close'][ends]
+    adjClose = columns['adj_close'][ends]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = close / adjClose
+
+    table = [
+        columns['adj_open'][starts] * ratio,
+        np.maximum.reduceat(columns['adj_high'], starts) * ratio,
+        np.minimum.reduceat(columns['adj_low'], starts) * ratio,
+        close,
+        adjClose,
+        np.add.reduceat(columns['volume'], starts),
+    ]
+
+    dates = columns['date'][ends]
+    if _seconds(frequency) >= 86400:
+        dates = np.datetime_as_string(dates, unit='D')
+    else:
+        dates = np.char.replace(np.datetime_as_string(dates, unit='s'), "T", " ")
+
+    for row in zip(dates.tolist(), *[values.tolist() for values in table]):
+        lines.append("%s,%.17g,%.17g,%.17g,%.17g,%.17g,%.17g" % row)
+
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+def _write_atomic(path, write):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'wb') as f:
+            write(f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+##############################################################
+# The data file of a source's bars at a frequency: the source itself when it
+# already is at that frequency, or else its resampled CSV, (re)built when the
+# source changed. Raises ValueError for an unsupported frequency or one finer
+# than the source's.
+def Resample(dataFile, frequency):
+
+    seconds = _seconds(frequency)
+
+    resampledFile = ResampledFile(dataFile, frequency)
+    st = os.stat(dataFile)
+    stamp = {'version': resampleVersion, 'source': os.path.basename(dataFile), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+             'frequency': frequency}
+
+    try:
+        with open(StampFile(resampledFile), 'r') as f:
+            if json.load(f) == stamp and os.path.exists(resampledFile):
+                return resampledFile
+    except (OSError, ValueError):
+        pass
+
+    sourceFrequency = DataFrequency(dataFile)
+    if sourceFrequency == frequency:
+        return dataFile
+    if seconds < _seconds(sourceFrequency):
+        raise ValueError("Can't resample " + FrequencyLabel(sourceFrequency).lower() + " bars to " + frequency)
+
+    content = _aggregate(LoadColumns(dataFile), frequency)
+
+    try:
+        with open(resampledFile, 'rb') as f:
+            unchanged = f.read() == content
+    except OSError:
+        unchanged = False
+
+    if not unchanged:
+        _write_atomic(resampledFile, lambda f: f.write(content))
+    _write_atomic(StampFile(resampledFile), lambda f: f.write(json.dumps(stamp).encode('utf-8')))
+
+    return resampledFile
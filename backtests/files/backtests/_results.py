@@ -0,0 +1,34 @@
+#!/usr/bin/python3.9
+
+# Per-check backtest result files.
+#
+# The batch runner writes one small JSON file per backtest, which the thin
+# Nagios plugin (check_backtest_result.py) reads back. This module is kept
+# free of pyalgotrade/pandas imports so the plugin starts quickly.
+
+import json
+import os
+
+resultsDir = "/shark/.tmp"
+
+def ResultFile(ticker):
+    return os.path.join(resultsDir, "backtest.result." + ticker)
+
+def WriteJSONAtomic(path, obj):
+
+    # Readers never see a partially written file.
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(obj, f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+def WriteResult(ticker, result):
+    WriteJSONAtomic(ResultFile(ticker), result)
+
+def ReadResult(ticker):
+    with open(ResultFile(ticker), 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,272 @@
+#!/usr/bin/python3.9
+
+# History of the backtest runs in a local SQLite database.
+#
+# The reports under /shark/reports only hold a ticker's latest run. Every run
+# is also recorded, with its parameters, summary metrics, trade statistics,
+# phase timings and a fingerprint of its data, in /shark/.tmp/backtest.db, so
+# trends (e.g. the Sharpe ratio over the last 90 runs of every ticker) are one
+# indexed query away (see results.py).
+#
+# A memo hit (see _memo.py) runs nothing, but is recorded too: the memo keeps
+# the record of the run it stored, and a hit records it again with the hit's
+# own time and cost (its phases are just 'memo').
+#
+# Nagios runs many checks side by side, so a run doesn't write to the database
+# itself: it appends one JSON line to a spool file, and the spool is imported
+# in a single transaction once it holds batchRuns runs or its oldest run is
+# batchAge seconds old, before every query, and at the end of a batch
+# (run_backtests.py). Appending holds a shared lock and the import an
+# exclusive one, so no run is lost while the spool is swapped out.
+#
+# Like _memo.py this module stays free of pyalgotrade/pandas imports.
+
+import contextlib
+import fcntl
+import json
+import os
+import sqlite3
+import time
+
+from _datacache import DataDigest
+
+from _profile import PeakRSS
+
+storeVersion = 1
+
+databaseFile = "/shark/.tmp/backtest.db"
+
+spoolFile = "/shark/.tmp/backtest.db.spool"
+
+lockFile = "/shark/.tmp/backtest.db.lock"
+
+batchRuns = 32
+batchAge = 60
+
+# The summary and trade figures kept as columns, the rest of the report's
+# trade sections is kept as JSON.
+metricColumns = [
+    ('final_value', 'REAL'),
+    ('cumulative_returns', 'REAL'),
+    ('sharpe_ratio', 'REAL'),
+    ('max_drawdown', 'REAL'),
+    ('total_trades', 'INTEGER'),
+    ('wins', 'INTEGER'),
+    ('losses', 'INTEGER'),
+    ('avg_return', 'REAL'),
+    ('avg_profit', 'REAL'),
+]
+
+runColumns = [
+    ('finished', 'REAL NOT NULL'),
+    ('ticker', 'TEXT NOT NULL'),
+    ('strategy', 'TEXT NOT NULL'),
+    ('engine', 'TEXT'),
+    ('params', 'TEXT'),
+    ('data_file', 'TEXT'),
+    ('data_fingerprint', 'TEXT'),
+    ('start_date', 'TEXT'),
+    ('end_date', 'TEXT'),
+    ('bars', 'INTEGER'),
+] + metricColumns + [
+    ('trades', 'TEXT'),
+    ('phases', 'TEXT'),
+    ('total_time', 'REAL'),
+    ('peak_rss_kb', 'INTEGER'),
+]
+
+schema = ["CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, %s)" % ", ".join("%s %s" % column for column in runColumns),
+          "CREATE INDEX IF NOT EXISTS runs_ticker ON runs (ticker, finished)",
+          "CREATE INDEX IF NOT EXISTS runs_strategy ON runs (strategy, finished)",
+          "CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished)",
+          "PRAGMA user_version = %d" % storeVersion]
+
+##############################################################
+# Fingerprint of a data file's contents, the digest the memo key already took
+# (see _datacache.py).
+def Fingerprint(dataFile):
+
+    if not dataFile:
+        return None
+
+    try:
+        return DataDigest(dataFile)
+    except OSError:
+        return None
+
+def _number(value, kind=float):
+
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+##############################################################
+# The row of a finished run, from its report document (see _report.py).
+def RunRecord(ticker, scriptFile, engine, params, dataFile, timer, report):
+
+    summary = (report.get('backtest_summary') or [{}])[0]
+    totalTrades = (report.get('total_trades') or [{}])[0]
+    dataFrame = (report.get('dataframe_info') or [{}])[0]
+
+    return {
+        'finished': time.time(),
+        'ticker': ticker,
+        'strategy': os.path.basename(scriptFile),
+        'engine': engine,
+        'params': json.dumps(params, sort_keys=True),
+        'data_file': dataFile,
+        'data_fingerprint': Fingerprint(dataFile),
+        'start_date': dataFrame.get('start_date'),
+        'end_date': dataFrame.get('end_date'),
+        'bars': _number(dataFrame.get('rows'), int),
+        'final_value': _number(summary.get('final_portfolio_value')),
+        'cumulative_returns': _number(summary.get('cumulative_returns')),
+        'sharpe_ratio': _number(summary.get('sharpe_ratio')),
+        'max_drawdown': _number(summary.get('max_drawdown')),
+        'total_trades': _number(summary.get('total_trades'), int),
+        'wins': _number(summary.get('wins'), int),
+        'losses': _number(summary.get('losses'), int),
+        'avg_return': _number(totalTrades.get('avg_return')),
+        'avg_profit': _number(totalTrades.get('avg_profit')),
+        'trades': json.dumps({key: report.get(key) or [] for key in ['total_trades', 'profitable_trades', 'unprofitable_trades']}),
+        'phases': json.dumps({name: round(seconds, 6) for name, seconds in timer.phases.items()}),
+        'total_time': round(timer.total(), 6),
+        'peak_rss_kb': PeakRSS(),
+    }
+
+@contextlib.contextmanager
+def _locked(mode):
+
+    os.makedirs(os.path.dirname(lockFile), exist_ok=True)
+    with open(lockFile, 'a') as lock:
+        fcntl.flock(lock, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+# The record of a memoized run on a hit: the stored run's results, finished
+# now and at the cost of the hit.
+def ReplayRecord(record, timer):
+
+    record = dict(record)
+    record.update({
+        'finished': time.time(),
+        'phases': json.dumps({name: round(seconds, 6) for name, seconds in timer.phases.items()}),
+        'total_time': round(timer.total(), 6),
+        'peak_rss_kb': PeakRSS(),
+    })
+
+    return record
+
+##############################################################
+# Record a run: spool it, and import the spool when the batch is due.
+#
+# The last record of the process is kept, for the memo to store with the run.
+lastRecord = None
+
+def RecordRun(record):
+
+    global lastRecord
+    lastRecord = record
+
+    try:
+        with _locked(fcntl.LOCK_SH):
+            with open(spoolFile, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+
+        with open(spoolFile, 'r', encoding='utf-8') as f:
+            first = json.loads(f.readline())
+            runs = 1 + sum(1 for line in f)
+    except (OSError, ValueError):
+        return
+
+    if runs >= batchRuns or time.time() - first['finished'] >= batchAge:
+        try:
+            DrainSpool()
+        except (OSError, sqlite3.Error):
+            # The run stays spooled for the next import.
+            pass
+
+def Connect():
+
+    os.makedirs(os.path.dirname(databaseFile), exist_ok=True)
+    db = sqlite3.connect(databaseFile, timeout=30)
+    db.row_factory = sqlite3.Row
+    if db.execute("PRAGMA user_version").fetchone()[0] != storeVersion:
+        with db:
+            for statement in schema:
+                db.execute(statement)
+
+    return db
+
+# Import the spooled runs into the database, in one transaction. Returns the
+# number of runs imported.
+def DrainSpool():
+
+    drainFile = spoolFile + ".draining"
+
+    with _locked(fcntl.LOCK_EX):
+
+        # A spool left over by an import that failed goes first.
+        if not os.path.exists(drainFile):
+            try:
+                os.rename(spoolFile, drainFile)
+            except OSError:
+                return 0
+
+        records = []
+        with open(drainFile, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+
+        names = [name for name, kind in runColumns]
+        db = Connect()
+        try:
+            with db:
+                db.executemany("INSERT INTO runs (%s) VALUES (%s)" % (", ".join(names), ", ".join("?" * len(names))),
+                               [[record.get(name) for name in names] for record in records])
+        finally:
+            db.close()
+
+        os.remove(drainFile)
+
+    return len(records)
+
+##############################################################
+# The last runs (the lastRuns most recent per ticker, strategy, parameters and
+# data file, all of them when None) finished since a time, oldest first.
+def QueryRuns(tickers=None, strategy=None, since=None, lastRuns=None, columns=None):
+
+    DrainSpool()
+
+    where = []
+    values = []
+    if tickers:
+        where.append("ticker IN (%s)" % ", ".join("?" * len(tickers)))
+        values += list(tickers)
+    if strategy:
+        where.append("strategy = ?")
+        values.append(strategy)
+    if since is not None:
+        where.append("finished >= ?")
+        values.append(since)
+
+    query = "SELECT *, ROW_NUMBER() OVER (PARTITION BY ticker, strategy, params, data_file ORDER BY finished DESC) AS recent FROM runs"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query = "SELECT %s FROM (%s)" % (", ".join(columns) if columns else "*", query)
+    if lastRuns is not None:
+        query += " WHERE recent <= ?"
+        values.append(lastRuns)
+    query += " ORDER BY ticker, strategy, params, data_file, finished"
+
+    db = Connect()
+    try:
+        return [dict(row) for row in db.execute(query, values)]
+    finally:
+        db.close()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3.9
+
+# Bounded memory backtests over long (e.g. intraday) histories.
+#
+# The regular event driven run loads every bar of the data file into the
+# feed, and the Sharpe ratio analyzer and the plotter keep a value per day or
+# bar, so memory grows with the history. In bounded mode (--bounded):
+#   - StreamingFeed reads the bars from the binary cache (see _datacache.py)
+#     a chunk at a time, keeping only the current chunk,
+#   - the indicators, the feed's data series and the returns and drawdown
+#     analyzers already keep just their last DEFAULT_MAX_LEN values or running
+#     figures,
+#   - SharpeRatio keeps running sums of the daily returns instead of the list,
+#   - the plotter keeps a downsampled series (see _downsample.py).
+# Only the trades analyzer still grows, with the number of trades.
+
+import math
+
+from pyalgotrade import bar
+from pyalgotrade import barfeed
+from pyalgotrade import stratanalyzer
+from pyalgotrade.stratanalyzer import returns
+
+from _datacache import ReadColumns
+
+# Bars read from the cache at a time.
+chunkBars = 1 << 16
+
+##############################################################
+# pyalgotrade bars from a dict of columns. Their open, high, low and close are
+# the adjusted prices computed at ingest (see _datacache.py), so strategies
+# use them as they are instead of having every bar adjusted on each access.
+def BarsFromColumns(columns, frequency=bar.Frequency.DAY):
+
+    return [bar.BasicBar(dateTime, open_, high, low, close, volume, close, frequency)
+            for dateTime, open_, high, low, close, volume in zip(
+                columns['date'].tolist(), columns['adj_open'].tolist(), columns['adj_high'].tolist(), columns['adj_low'].tolist(),
+                columns['adj_close'].tolist(), columns['volume'].tolist())]
+
+##############################################################
+# A feed of one instrument's bars, read from the data file's cache a chunk at
+# a time, with the adjusted prices like every feed built by _functions.py.
+class StreamingFeed(barfeed.BaseBarFeed):
+
+    def __init__(self, instrument, dataFile, frequency=bar.Frequency.DAY, maxLen=None, chunkSize=chunkBars):
+
+        super(StreamingFeed, self).__init__(frequency, maxLen)
+
+        self.__instrument = instrument
+        self.__dataFile = dataFile
+        self.__chunkSize = chunkSize
+        self.__bars = []
+        self.__pos = 0
+        self.__nextRow = 0
+        self.__currDateTime = None
+
+        self.registerInstrument(instrument)
+
+    def __fill(self):
+
+        if self.__pos < len(self.__bars):
+            return True
+
+        columns = ReadColumns(self.__dataFile, self.__nextRow, self.__nextRow + self.__chunkSize)
+        self.__bars = BarsFromColumns(columns, self.getFrequency())
+        self.__pos = 0
+        self.__nextRow += len(self.__bars)
+
+        return len(self.__bars) > 0
+
+    def getCurrentDateTime(self):
+        return self.__currDateTime
+
+    def barsHaveAdjClose(self):
+        return True
+
+    def start(self):
+        super(StreamingFeed, self).start()
+
+    def stop(self):
+        pass
+
+    def join(self):
+        pass
+
+    def eof(self):
+        return not self.__fill()
+
+    def peekDateTime(self):
+
+        if not self.__fill():
+            return None
+
+        return self.__bars[self.__pos].getDateTime()
+
+    def getNextBars(self):
+
+        if not self.__fill():
+            return None
+
+        ret = self.__bars[self.__pos]
+        self.__pos += 1
+
+        if self.__currDateTime == ret.getDateTime():
+            raise Exception("Duplicate bars found for %s on %s" % (self.__instrument, ret.getDateTime()))
+
+        self.__currDateTime = ret.getDateTime()
+        return bar.Bars({self.__instrument: ret})
+
+##############################################################
+# pyalgotrade's SharpeRatio analyzer with daily returns, keeping running
+# (Welford) sums of the finished days' returns instead of all of them.
+class SharpeRatio(stratanalyzer.StrategyAnalyzer):
+
+    def __init__(self, tradingPeriods=252):
+
+        super(SharpeRatio, self).__init__()
+
+        self.__tradingPeriods = tradingPeriods
+        self.__count = 0
+        self.__mean = 0.0
+        self.__m2 = 0.0
+        self.__currentDate = None
+        self.__currentReturn = None
+
+    def beforeAttach(self, strat):
+        # Get or create a shared ReturnsAnalyzerBase
+        analyzer = returns.ReturnsAnalyzerBase.getOrCreateShared(strat)
+        analyzer.getEvent().subscribe(self.__onReturns)
+
+    def __add(self, count, mean, m2, value):
+
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+
+        return count, mean, m2
+
+    def __onReturns(self, dateTime, returnsAnalyzerBase):
+
+        netReturn = returnsAnalyzerBase.getNetReturn()
+        if dateTime.date() == self.__currentDate:
+            self.__currentReturn = (1 + self.__currentReturn) * (1 + netReturn) - 1
+        else:
+            if self.__currentReturn is not None:
+                self.__count, self.__mean, self.__m2 = self.__add(self.__count, self.__mean, self.__m2, self.__currentReturn)
+            self.__currentDate = dateTime.date()
+            self.__currentReturn = netReturn
+
+    def getSharpeRatio(self, riskFreeRate, annualized=True, tradingPeriods=None):
+
+        tradingPeriods = tradingPeriods or self.__tradingPeriods
+
+        count, mean, m2 = self.__count, self.__mean, self.__m2
+        if self.__currentReturn is not None:
+            count, mean, m2 = self.__add(count, mean, m2, self.__currentReturn)
+
+        # Like pyalgotrade's sharpe_ratio(): NaN for a single day (NumPy's sample
+        # deviation), 0 without volatility.
+        if count < 2:
+            return float('nan')
+        if m2 <= 0:
+            return 0.0
+
+        ret = (mean - riskFreeRate / float(tradingPeriods)) / math.sqrt(m2 / (count - 1))
+        if annualized:
+            ret = ret * math.sqrt(tradingPeriods)
+
+        return ret
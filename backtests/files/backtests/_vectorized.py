@@ -0,0 +1,518 @@
+#!/usr/bin/python3.9
+
+# Array based backtest engine for the RSI2, BBands and Moving Averages strategies.
+#
+# The indicators and signals are computed over whole NumPy columns. The only
+# Python level loop walks from one trade to the next, the equity curve and the
+# analyzer figures are then computed from the fills in one pass.
+#
+# It mirrors the behaviour of the pyalgotrade event loop the backtests use:
+#
+# * Orders submitted on bar N are filled at the open of bar N+1.
+# * All three use the adjusted values computed at ingest (fills at the
+#   adjusted open, equity valued at the adjusted close).
+# * Good till canceled entries that can't be paid for are retried on the
+#   following bars, BBands' day orders are dropped instead.
+# * No commissions, and bar volume is assumed to never limit a fill.
+
+import datetime
+
+import numpy as np
+
+from scipy import signal
+
+from _datacache import LoadColumns
+
+from _resample import DatesFrequency
+from _resample import TradingPeriods
+
+##############################################################
+# Indicators - NaN marks the bars where pyalgotrade would return None.
+def SMA(values, period):
+
+    ret = np.full(len(values), np.nan)
+    if len(values) >= period:
+        ret[period - 1:] = np.convolve(values, np.ones(period), 'valid') / float(period)
+    return ret
+
+def StdDev(values, period, ddof=0):
+
+    ret = np.full(len(values), np.nan)
+    if len(values) >= period:
+        ret[period - 1:] = np.lib.stride_tricks.sliding_window_view(values, period).std(axis=1, ddof=ddof)
+    return ret
+
+def RSI(values, period):
+
+    # Wilder's RSI, seeded with the simple average of the first period changes.
+    ret = np.full(len(values), np.nan)
+    if len(values) <= period:
+        return ret
+
+    change = np.diff(values)
+    gains = np.where(change > 0, change, 0.0)
+    losses = np.where(change < 0, -change, 0.0)
+
+    b = [1.0 / period]
+    a = [1.0, -(period - 1) / float(period)]
+
+    avgGain = np.empty(len(change) - period + 1)
+    avgLoss = np.empty(len(change) - period + 1)
+    avgGain[0] = gains[:period].sum() / float(period)
+    avgLoss[0] = losses[:period].sum() / float(period)
+    avgGain[1:] = signal.lfilter(b, a, gains[period:], zi=[avgGain[0] * (period - 1) / float(period)])[0]
+    avgLoss[1:] = signal.lfilter(b, a, losses[period:], zi=[avgLoss[0] * (period - 1) / float(period)])[0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + avgGain / avgLoss)
+    rsi[avgLoss == 0] = 100
+
+    ret[period:] = rsi
+    return ret
+
+def BollingerBands(values, period, numStdDev):
+
+    middle = SMA(values, period)
+    stdDev = StdDev(values, period)
+
+    return middle + stdDev * numStdDev, middle, middle - stdDev * numStdDev
+
+def CrossAbove(values1, values2):
+
+    # True on the bars where values1 moves from below values2 to above it.
+    diff = values1 - values2
+    ret = np.zeros(len(diff), dtype=bool)
+    ret[1:] = (diff[:-1] < 0) & (diff[1:] > 0)
+    return ret
+
+def CrossBelow(values1, values2):
+
+    diff = values1 - values2
+    ret = np.zeros(len(diff), dtype=bool)
+    ret[1:] = (diff[:-1] > 0) & (diff[1:] < 0)
+    return ret
+
+##############################################################
+# Analyzer look-alikes, so GenerateJSONReport can consume the results unchanged.
+class VectorStrategy(object):
+
+    def __init__(self, equity):
+        self.__equity = equity
+
+    def getResult(self):
+        return float(self.__equity[-1])
+
+class VectorReturns(object):
+
+    def __init__(self, returns):
+        self.__returns = returns
+        self.__cumulative = np.cumprod(1 + returns) - 1
+
+    def getReturns(self):
+        return self.__returns
+
+    def getCumulativeReturns(self):
+        return self.__cumulative
+
+class VectorSharpeRatio(object):
+
+    def __init__(self, dates, returns):
+        # Compound the returns of bars that share a date, like the daily sharpe analyzer.
+        days = dates.astype('datetime64[D]')
+        starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+        self.__returns = np.multiply.reduceat(1 + returns, starts) - 1
+
+        # Weekly and monthly bars aren't annualized as daily ones (see _resample.py).
+        self.__tradingPeriods = TradingPeriods(DatesFrequency(dates))
+
+    def getReturns(self):
+        return self.__returns
+
+    def getSharpeRatio(self, riskFreeRate, annualized=True):
+
+        ret = 0.0
+        volatility = self.__returns.std(ddof=1) if len(self.__returns) > 1 else 0
+
+        if volatility != 0:
+            ret = (self.__returns.mean() - riskFreeRate / float(self.__tradingPeriods)) / volatility
+            if annualized:
+                ret = ret * np.sqrt(self.__tradingPeriods)
+        return float(ret)
+
+class VectorDrawDown(object):
+
+    def __init__(self, dates, equity):
+
+        highWatermark = np.maximum.accumulate(equity)
+        self.__maxDD = abs(min(0, ((equity - highWatermark) / highWatermark).min()))
+
+        # Index of the most recent high for each bar.
+        highIdx = np.maximum.accumulate(np.where(equity >= highWatermark, np.arange(len(equity)), 0))
+        longest = (dates - dates[highIdx]).max()
+        self.__longestDDDuration = max(datetime.timedelta(), longest.astype('timedelta64[us]').item())
+
+    def getMaxDrawDown(self):
+        return self.__maxDD
+
+    def getLongestDrawDownDuration(self):
+        return self.__longestDDDuration
+
+class VectorTrades(object):
+
+    def __init__(self, profits, returns):
+        self.__all = np.asarray(profits, dtype=np.float64)
+        self.__allReturns = np.asarray(returns, dtype=np.float64)
+
+    def getCount(self):
+        return len(self.__all)
+
+    def getProfitableCount(self):
+        return int((self.__all > 0).sum())
+
+    def getUnprofitableCount(self):
+        return int((self.__all < 0).sum())
+
+    def getEvenCount(self):
+        return int((self.__all == 0).sum())
+
+    def getAll(self):
+        return self.__all
+
+    def getProfits(self):
+        return self.__all[self.__all > 0]
+
+    def getLosses(self):
+        return self.__all[self.__all < 0]
+
+    def getAllReturns(self):
+        return self.__allReturns
+
+    def getPositiveReturns(self):
+        return self.__allReturns[self.__all > 0]
+
+    def getNegativeReturns(self):
+        return self.__allReturns[self.__all < 0]
+
+##############################################################
+# Minimal stand in for plotter.StrategyPlotter.
+class VectorPlotter(object):
+
+    def __init__(self, dates, prices, equity, fills):
+        self.__dates = dates
+        self.__prices = prices
+        self.__equity = equity
+        self.__fills = fills
+        self.__series = {}
+        self.__lines = {}
+
+    def addDataSeries(self, subplot, name, values):
+        self.__series.setdefault(subplot, []).append((name, values))
+
+    def addLine(self, subplot, name, level):
+        self.__lines.setdefault(subplot, []).append((name, level))
+
+    # The series as _chart.PlotSeries() takes them out of a StrategyPlotter.
+    def getSeries(self):
+
+        buys = np.full(len(self.__dates), np.nan)
+        sells = np.full(len(self.__dates), np.nan)
+        for i, qty, price in self.__fills:
+            (buys if qty > 0 else sells)[i] = self.__prices[i]
+
+        columns = [{'subplot': "instrument", 'name': "price", 'kind': 'line', 'values': np.asarray(self.__prices, dtype=np.float64)}]
+        columns += [{'subplot': "instrument", 'name': name, 'kind': 'line', 'values': np.asarray(values, dtype=np.float64)}
+                    for name, values in self.__series.get("instrument", [])]
+        columns += [{'subplot': "instrument", 'name': "Buy", 'kind': 'buy', 'values': buys},
+                    {'subplot': "instrument", 'name': "Sell", 'kind': 'sell', 'values': sells}]
+
+        for subplot in [name for name in self.__series.keys() if name != "instrument"]:
+            columns += [{'subplot': subplot, 'name': name, 'kind': 'line', 'values': np.asarray(values, dtype=np.float64)}
+                        for name, values in self.__series[subplot]]
+            columns += [{'subplot': subplot, 'name': name, 'kind': 'line', 'values': np.full(len(self.__dates), float(level))}
+                        for name, level in self.__lines.get(subplot, [])]
+
+        columns.append({'subplot': "portfolio", 'name': "Portfolio", 'kind': 'line', 'values': np.asarray(self.__equity, dtype=np.float64)})
+
+        return self.__dates, columns
+
+    # points, the indices of the bars to draw (all of them when None).
+    def savePlot(self, fileName, points=None):
+
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib import pyplot
+
+        if points is None:
+            points = np.arange(len(self.__dates))
+        dates = self.__dates[points]
+
+        subplots = [name for name in self.__series.keys() if name != "instrument"]
+        fig, axes = pyplot.subplots(2 + len(subplots), 1, sharex=True, squeeze=False)
+        axes = axes[:, 0]
+
+        axes[0].plot(dates, self.__prices[points], label="price")
+        for name, values in self.__series.get("instrument", []):
+            axes[0].plot(dates, np.asarray(values)[points], label=name)
+
+        buys = [i for i, qty, price in self.__fills if qty > 0]
+        sells = [i for i, qty, price in self.__fills if qty < 0]
+        axes[0].plot(self.__dates[buys], self.__prices[buys], "g^", label="Buy")
+        axes[0].plot(self.__dates[sells], self.__prices[sells], "rv", label="Sell")
+
+        for ax, name in zip(axes[1:], subplots):
+            for seriesName, values in self.__series[name]:
+                ax.plot(dates, np.asarray(values)[points], label=seriesName)
+            for lineName, level in self.__lines.get(name, []):
+                ax.axhline(level, linestyle="--", label=lineName)
+
+        axes[-1].plot(dates, self.__equity[points], label="Portfolio")
+
+        for ax in axes:
+            ax.legend(loc="best", fontsize="small")
+
+        fig.set_size_inches(16, 9)
+        fig.savefig(fileName)
+        pyplot.close(fig)
+
+##############################################################
+# Position / equity from a list of fills.
+def _evaluate(columns, valuation, capital, fills, trades):
+
+    n = len(valuation)
+    sharesDelta = np.zeros(n)
+    cashDelta = np.zeros(n)
+
+    for i, qty, price in fills:
+        sharesDelta[i] += qty
+        cashDelta[i] -= qty * price
+
+    shares = np.cumsum(sharesDelta)
+    cash = capital + np.cumsum(cashDelta)
+    equity = cash + shares * valuation
+
+    prevEquity = np.concatenate(([float(capital)], equity[:-1]))
+    returns = np.where(prevEquity != 0, (equity - prevEquity) / np.where(prevEquity != 0, prevEquity, 1), 0.0)
+
+    profits = [(exitPrice - entryPrice) * qty for qty, entryPrice, exitPrice in trades]
+    tradeReturns = [(exitPrice - entryPrice) * qty / (entryPrice * abs(qty)) for qty, entryPrice, exitPrice in trades]
+
+    dates = columns['date']
+    return (VectorStrategy(equity), VectorReturns(returns), VectorSharpeRatio(dates, returns),
+            VectorDrawDown(dates, equity), VectorTrades(profits, tradeReturns), equity)
+
+def _first(predicate, start, n):
+
+    # Index of the first True of predicate(lo, hi) (a boolean array for bars
+    # lo..hi) at or after start, or None. Scans in growing chunks, so walking
+    # through the data trade by trade stays linear in the number of bars.
+    chunk = 64
+    while start < n:
+        idx = np.flatnonzero(predicate(start, min(start + chunk, n)))
+        if len(idx):
+            return start + int(idx[0])
+        start += chunk
+        chunk *= 2
+    return None
+
+def _next_true(mask, start):
+
+    # Index of the first True in mask at or after start, or None.
+    return _first(lambda lo, hi: mask[lo:hi], start, len(mask))
+
+def _fill_entry(fillPrices, start, qty, cash, cancelMask):
+
+    # Bar at which a good till canceled entry of qty fills, or None if it
+    # gets canceled (cancelMask) or never fills before the end of the data.
+    n = len(fillPrices)
+    if qty > 0:
+        fillAt = _first(lambda lo, hi: qty * fillPrices[lo:hi] <= cash, start, n)
+    else:
+        fillAt = start if start < n else None
+    if fillAt is None:
+        fillAt = n
+    cancelAt = _next_true(cancelMask[:fillAt], start)
+
+    if cancelAt is not None or fillAt == n:
+        return None, (cancelAt if cancelAt is not None else fillAt)
+    return fillAt, None
+
+def _fill_exit(fillPrices, start, qty, cash):
+
+    # Bar at which the exit of a position of qty fills (covering a short needs the cash).
+    if start >= len(fillPrices):
+        return None
+    if qty < 0:
+        return _first(lambda lo, hi: -qty * fillPrices[lo:hi] <= cash, start, len(fillPrices))
+    return start
+
+def _simulate_positions(openPrices, prices, capital, longEntry, shortEntry, longExit, shortExit, sizer, firstBar):
+
+    # Walk from trade to trade for the enterLong/enterShort/exitMarket based strategies.
+    n = len(prices)
+    cash = float(capital)
+    fills = []
+    trades = []
+
+    entryMask = longEntry | shortEntry
+    i = firstBar
+
+    while i < n:
+
+        j = _next_true(entryMask[:n - 1], i) if i < n - 1 else None
+        if j is None:
+            break
+
+        isLong = bool(longEntry[j])
+        qty = sizer(cash, prices[j])
+        if not isLong:
+            qty = -qty
+        exitMask = longExit if isLong else shortExit
+
+        if qty == 0:
+            i = j + 1
+            continue
+
+        # Pending entry, canceled by an exit signal on a bar where it didn't fill.
+        fillBar, canceledBar = _fill_entry(openPrices, j + 1, qty, cash, exitMask)
+        if fillBar is None:
+            i = canceledBar + 1
+            continue
+
+        entryPrice = openPrices[fillBar]
+        fills.append((fillBar, qty, entryPrice))
+        cash -= qty * entryPrice
+
+        # Exit signal on or after the fill bar, filled at the next open.
+        m = _next_true(exitMask, fillBar)
+        if m is None:
+            break
+
+        exitBar = _fill_exit(openPrices, m + 1, qty, cash)
+        if exitBar is None:
+            break
+
+        exitPrice = openPrices[exitBar]
+        fills.append((exitBar, -qty, exitPrice))
+        cash += qty * exitPrice
+        trades.append((qty, entryPrice, exitPrice))
+
+        i = exitBar
+
+    return fills, trades
+
+##############################################################
+# Strategies
+def RunRSI2(columns, capital, entrySMA, exitSMA, rsiPeriod, overSoldThreshold, overBoughtThreshold):
+
+    # RSI2 uses adjusted values.
+    prices = columns['adj_close']
+    openPrices = columns['adj_open']
+
+    entrySMAValues = SMA(prices, entrySMA)
+    exitSMAValues = SMA(prices, exitSMA)
+    rsiValues = RSI(prices, rsiPeriod)
+
+    ready = ~(np.isnan(entrySMAValues) | np.isnan(exitSMAValues) | np.isnan(rsiValues))
+    firstBar = _next_true(ready, 0)
+
+    with np.errstate(invalid='ignore'):
+        longEntry = ready & (prices > entrySMAValues) & (rsiValues <= overSoldThreshold)
+        shortEntry = ready & ~longEntry & (prices < entrySMAValues) & (rsiValues >= overBoughtThreshold)
+        longExit = ready & CrossAbove(prices, exitSMAValues)
+        shortExit = ready & CrossBelow(prices, exitSMAValues)
+
+    sizer = lambda cash, price: int(cash * 0.9 / price)
+
+    fills, trades = [], []
+    if firstBar is not None:
+        fills, trades = _simulate_positions(openPrices, prices, capital, longEntry, shortEntry, longExit, shortExit, sizer, firstBar)
+
+    strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, equity = _evaluate(columns, prices, capital, fills, trades)
+
+    plt = VectorPlotter(columns['date'], prices, equity, fills)
+    plt.addDataSeries("instrument", "Entry SMA", entrySMAValues)
+    plt.addDataSeries("instrument", "Exit SMA", exitSMAValues)
+    plt.addDataSeries("rsi", "RSI", rsiValues)
+    plt.addLine("rsi", "Overbought", overBoughtThreshold)
+    plt.addLine("rsi", "Oversold", overSoldThreshold)
+
+    return strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt
+
+def RunMovingAverages(columns, shares, capital, smaPeriod):
+
+    # Moving Averages uses adjusted values.
+    prices = columns['adj_close']
+    openPrices = columns['adj_open']
+
+    smaValues = SMA(prices, smaPeriod)
+
+    with np.errstate(invalid='ignore'):
+        longEntry = CrossAbove(prices, smaValues)
+        longExit = CrossBelow(prices, smaValues)
+    noSignal = np.zeros(len(prices), dtype=bool)
+
+    sizer = lambda cash, price: shares
+
+    fills, trades = _simulate_positions(openPrices, prices, capital, longEntry, noSignal, longExit, noSignal, sizer, 0)
+
+    strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, equity = _evaluate(columns, prices, capital, fills, trades)
+
+    plt = VectorPlotter(columns['date'], prices, equity, fills)
+    plt.addDataSeries("instrument", "sma", smaValues)
+    plt.addDataSeries("returns", "Simple returns", retAnalyzer.getReturns())
+
+    return strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt
+
+def RunBBands(columns, capital, bandsPeriod):
+
+    # BBands uses adjusted values and day orders.
+    prices = columns['adj_close']
+    openPrices = columns['adj_open']
+
+    upper, middle, lower = BollingerBands(prices, bandsPeriod, 2)
+
+    with np.errstate(invalid='ignore'):
+        buySignal = prices < lower
+        sellSignal = prices > upper
+
+    n = len(prices)
+    cash = float(capital)
+    fills = []
+    trades = []
+
+    i = bandsPeriod - 1
+    while i < n - 1:
+
+        j = _next_true(buySignal[:n - 1], i)
+        if j is None:
+            break
+
+        qty = int(cash / prices[j])
+        if qty == 0 or qty * openPrices[j + 1] > cash:
+            # Not enough cash at the open, the day order expires.
+            i = j + 1
+            continue
+
+        entryPrice = openPrices[j + 1]
+        fills.append((j + 1, qty, entryPrice))
+        cash -= qty * entryPrice
+
+        m = _next_true(sellSignal[:n - 1], j + 1)
+        if m is None:
+            break
+
+        exitPrice = openPrices[m + 1]
+        fills.append((m + 1, -qty, exitPrice))
+        cash += qty * exitPrice
+        trades.append((qty, entryPrice, exitPrice))
+
+        i = m + 1
+
+    strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, equity = _evaluate(columns, prices, capital, fills, trades)
+
+    plt = VectorPlotter(columns['date'], prices, equity, fills)
+    plt.addDataSeries("instrument", "upper", upper)
+    plt.addDataSeries("instrument", "middle", middle)
+    plt.addDataSeries("instrument", "lower", lower)
+
+    return strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt
@@ -0,0 +1,63 @@
+#!/usr/bin/python3.9
+
+# Thin Nagios client for backtestd.py.
+#
+# Takes the backtest script followed by its usual arguments, e.g.
+#
+#   backtest_client.py rsi2.py @/shark/.tmp/backtest.scriptFile.BTC-USD
+#
+# sends them to the daemon, prints the backtest's output and exits with its
+# Nagios status. Only the standard library is imported, so it starts quickly.
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import sys
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+socketFile = os.environ.get("SHARK_BACKTESTD_SOCKET", "/shark/.tmp/backtestd.sock")
+
+timeout = float(os.environ.get("SHARK_BACKTESTD_TIMEOUT", "300"))
+
+def run_backtest(scriptFile, argv):
+
+    request = json.dumps({'file': scriptFile, 'args': argv}) + "\n"
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socketFile)
+        sock.sendall(request.encode('utf-8'))
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline().decode('utf-8'))
+    finally:
+        sock.close()
+
+    return response['exit_code'], response['output']
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("UNKNOWN - No backtest file specified")
+        sys.exit(UNKNOWN)
+
+    try:
+        exitCode, output = run_backtest(sys.argv[1], sys.argv[2:])
+    except socket.timeout:
+        print("UNKNOWN - Timed out waiting for the backtest daemon")
+        sys.exit(UNKNOWN)
+    except (OSError, ValueError, KeyError) as e:
+        print("UNKNOWN - Backtest daemon unavailable (" + socketFile + "): " + str(e))
+        sys.exit(UNKNOWN)
+
+    print(output)
+    sys.exit(exitCode)
@@ -0,0 +1,74 @@
+#!/usr/bin/python3.9
+
+# Inspect and purge the memoized backtest results (see _memo.py).
+#
+#   backtest_memo.py                      list the entries, most recently used first
+#   backtest_memo.py -k <key>             show one entry
+#   backtest_memo.py --purge -t BTC-USD   drop the entries of a ticker
+#   backtest_memo.py --purge --all        drop everything
+#   backtest_memo.py --evict -m 100       apply the eviction policy now
+
+from __future__ import print_function
+
+import _memo
+
+import argparse
+import json
+import sys
+import time
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-k", "--key", help="Only this entry (a unique prefix of its key is enough).")
+    parser.add_argument("-t", "--ticker", help="Only the entries of this ticker.")
+    parser.add_argument("--purge", help="Remove the selected entries.", action="store_true")
+    parser.add_argument("--all", help="Select every entry (required to purge everything).", action="store_true")
+    parser.add_argument("--evict", help="Evict least recently used and expired entries.", action="store_true")
+    parser.add_argument("-m", "--max_entries", help="Entries kept by --evict.", default=str(_memo.maxEntries))
+    parser.add_argument("-a", "--max_age", help="Entries unused for longer than this many seconds are evicted.", default=str(_memo.maxAge))
+
+    args = parser.parse_args()
+
+    if args.evict:
+        print("Evicted %d entries" % _memo.EvictMemo(int(args.max_entries), int(args.max_age)))
+        sys.exit(OK)
+
+    entries = _memo.ListMemo()
+    if args.key:
+        entries = [entry for entry in entries if entry['key'].startswith(args.key)]
+    if args.ticker:
+        entries = [entry for entry in entries if entry['ticker'] == args.ticker]
+
+    if args.purge:
+
+        if not (args.key or args.ticker or args.all):
+            print("UNKNOWN - Select the entries to purge with --key, --ticker or --all")
+            sys.exit(UNKNOWN)
+
+        for entry in entries:
+            _memo.PurgeMemo(entry['key'])
+
+        print("Purged %d entries" % len(entries))
+        sys.exit(OK)
+
+    if args.key and len(entries) == 1:
+        print(json.dumps(entries[0], indent=4, sort_keys=True))
+        sys.exit(OK)
+
+    for entry in entries:
+        print("%s  %-10s %-20s %-8s used %s  %s" % (
+            entry['key'][:16], entry['ticker'], entry['file'], entry['exit_code'],
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['last_used'])),
+            entry['output'].splitlines()[0] if entry['output'] else ""))
+
+    print("%d entries in %s" % (len(entries), _memo.memoDir))
+    sys.exit(OK)
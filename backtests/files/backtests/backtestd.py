@@ -0,0 +1,119 @@
+#!/usr/bin/python3.9
+
+# Persistent backtest worker daemon.
+#
+# Keeps pyalgotrade, pandas, matplotlib and the strategy modules imported, and
+# the bars of recently used data files loaded, in a pool of worker processes.
+# Jobs arrive over a Unix socket from backtest_client.py, one JSON line each:
+#
+#   {"file": "rsi2.py", "args": ["@/shark/.tmp/backtest.scriptFile.BTC-USD"]}
+#
+# and are answered with one JSON line holding the Nagios exit code and output:
+#
+#   {"exit_code": 0, "output": "Sharpe Ratio: 0.23"}
+
+from __future__ import print_function
+
+from run_backtests import run_script
+from run_backtests import preload_modules
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+socketFile = "/shark/.tmp/backtestd.sock"
+
+# The backtests the daemon preloads and accepts.
+backtestScripts = ["rsi2.py", "BBands.py", "moving_averages.py"]
+
+##############################################################
+class BacktestRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            scriptFile = os.path.basename(request['file'])
+            argv = [str(arg) for arg in request['args']]
+        except (ValueError, KeyError, TypeError) as e:
+            self.reply(UNKNOWN, "UNKNOWN - Invalid backtest request: " + str(e))
+            return
+
+        if scriptFile not in self.server.scripts:
+            self.reply(UNKNOWN, "UNKNOWN - Unknown backtest " + scriptFile)
+            return
+
+        try:
+            exitCode, output = self.server.pool.apply(run_script, (scriptFile, argv))
+        except Exception as e:
+            exitCode, output = UNKNOWN, "UNKNOWN - Backtest worker failed: " + str(e)
+
+        self.reply(exitCode, output)
+
+    def reply(self, exitCode, output):
+        self.wfile.write((json.dumps({'exit_code': exitCode, 'output': output}) + "\n").encode('utf-8'))
+
+class BacktestServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socketFile, pool, scripts):
+        self.pool = pool
+        self.scripts = scripts
+        socketserver.UnixStreamServer.__init__(self, socketFile, BacktestRequestHandler)
+
+# Workers are forked from the daemon (also when recycled), leave SIGTERM to the pool.
+def init_worker():
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-S", "--socket", help="The Unix socket to listen on.", default=socketFile)
+    parser.add_argument("-j", "--processes", help="Number of worker processes (defaults to the number of cores).")
+    parser.add_argument("-m", "--max_jobs", help="Recycle a worker after this many backtests.", default="500")
+
+    args = parser.parse_args()
+
+    # Import everything once, the workers are forked from this warm process.
+    preload_modules(backtestScripts)
+
+    processes = int(args.processes) if args.processes else None
+    pool = multiprocessing.Pool(processes, init_worker, maxtasksperchild=int(args.max_jobs))
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    server = BacktestServer(args.socket, pool, set(backtestScripts))
+    os.chmod(args.socket, 0o660)
+
+    # Clean up the socket and the workers when stopped by the service manager.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(OK))
+
+    print("Backtest daemon listening on " + args.socket)
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.terminate()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+    sys.exit(OK)
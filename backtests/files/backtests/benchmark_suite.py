@@ -0,0 +1,317 @@
+#!/usr/bin/python3.9
+
+# Scaling benchmark for the backtest strategies on synthetic data.
+#
+# Generates reproducible Yahoo format CSV files (a seeded random walk, one bar
+# per minute so that 10M bars still fit pandas' date range) and runs every
+# strategy's run_strategy over each of them, once per engine, in a fresh
+# process. The phase timings and peak RSS (see _profile.py) are collected into
+# a JSON file. Given a baseline file, slower or larger runs beyond the
+# threshold, or runs whose results changed, are reported as WARNING.
+#
+# Everything happens under --dir, nothing is downloaded and /shark is not
+# needed, so it runs on any Linux box with the role's Python packages.
+#
+#   benchmark_suite.py -o bench.json
+#   benchmark_suite.py -b bench.json -o bench.new.json
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+defaultSizes = "1000,10000,100000,1000000,10000000"
+
+benchmarkDir = "/tmp/shark-benchmark"
+
+shares = 100
+capital = 1000000
+
+# How each strategy is run, with the parameters of the sample configuration.
+# The "bounded" engine is the event engine in bounded memory mode (--bounded).
+benchmarks = {
+    "rsi2.py": lambda module, ticker, dataFile, engine, plot: module.run_strategy(
+        ticker, shares, capital, dataFile, 200, 5, 2, 10, 90, engine.replace("bounded", "event"), resume=False, plot=plot, bounded=engine == "bounded"),
+    "BBands.py": lambda module, ticker, dataFile, engine, plot: module.run_strategy(
+        ticker, shares, capital, dataFile, 20, engine.replace("bounded", "event"), resume=False, plot=plot, bounded=engine == "bounded"),
+    "moving_averages.py": lambda module, ticker, dataFile, engine, plot: module.run_strategy(
+        ticker, shares, capital, 20, dataFile, engine.replace("bounded", "event"), resume=False, plot=plot, bounded=engine == "bounded"),
+}
+
+engines = ["event", "vectorized", "bounded"]
+
+# Figures compared against the baseline, and how.
+costKeys = ['total_time', 'peak_rss_kb']
+resultKeys = ['sharpe_ratio', 'max_drawdown', 'total_trades']
+
+##############################################################
+# Write a synthetic Yahoo format CSV of n bars, in chunks to bound memory.
+def generate_csv(path, bars, seed, chunkSize=1000000):
+
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2000-01-03T00:00:00")
+    lastClose = 100.0
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmpPath, 'w') as f:
+
+        f.write("Date,Open,High,Low,Close,Adj Close,Volume\n")
+
+        for offset in range(0, bars, chunkSize):
+
+            n = min(chunkSize, bars - offset)
+
+            close = lastClose * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+            prevClose = np.concatenate(([lastClose], close[:-1]))
+            open_ = prevClose * np.exp(rng.normal(0.0, 0.002, n))
+            high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, 0.003, n)))
+            low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, 0.003, n)))
+            # Plenty of volume, so the broker's volume limit never splits a fill.
+            volume = rng.integers(10 ** 11, 10 ** 12, n)
+            lastClose = close[-1]
+
+            dates = np.datetime_as_string(start + np.arange(offset, offset + n).astype('timedelta64[m]'), unit='s')
+            dates = np.char.replace(dates, "T", " ")
+
+            table = np.empty((n, 7), dtype=object)
+            table[:, 0] = dates
+            for column, values in enumerate([open_, high, low, close, close], 1):
+                table[:, column] = np.round(values, 6)
+            table[:, 6] = volume
+
+            np.savetxt(f, table, fmt=["%s", "%.6f", "%.6f", "%.6f", "%.6f", "%.6f", "%d"], delimiter=",")
+
+    os.replace(tmpPath, path)
+
+def data_file(workDir, bars, seed):
+    return os.path.join(workDir, "synthetic.%d.%d.csv" % (bars, seed))
+
+# Generate the file if needed and build its binary cache, returning the
+# time the cache build (CSV parsing) took.
+#
+# Runs in a child process (see run_prepare): a process' peak RSS carries over
+# to the processes it starts, so the parent has to stay small for the
+# workers' figures to mean anything.
+def prepare_data(workDir, bars, seed):
+
+    from _datacache import LoadColumns
+    from _datacache import RemoveCache
+
+    path = data_file(workDir, bars, seed)
+    if not os.path.exists(path):
+        print("Generating %d bars in %s" % (bars, path))
+        sys.stdout.flush()
+        generate_csv(path, bars, seed)
+
+    RemoveCache(path)
+    started = time.perf_counter()
+    LoadColumns(path)
+
+    return time.perf_counter() - started
+
+def run_prepare(workDir, bars, seed, timeout):
+
+    command = [sys.executable, os.path.abspath(__file__), "--prepare", str(bars), "--seed", str(seed), "--dir", workDir]
+    result = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.PIPE, universal_newlines=True, timeout=timeout, check=True)
+
+    lines = result.stdout.strip().splitlines()
+    for line in lines[:-1]:
+        print(line)
+
+    return float(lines[-1])
+
+##############################################################
+# Worker: run one strategy over one file with every output redirected under
+# workDir, and print its profile as JSON.
+#
+# Like the binary cache (see prepare_data), the indicator cache starts empty
+# for every run, so its setup time doesn't depend on the runs before.
+def run_worker(scriptFile, dataFile, engine, plot, workDir):
+
+    import contextlib
+    import importlib
+    import io
+    import shutil
+
+    import _checkpoint
+    import _indicators
+    import _profile
+    import _report
+    import _store
+
+    _report.reportsDir = os.path.join(workDir, "reports")
+    _report.indexLockFile = os.path.join(workDir, "reports", "backtest.index.lock")
+    _checkpoint.checkpointDir = os.path.join(workDir, "checkpoint")
+    _profile.profileDir = os.path.join(workDir, "profile")
+    _store.databaseFile = os.path.join(workDir, "backtest.db")
+    _store.spoolFile = os.path.join(workDir, "backtest.db.spool")
+    _store.lockFile = os.path.join(workDir, "backtest.db.lock")
+    _indicators.cacheDir = os.path.join(workDir, "indicator.cache")
+    shutil.rmtree(_indicators.cacheDir, ignore_errors=True)
+    for path in [_report.reportsDir, _profile.profileDir]:
+        os.makedirs(path, exist_ok=True)
+
+    ticker = os.path.splitext(os.path.basename(dataFile))[0]
+    module = importlib.import_module(os.path.splitext(scriptFile)[0])
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        exitCode = benchmarks[scriptFile](module, ticker, dataFile, engine, plot)
+
+    with open(_profile.ProfileFile(ticker), 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    profile['exit_code'] = exitCode
+
+    print(json.dumps(profile))
+
+def run_benchmark(scriptFile, dataFile, engine, plot, workDir, timeout):
+
+    command = [sys.executable, os.path.abspath(__file__), "--worker", scriptFile, dataFile, engine, "--dir", workDir]
+    if plot:
+        command.append("--plot")
+
+    try:
+        result = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'error': "timed out after %ds" % timeout}
+
+    if result.returncode != 0:
+        return {'error': (result.stderr.strip().splitlines() or ["exit code %d" % result.returncode])[-1]}
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+##############################################################
+# Returns (regressions, changed results) against a baseline.
+def compare(results, baseline, threshold):
+
+    regressions = []
+    changes = []
+    for name, result in sorted(results.items()):
+
+        base = baseline.get(name)
+        if not base or 'error' in result or 'error' in base:
+            continue
+
+        for key in costKeys:
+            if result[key] > base[key] * (1 + threshold):
+                regressions.append("%s %s %.4g (baseline %.4g)" % (name, key, result[key], base[key]))
+
+        for key in resultKeys:
+            if not np.isclose(result[key], base[key], rtol=1e-9, atol=1e-12, equal_nan=True):
+                changes.append("%s %s %.6g (baseline %.6g)" % (name, key, result[key], base[key]))
+
+    return regressions, changes
+
+def versions():
+
+    import pyalgotrade
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pyalgotrade': pyalgotrade.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("--worker", help=argparse.SUPPRESS, nargs=3)
+    parser.add_argument("--prepare", help=argparse.SUPPRESS)
+    parser.add_argument("-d", "--dir", help="Working directory for the data files and outputs.", default=benchmarkDir)
+    parser.add_argument("-z", "--sizes", help="Comma separated bar counts.", default=defaultSizes)
+    parser.add_argument("-s", "--script", help="Strategy to benchmark (may be repeated, defaults to all).", action="append", choices=sorted(benchmarks))
+    parser.add_argument("-e", "--engine", help="Engine to benchmark (may be repeated, defaults to event and vectorized).", action="append", choices=engines)
+    parser.add_argument("-m", "--max_event_bars", help="Skip the event engines above this many bars.", default="1000000")
+    parser.add_argument("--plot", help="Include the plot phase.", action="store_true")
+    parser.add_argument("--seed", help="Seed of the synthetic data.", default="42")
+    parser.add_argument("--timeout", help="Seconds allowed per run.", default="3600")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file.")
+    parser.add_argument("-b", "--baseline", help="Compare against the results in this JSON file.")
+    parser.add_argument("--threshold", help="Allowed slowdown or memory growth against the baseline (0.25 = 25%%).", default="0.25")
+
+    args = parser.parse_args()
+
+    if args.worker:
+        scriptFile, dataFile, engine = args.worker
+        run_worker(scriptFile, dataFile, engine, args.plot, args.dir)
+        sys.exit(OK)
+
+    if args.prepare:
+        print(prepare_data(args.dir, int(args.prepare), int(args.seed)))
+        sys.exit(OK)
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as e:
+            print("UNKNOWN - Unable to read baseline " + args.baseline + ": " + str(e))
+            sys.exit(UNKNOWN)
+
+    os.makedirs(args.dir, exist_ok=True)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    seed = int(args.seed)
+
+    report = {'created': time.time(), 'seed': seed, 'versions': versions(), 'ingest': {}, 'results': {}}
+
+    for bars in sizes:
+
+        report['ingest'][str(bars)] = round(run_prepare(args.dir, bars, seed, int(args.timeout)), 6)
+
+        for scriptFile in args.script or sorted(benchmarks):
+            for engine in args.engine or ["event", "vectorized"]:
+
+                if engine != "vectorized" and bars > int(args.max_event_bars):
+                    continue
+
+                name = "%s/%s/%d" % (scriptFile, engine, bars)
+                result = run_benchmark(scriptFile, data_file(args.dir, bars, seed), engine, args.plot, args.dir, int(args.timeout))
+                report['results'][name] = result
+
+                if 'error' in result:
+                    print("%-36s ERROR %s" % (name, result['error']))
+                else:
+                    print("%-36s %9.3fs %9dKB  %s" % (name, result['total_time'], result['peak_rss_kb'],
+                          " ".join("%s=%.3fs" % (phase, seconds) for phase, seconds in result['phases'].items())))
+                sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+
+    errors = [name for name, result in report['results'].items() if 'error' in result]
+    if errors:
+        print("CRITICAL - %d benchmark runs failed: %s" % (len(errors), ", ".join(errors)))
+        sys.exit(CRITICAL)
+
+    if baseline is not None:
+        regressions, changes = compare(report['results'], baseline, float(args.threshold))
+        if regressions or changes:
+            print("WARNING - " + "; ".join(["Regressed: " + r for r in regressions] + ["Results changed: " + c for c in changes]))
+            sys.exit(WARNING)
+
+    print("OK - %d benchmark runs" % len(report['results']))
+    sys.exit(OK)
@@ -0,0 +1,165 @@
+#!/usr/bin/python3.9
+
+# Parity check between the stock pyalgotrade broker and the MarketBroker.
+#
+# Runs the RSI2, BBands and Moving Averages strategies with each broker (and
+# the same commission and slippage) against the same data file and compares
+# every fill, the final portfolio value, trades, drawdown and Sharpe. Exits OK
+# when every strategy matches, CRITICAL otherwise, or when a strategy made no
+# fills at all (then there was nothing to compare).
+
+from __future__ import print_function
+
+from pyalgotrade import broker
+
+from _functions import LoadBars
+from _functions import BuildFeed
+from _functions import AttachAnalyzers
+
+from _broker import CreateBroker
+
+from rsi2 import RSI2
+from BBands import BBands
+from moving_averages import MovingAverages
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "Market Broker Parity"
+
+##############################################################
+def run_event(brokerName, capital, commission, slippageShare, bars, ticker, build):
+
+    feed = BuildFeed(ticker, bars)
+    brk = CreateBroker(brokerName, capital, feed, commission, slippageShare)
+
+    fills = []
+    def on_order_event(broker_, orderEvent):
+        if orderEvent.getEventType() in (broker.OrderEvent.Type.PARTIALLY_FILLED, broker.OrderEvent.Type.FILLED):
+            execInfo = orderEvent.getEventInfo()
+            fills.append((execInfo.getDateTime(), orderEvent.getOrder().getAction(), execInfo.getPrice(), execInfo.getQuantity(), execInfo.getCommission()))
+    brk.getOrderUpdatedEvent().subscribe(on_order_event)
+
+    strat = build(feed, brk)
+    retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
+
+    started = time.time()
+    strat.run()
+
+    return {
+        'run_time': time.time() - started,
+        'fills': fills,
+        'final_portfolio_value': strat.getResult(),
+        'sharpe_ratio': sharpeRatioAnalyzer.getSharpeRatio(0.05),
+        'max_drawdown': drawDownAnalyzer.getMaxDrawDown(),
+        'total_trades': tradesAnalyzer.getCount(),
+    }
+
+def compare(name, stock, market, tolerance):
+
+    if not stock['fills'] and not market['fills']:
+        print("%s: NO FILLS - nothing to compare" % name)
+        return False
+
+    mismatches = []
+
+    if len(stock['fills']) != len(market['fills']):
+        mismatches.append("fills: %d != %d" % (len(stock['fills']), len(market['fills'])))
+    else:
+        for stockFill, marketFill in zip(stock['fills'], market['fills']):
+            if stockFill[:2] != marketFill[:2] or stockFill[3] != marketFill[3] or not np.allclose(
+                    [stockFill[2], stockFill[4]], [marketFill[2], marketFill[4]], rtol=tolerance, atol=tolerance):
+                mismatches.append("first differing fill: %s != %s" % (stockFill, marketFill))
+                break
+
+    if stock['total_trades'] != market['total_trades']:
+        mismatches.append("total_trades: %s != %s" % (stock['total_trades'], market['total_trades']))
+
+    for key in ['final_portfolio_value', 'sharpe_ratio', 'max_drawdown']:
+        if not np.isclose(stock[key], market[key], rtol=tolerance, atol=tolerance):
+            mismatches.append("%s: %.8f != %.8f" % (key, stock[key], market[key]))
+
+    if mismatches:
+        print("%s: MISMATCH - %s" % (name, ", ".join(mismatches)))
+    else:
+        print("%s: OK - %d fills, final value %.2f, run time %.4fs (stock) / %.4fs (market)" % (
+            name, len(stock['fills']), stock['final_portfolio_value'], stock['run_time'], market['run_time']))
+
+    return not mismatches
+
+##############################################################
+def run_parity(ticker, shares, capital, dataFile, rsi2Params, bandsPeriod, smaPeriod, commission, slippageShare, tolerance):
+
+    bars = LoadBars(dataFile)
+    ok = True
+
+    # The strategies take their broker in place of their capital.
+    strategies = [
+        ("RSI2", lambda feed, brk: RSI2(feed, ticker, shares, brk, dataFile, *rsi2Params)),
+        ("BBands", lambda feed, brk: BBands(feed, ticker, shares, brk, dataFile, bandsPeriod, commission, slippageShare)),
+        ("Moving Averages", lambda feed, brk: MovingAverages(feed, ticker, shares, brk, smaPeriod, dataFile)),
+    ]
+
+    for name, build in strategies:
+        ok &= compare(name,
+            run_event("stock", capital, commission, slippageShare, bars, ticker, build),
+            run_event("market", capital, commission, slippageShare, bars, ticker, build), tolerance)
+
+    return ok
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the check against.")
+    parser.add_argument("-s", "--shares", help="The number of imaginary shares to purchase.", default="100")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).", default="1000000")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.", default="yahoo_finance_data")
+    parser.add_argument("-f", "--file", help="Use this CSV file instead of the ticker's historical data.")
+    parser.add_argument("-e", "--entrySMA", help="RSI2 entry sma period.", default="200")
+    parser.add_argument("-x", "--exitSMA", help="RSI2 exit sma period.", default="5")
+    parser.add_argument("-r", "--rsiPeriod", help="RSI2 rsi period.", default="2")
+    parser.add_argument("-os", "--overSoldThreshold", help="RSI2 over sold threshold.", default="10")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="RSI2 over bought threshold.", default="90")
+    parser.add_argument("-b", "--bandsPeriod", help="BBands period.", default="20")
+    parser.add_argument("-p", "--period", help="Moving Averages sma period.", default="20")
+    parser.add_argument("--commission", help="Commission charged by both brokers, as a share of each fill's value (e.g. 0.001).", default="0")
+    parser.add_argument("--slippage", help="Slippage of both brokers, as a share of the fill price (e.g. 0.0005).", default="0")
+    parser.add_argument("--tolerance", help="Relative tolerance for the floating point figures.", default="1e-9")
+
+    args = parser.parse_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+
+    dataFile = args.file or ""
+    if not dataFile and args.data_format == "yahoo_finance_data":
+        dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
+
+    if not dataFile:
+        print("UNKNOWN - No data file for data_format " + str(args.data_format))
+        sys.exit(UNKNOWN)
+
+    rsi2Params = (int(args.entrySMA), int(args.exitSMA), int(args.rsiPeriod), int(args.overSoldThreshold), int(args.overBoughtThreshold))
+
+    if run_parity(ticker, int(args.shares), int(args.capital), dataFile, rsi2Params, int(args.bandsPeriod), int(args.period),
+                  float(args.commission), float(args.slippage), float(args.tolerance)):
+        print("OK - market broker matches the stock broker")
+        sys.exit(OK)
+    else:
+        print("CRITICAL - market broker differs from the stock broker, or a strategy made no fills")
+        sys.exit(CRITICAL)
@@ -0,0 +1,49 @@
+#!/usr/bin/python3.9
+
+# Thin Nagios plugin for backtests run by run_backtests.py.
+#
+# Reads the result file the batch runner left for the ticker, prints the
+# backtest's output and exits with its Nagios status.
+
+from __future__ import print_function
+
+from _results import ReadResult
+from _results import ResultFile
+
+import argparse
+import sys
+import time
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-t", "--ticker", help="Ticker of the backtest to report on.")
+    parser.add_argument("-a", "--max_age", help="Report UNKNOWN if the result is older than this many seconds.")
+
+    # The arguments of the backtest itself may be passed along (e.g. @scriptFile), they are ignored.
+    args, unknown = parser.parse_known_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    try:
+        result = ReadResult(args.ticker)
+    except (OSError, ValueError):
+        print("UNKNOWN - No backtest result for " + args.ticker + " (" + ResultFile(args.ticker) + ")")
+        sys.exit(UNKNOWN)
+
+    if args.max_age and time.time() - result['finished'] > int(args.max_age):
+        print("UNKNOWN - Backtest result for " + args.ticker + " is older than " + args.max_age + " seconds")
+        sys.exit(UNKNOWN)
+
+    print(result['output'])
+    sys.exit(result['exit_code'])
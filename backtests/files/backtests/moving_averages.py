@@ -3,26 +3,35 @@
 from __future__ import print_function
 
 from pyalgotrade import strategy
-from pyalgotrade.barfeed import yahoofeed
 
-from pyalgotrade.technical import ma
 from pyalgotrade.technical import cross
 
-from pyalgotrade.stratanalyzer import sharpe
-from pyalgotrade.stratanalyzer import drawdown
-from pyalgotrade.stratanalyzer import trades
-from pyalgotrade import plotter
-import pyalgotrade
-
 from _functions import GenerateJSONReport 
+from _functions import AttachAnalyzers
+from _functions import RunResumable
+from _functions import AddDataSeries
+from _functions import CreatePlotter
 
-import argparse
-import sys
-import os
+from _broker import CreateBroker
+
+from _memo import RunMemoized
+
+from _store import RecordRun
+from _store import RunRecord
 
-import time
+from _resample import Resample
+from _resample import DataFrequency
+from _resample import frequencies
 
-import pandas as pd
+import _indicators
+
+from _profile import PhaseTimer
+from _profile import Perfdata
+from _profile import WriteProfile
+from _profile import RunCProfiled
+
+import argparse
+import sys
 
 # Nagios constants. 
 
@@ -41,12 +50,12 @@ class MovingAverages(strategy.BacktestingStrategy):
 
         self.__position = None
         self.__instrument = instrument
+        self.__shares = shares
         self.__prices = feed[instrument].getPriceDataSeries()
 
-        # We'll use adjusted close values instead of regular close values.
-        self.setUseAdjustedValues(True)
+        # The feed's bars already hold the adjusted values (see _datacache.py).
 
-        self.__sma = ma.SMA(self.__prices, smaPeriod)
+        self.__sma = _indicators.SMA(self.__prices, smaPeriod, dataFile)
         
         self.setDebugMode(False)
 
@@ -88,7 +97,7 @@ class MovingAverages(strategy.BacktestingStrategy):
             if cross.cross_above(self.__prices, self.__sma) > 0:
 
                 # Enter a buy market order for n shares. The order is good till canceled.
-                self.__position = self.enterLong(self.__instrument, shares, True)
+                self.__position = self.enterLong(self.__instrument, self.__shares, True)
 
         # Check if we have to exit the position.
         elif cross.cross_below(self.__prices, self.__sma) > 0 and not self.__position.exitActive():
@@ -98,50 +107,75 @@ class MovingAverages(strategy.BacktestingStrategy):
         # END - THIS IS BASICALLY THE CRUX OF THE BACKTEST'S LOGIC
         ###############################################################
         
-def run_strategy(ticker, shares, capital, smaPeriod, dataFile):
+def run_strategy(ticker, shares, capital, smaPeriod, dataFile, engine="event", resume=True, plot=True, bounded=False, broker="stock", commission=0.0, slippage=0.0):
 
-    # Load the bar feed from the CSV file
-    feed = yahoofeed.Feed()
-    feed.addBarsFromCSV(ticker, dataFile)
+    timer = PhaseTimer()
 
-    # Evaluate the strategy with the feed.
-    strat = MovingAverages(feed, ticker, shares, capital, smaPeriod, dataFile)
-    
-    # Attach  analyzers to the strategy before executing it.
-    retAnalyzer = pyalgotrade.stratanalyzer.returns.Returns()
-    strat.attachAnalyzer(retAnalyzer)
-
-    sharpeRatioAnalyzer = sharpe.SharpeRatio()
-    strat.attachAnalyzer(sharpeRatioAnalyzer)
-   
-    drawDownAnalyzer = drawdown.DrawDown()
-    strat.attachAnalyzer(drawDownAnalyzer)
-    
-    tradesAnalyzer = trades.Trades()
-    strat.attachAnalyzer(tradesAnalyzer)
+    if engine == "vectorized":
 
-    # Attach the plotter
-    plot = plotter.StrategyPlotter(strat)
+        # Run the array based engine instead of the pyalgotrade event loop.
+        with timer.phase("load"):
+            import _vectorized
+            columns = _vectorized.LoadColumns(dataFile)
 
-    plt = plotter.StrategyPlotter(strat, True, True, True)
-    plt.getInstrumentSubplot(ticker).addDataSeries("sma", strat.getSMA())
-    plt.getOrCreateSubplot("returns").addDataSeries("Simple returns", retAnalyzer.getReturns())
-    
-    strat.run()
-    
-    # Print out our findings.
-    print("Sharpe Ratio: %.2f" % sharpeRatioAnalyzer.getSharpeRatio(0.05))
+        with timer.phase("run"):
+            strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt = _vectorized.RunMovingAverages(
+                columns, shares, capital, smaPeriod)
+
+        if not plot:
+            plt = None
+
+    else:
+
+        def build(feed):
+
+            # Evaluate the strategy with the feed.
+            strat = MovingAverages(feed, ticker, shares, CreateBroker(broker, capital, feed, commission, slippage), smaPeriod, dataFile)
+
+            # Attach  analyzers to the strategy before executing it.
+            retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
 
+            # Attach the plotter
+            plt = None
+            if plot:
+                plt = CreatePlotter(strat, True, True, True)
+                AddDataSeries(plt.getInstrumentSubplot(ticker), "sma", strat.getSMA())
+                AddDataSeries(plt.getOrCreateSubplot("returns"), "Simple returns", retAnalyzer.getReturns())
+
+            return strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt
+
+        # Run the strategy over the historical data (through the binary cache), picking up
+        # from the last run's checkpoint when the data file only gained new bars.
+        strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt = RunResumable(
+            __file__, [ticker, shares, capital, smaPeriod, plot, broker, commission, slippage], ticker, dataFile, build, resume, timer, bounded)
+    
     # Generate the JSON report
-    GenerateJSONReport(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt, ticker, capital, dataFile)
+    report = GenerateJSONReport(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt, ticker, capital, dataFile, timer)
+
+    sharpeRatio = sharpeRatioAnalyzer.getSharpeRatio(0.05)
+    maxDrawDown = drawDownAnalyzer.getMaxDrawDown()
+    totalTrades = tradesAnalyzer.getCount()
+
+    # Keep the timings for graphing the backtest cost.
+    WriteProfile(ticker, __file__, engine, timer, sharpeRatio, maxDrawDown, totalTrades)
+
+    # And the run's history (see _store.py).
+    RecordRun(RunRecord(ticker, __file__, engine, {'shares': shares, 'capital': capital, 'smaPeriod': smaPeriod,
+                                'broker': broker, 'commission': commission, 'slippage': slippage, 'frequency': DataFrequency(dataFile)},
+                        dataFile, timer, report))
+
+    # Print out our findings, with the results and timings as Nagios perfdata.
+    print("Sharpe Ratio: %.2f | %s" % (sharpeRatio, Perfdata(timer, sharpeRatio, maxDrawDown, totalTrades)))
     
-    if sharpeRatioAnalyzer.getSharpeRatio(0.05) > 0: 
-       sys.exit(OK)
+    if sharpeRatio > 0: 
+       return OK
     else:
-       sys.exit(CRITICAL)
+       return CRITICAL
 
 
-if __name__ == "__main__":
+# Parse and validate the Nagios arguments, then run the backtest.
+# Returns the Nagios exit code.
+def main(argv=None):
 
     parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
     
@@ -150,28 +184,37 @@ if __name__ == "__main__":
     parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).")
     parser.add_argument("-p", "--period", help="The sma period that we will use as the basis for the cross over threshold.")
     parser.add_argument("-n", "--data_format", help="The provider of the historical data.")
+    parser.add_argument("--engine", help="The backtest engine to use: event (pyalgotrade, default) or vectorized (NumPy).", choices=["event", "vectorized"], default="event")
+    parser.add_argument("--no_plot", "--no-plot", help="Skip the plot (no <ticker>.png is written).", action="store_true")
+    parser.add_argument("--bounded", help="Stream the bars and keep only rolling or downsampled series, so memory stays flat however long the history (event engine, not checkpointed).", action="store_true")
+    parser.add_argument("--broker", help="The broker the event engine trades with: stock (pyalgotrade, default) or market (market orders only, lighter, see _broker.py).", choices=["stock", "market"], default="stock")
+    parser.add_argument("--commission", help="Commission charged on every fill, as a share of its value (e.g. 0.001, event engine).", default="0")
+    parser.add_argument("--slippage", help="Slippage of every fill, as a share of its price (e.g. 0.0005, event engine).", default="0")
+    parser.add_argument("--frequency", help="Run on bars of another frequency, aggregated once from the historical data: " + ", ".join(frequencies) + " (default the data's own).")
+    parser.add_argument("--cprofile", help="Profile the run with cProfile, dumping the stats to /shark/.tmp/backtest.profile.<ticker>.pstats (implies --no_cache).", action="store_true")
+    parser.add_argument("--no_cache", help="Always run the backtest from the start, ignoring (and not storing) memoized results.", action="store_true")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if not args.ticker:
         print ("UNKNOWN - No ticker specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.shares:
         print("UNKNOWN - No shares specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.capital:
         print("UNKNOWN - No capital amount specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.period:
         print("UNKNOWN - No period specified")
-        sys.exit(UNKNOWN)
+        return UNKNOWN
 
     if not args.data_format:
         print("UNKNOWN - No data_format specified")
-        sys.exit(UNKNOWN)       
+        return UNKNOWN       
         
     ticker = args.ticker 
     shares = int(args.shares)
@@ -183,4 +226,37 @@ if __name__ == "__main__":
     if data_format == "yahoo_finance_data":
         dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
         
-    run_strategy(ticker, int(shares), int(capital), int(period), dataFile)
+    commission = float(args.commission)
+    slippage = float(args.slippage)
+
+    # Weekly, monthly or N minute bars are built once, next to the historical data (see _resample.py).
+    if args.frequency and dataFile:
+        try:
+            dataFile = Resample(dataFile, args.frequency)
+        except (OSError, ValueError) as e:
+            print("UNKNOWN - " + str(e))
+            return UNKNOWN
+
+    if args.engine == "vectorized" and (commission or slippage):
+        print("UNKNOWN - Commission and slippage need the event engine")
+        return UNKNOWN
+
+    if args.cprofile:
+        return RunCProfiled(ticker, lambda: run_strategy(ticker, int(shares), int(capital), int(period), dataFile, args.engine, resume=False, plot=not args.no_plot, bounded=args.bounded,
+            broker=args.broker, commission=commission, slippage=slippage))
+
+    if args.no_cache:
+        return run_strategy(ticker, int(shares), int(capital), int(period), dataFile, args.engine, resume=False, plot=not args.no_plot, bounded=args.bounded,
+            broker=args.broker, commission=commission, slippage=slippage)
+
+    # Reuse the result of an identical earlier run (same code, arguments and data).
+    memoArgs = {name: value for name, value in vars(args).items() if name != 'no_cache'}
+
+    return RunMemoized(__file__, memoArgs, ticker, dataFile,
+        lambda: run_strategy(ticker, int(shares), int(capital), int(period), dataFile, args.engine, plot=not args.no_plot, bounded=args.bounded,
+            broker=args.broker, commission=commission, slippage=slippage))
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
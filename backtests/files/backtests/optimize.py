@@ -0,0 +1,420 @@
+#!/usr/bin/python3.9
+
+# Adaptive parameter search for the backtests (RSI2, BBands and Moving
+# Averages), finding high Sharpe ratio parameters in a fraction of the runs
+# of a full grid (rsi2_sweep.py).
+#
+# The search runs in rounds of successive halving:
+#   - a round draws --candidates parameter sets from the given ranges, half
+#     at random and half as neighbours (one parameter moved a step or two) of
+#     the best sets found so far,
+#   - they are all backtested on the most recent bars of the history only,
+#     the best 1/--eta of them are backtested again on --eta times as many
+#     bars, and so on up to the full history,
+#   - the search stops when --patience rounds in a row haven't improved the
+#     best full history Sharpe ratio by --min_delta, or after --rounds rounds.
+# Each rung's backtests run on a process pool.
+#
+# Every backtest is appended to a trial journal as it finishes,
+# /shark/.tmp/optimize.<strategy file>.<ticker>.journal. The search is
+# seeded, so running it again replays the same rounds and takes the journaled
+# results instead of backtesting them again: an interrupted search resumes
+# where it stopped, and a finished one can be extended with more rounds (or
+# another seed). The journal starts over when the strategy code, its
+# arguments or the data change.
+#
+#   optimize.py -f rsi2.py -t BTC-USD -c 10000000 -n yahoo_finance_data -e 100:300:10 -x 3:15 -r 2:5 -os 5:30 -ob 70:95
+#   optimize.py -f BBands.py -t BTC-USD -c 10000000 -n yahoo_finance_data -b 5:60
+#   optimize.py -f moving_averages.py -t BTC-USD -s 100 -c 10000000 -n yahoo_finance_data -p 5:100
+
+from __future__ import print_function
+
+from _functions import LoadBars
+from _functions import BuildFeed
+from _functions import AttachAnalyzers
+
+from _memo import MemoKey
+
+from _report import ResultsFile
+
+from rsi2 import RSI2
+from BBands import BBands
+from moving_averages import MovingAverages
+
+from rsi2_sweep import parse_range
+
+import argparse
+import multiprocessing
+import random
+import json
+import sys
+import os
+import csv
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "Parameter Optimizer"
+
+journalDir = "/shark/.tmp"
+
+# The tunable parameters of each strategy, its class and its constructor
+# arguments (after the feed).
+optimizeStrategies = {
+    "rsi2.py": (["entrySMA", "exitSMA", "rsiPeriod", "overSoldThreshold", "overBoughtThreshold"], RSI2,
+        lambda ticker, shares, capital, dataFile, params: [ticker, shares, capital, dataFile] + list(params)),
+    "BBands.py": (["bandsPeriod"], BBands,
+        lambda ticker, shares, capital, dataFile, params: [ticker, shares, capital, dataFile] + list(params)),
+    "moving_averages.py": (["period"], MovingAverages,
+        lambda ticker, shares, capital, dataFile, params: [ticker, shares, capital, params[0], dataFile]),
+}
+
+resultColumns = ["sharpe_ratio", "max_drawdown", "total_trades", "final_portfolio_value", "cumulative_returns"]
+
+def JournalFile(strategyFile, ticker):
+    return os.path.join(journalDir, "optimize." + strategyFile + "." + ticker + ".journal")
+
+##############################################################
+# The trial journal: a header line with the key of what the trials depend on,
+# then one JSON line per backtest.
+class TrialJournal(object):
+
+    def __init__(self, path, key, fresh=False):
+
+        self.__trials = {}
+
+        if not fresh:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    if json.loads(f.readline()).get('key') == key:
+                        for line in f:
+                            # A line cut short by an interrupted run is just left out.
+                            try:
+                                trial = json.loads(line)
+                            except ValueError:
+                                continue
+                            self.__trials[self.__trialKey(trial['params'], trial['bars'])] = trial
+            except (OSError, ValueError, AttributeError):
+                pass
+
+        self.__file = open(path, 'w', encoding='utf-8')
+        self.__file.write(json.dumps({'key': key}) + "\n")
+        for trial in self.__trials.values():
+            self.__file.write(json.dumps(trial) + "\n")
+        self.__file.flush()
+
+    def __trialKey(self, params, bars):
+        return (tuple(params), bars)
+
+    def get(self, params, bars):
+        return self.__trials.get(self.__trialKey(params, bars))
+
+    def add(self, trial):
+
+        self.__trials[self.__trialKey(trial['params'], trial['bars'])] = trial
+        self.__file.write(json.dumps(trial) + "\n")
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+##############################################################
+# Worker state - the bars are loaded once by the parent and
+# handed to each worker process when the pool starts.
+_bars = None
+_strategyFile = None
+_ticker = None
+_shares = None
+_capital = None
+_dataFile = None
+
+def init_worker(bars, strategyFile, ticker, shares, capital, dataFile):
+
+    global _bars, _strategyFile, _ticker, _shares, _capital, _dataFile
+
+    _bars = bars
+    _strategyFile = strategyFile
+    _ticker = ticker
+    _shares = shares
+    _capital = capital
+    _dataFile = dataFile
+
+##############################################################
+# strategyClass, trading only from tradeFrom on. Its indicators still see (and
+# are warmed up by) the bars before.
+def WarmedUpClass(strategyClass):
+
+    class WarmedUp(strategyClass):
+
+        tradeFrom = None
+
+        def onBars(self, bars):
+            if self.tradeFrom is None or bars.getDateTime() >= self.tradeFrom:
+                strategyClass.onBars(self, bars)
+
+    WarmedUp.__name__ = strategyClass.__name__ + "WarmedUp"
+
+    return WarmedUp
+
+# Backtest a parameter set on the last bars of the history. As many bars as
+# the largest parameter (the longest indicator period) before them warm up
+# the indicators, so that short rungs don't favour the short periods.
+def run_trial(task):
+
+    params, bars = task
+
+    warmup = min(len(_bars) - bars, max(params))
+
+    names, strategyClass, arguments = optimizeStrategies[_strategyFile]
+
+    feed = BuildFeed(_ticker, _bars[-(bars + warmup):])
+    strat = WarmedUpClass(strategyClass)(feed, *arguments(_ticker, _shares, _capital, _dataFile, params))
+    if warmup > 0:
+        strat.tradeFrom = _bars[-bars].getDateTime()
+
+    retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
+
+    strat.run()
+
+    return {
+        'params': list(params),
+        'bars': bars,
+        'sharpe_ratio': sharpeRatioAnalyzer.getSharpeRatio(0.05),
+        'max_drawdown': drawDownAnalyzer.getMaxDrawDown() * 100,
+        'total_trades': tradesAnalyzer.getCount(),
+        'final_portfolio_value': strat.getResult(),
+        'cumulative_returns': retAnalyzer.getCumulativeReturns()[-1] * 100,
+        }
+
+# Rank NaN Sharpe ratios (no trades, or a single day) last.
+def sharpe_key(trial):
+    value = trial['sharpe_ratio']
+    return value if value == value else float('-inf')
+
+##############################################################
+# The bars of each rung, from the smallest up to the whole history.
+def make_rungs(bars, eta, minBars):
+
+    rungs = [bars]
+    while rungs[0] // eta >= minBars:
+        rungs.insert(0, rungs[0] // eta)
+
+    return rungs
+
+# Draw count parameter sets (as tuples of grid indexes) not in seen, half of
+# them around the best ones. Fewer when the grid runs out.
+def draw_candidates(rng, grid, best, seen, count):
+
+    candidates = []
+
+    for attempt in range(count * 20):
+
+        if len(candidates) >= count:
+            break
+
+        # Every other draw, so that a crowded neighbourhood doesn't use up the attempts.
+        if best and len(candidates) < count // 2 and attempt % 2 == 0:
+            # A neighbour of one of the best: move one or two parameters a step or two.
+            indexes = list(rng.choice(best))
+            for i in rng.sample(range(len(grid)), min(len(grid), rng.choice([1, 2]))):
+                indexes[i] = min(len(grid[i]) - 1, max(0, indexes[i] + rng.choice([-2, -1, 1, 2])))
+        else:
+            indexes = [rng.randrange(len(values)) for values in grid]
+
+        indexes = tuple(indexes)
+        if indexes not in seen:
+            seen.add(indexes)
+            candidates.append(indexes)
+
+    return candidates
+
+##############################################################
+def run_optimizer(strategyFile, ticker, shares, capital, dataFile, grid, processes, journal, eta, candidates, rounds, patience, minDelta, minBars, seed, resultsFile, top):
+
+    params = optimizeStrategies[strategyFile][0]
+    gridValues = [grid[p] for p in params]
+    gridSize = 1
+    for values in gridValues:
+        gridSize *= len(values)
+
+    # Parse the CSV once, every trial builds its feed from these bars.
+    bars = LoadBars(dataFile)
+
+    rungs = make_rungs(len(bars), eta, minBars)
+
+    rng = random.Random(seed)
+    seen = set()
+    finished = []
+    best = None
+    staleRounds = 0
+    trials = 0
+    replayed = 0
+    cost = 0.0
+
+    pool = multiprocessing.Pool(processes, init_worker, (bars, strategyFile, ticker, shares, capital, dataFile))
+    try:
+
+        for round_ in range(1, rounds + 1):
+
+            # Around the best few parameter sets of the full history.
+            leaders = [tuple(gridValues[i].index(v) for i, v in enumerate(trial['params'])) for trial in finished[:max(1, candidates // eta)]]
+            survivors = draw_candidates(rng, gridValues, leaders, seen, candidates)
+            if not survivors:
+                break
+
+            for rung, rungBars in enumerate(rungs):
+
+                tasks = []
+                results = []
+                for indexes in survivors:
+                    values = [gridValues[i][j] for i, j in enumerate(indexes)]
+                    trial = journal.get(values, rungBars)
+                    if trial is None:
+                        tasks.append((values, rungBars))
+                    else:
+                        results.append(trial)
+
+                for trial in pool.imap_unordered(run_trial, tasks):
+                    journal.add(trial)
+                    results.append(trial)
+
+                trials += len(survivors)
+                replayed += len(survivors) - len(tasks)
+                cost += len(survivors) * rungBars / float(len(bars))
+
+                results.sort(key=sharpe_key, reverse=True)
+
+                if rung < len(rungs) - 1:
+                    keep = set(tuple(trial['params']) for trial in results[:max(1, len(results) // eta)])
+                    survivors = [indexes for indexes in survivors if tuple(gridValues[i][j] for i, j in enumerate(indexes)) in keep]
+
+            finished = sorted(finished + results, key=sharpe_key, reverse=True)
+
+            # Early stopping.
+            if best is None or sharpe_key(finished[0]) > sharpe_key(best) + minDelta:
+                best = finished[0]
+                staleRounds = 0
+            else:
+                staleRounds += 1
+
+            print("Round %d: best Sharpe %.2f after %d trials" % (round_, finished[0]['sharpe_ratio'], trials))
+
+            if staleRounds >= patience:
+                break
+
+    finally:
+        pool.close()
+        pool.join()
+        journal.close()
+
+    with open(resultsFile, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=["rank"] + params + resultColumns)
+        writer.writeheader()
+        for rank, trial in enumerate(finished, 1):
+            row = dict(zip(params, trial['params']), rank=rank)
+            for col in resultColumns:
+                row[col] = trial[col]
+            for col in ["sharpe_ratio", "max_drawdown", "final_portfolio_value", "cumulative_returns"]:
+                row[col] = "{:.2f}".format(row[col])
+            writer.writerow(row)
+
+    print("Ran %d trials (%d from the journal), the cost of %.0f full backtests against %d for the grid, results written to %s" % (
+        trials, replayed, cost, gridSize, resultsFile))
+    for rank, trial in enumerate(finished[:top], 1):
+        print("%3d. %s - Sharpe: %.2f, Max Drawdown: %.2f%%, Trades: %d" % (
+            rank, " ".join("%s=%d" % (p, v) for p, v in zip(params, trial['params'])),
+            trial['sharpe_ratio'], trial['max_drawdown'], trial['total_trades']))
+
+    if best is not None and best['sharpe_ratio'] > 0:
+       return OK
+    else:
+       return CRITICAL
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-f", "--file", help="The backtest to optimize: " + ", ".join(sorted(optimizeStrategies)) + ".", choices=sorted(optimizeStrategies))
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the optimizer against.")
+    parser.add_argument("-s", "--shares", help="The number of imaginary shares to purchase.", default="0")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.")
+    parser.add_argument("-e", "--entrySMA", help="Range of entry sma periods, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-x", "--exitSMA", help="Range of exit sma periods, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-r", "--rsiPeriod", help="Range of rsi periods, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-os", "--overSoldThreshold", help="Range of over sold RSI thresholds, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="Range of over bought RSI thresholds, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-b", "--bandsPeriod", help="Range of bollinger band periods, start:stop[:step] or a,b,c (BBands.py)")
+    parser.add_argument("-p", "--period", help="Range of sma periods, start:stop[:step] or a,b,c (moving_averages.py)")
+    parser.add_argument("--eta", help="Keep the best 1/eta of each rung, on eta times as many bars.", default="3")
+    parser.add_argument("--candidates", help="Parameter sets drawn each round.", default="27")
+    parser.add_argument("--rounds", help="The most rounds to run.", default="10")
+    parser.add_argument("--patience", help="Stop after this many rounds without a better Sharpe ratio.", default="3")
+    parser.add_argument("--min_delta", help="The least Sharpe ratio gain that counts as better.", default="0.01")
+    parser.add_argument("--min_bars", help="Bars of the smallest rung.", default="252")
+    parser.add_argument("--seed", help="Seed of the search.", default="0")
+    parser.add_argument("--fresh", help="Start a new trial journal instead of resuming the last one.", action="store_true")
+    parser.add_argument("-j", "--processes", help="Number of worker processes (defaults to the number of cores).")
+    parser.add_argument("-o", "--output", help="Where to write the ranked results table (CSV).")
+    parser.add_argument("--top", help="Number of ranked results to print.", default="10")
+
+    args = parser.parse_args()
+
+    if not args.file:
+        print ("UNKNOWN - No file specified")
+        sys.exit(UNKNOWN)
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    if not args.capital:
+        print("UNKNOWN - No capital amount specified")
+        sys.exit(UNKNOWN)
+
+    if not args.data_format:
+        print("UNKNOWN - No data_format specified")
+        sys.exit(UNKNOWN)
+
+    grid = {}
+    for param in optimizeStrategies[args.file][0]:
+
+        value = getattr(args, param)
+        if not value:
+            print("UNKNOWN - No " + param + " range specified")
+            sys.exit(UNKNOWN)
+
+        try:
+            grid[param] = sorted(set(parse_range(value)))
+        except ValueError:
+            print("UNKNOWN - Invalid " + param + " range: " + value)
+            sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+    shares = int(args.shares)
+    capital = int(args.capital)
+    data_format = args.data_format
+    processes = int(args.processes) if args.processes else None
+
+    dataFile = ""
+    if data_format == "yahoo_finance_data":
+        dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
+
+    if not os.path.exists(dataFile):
+        print("UNKNOWN - No historical data for " + ticker)
+        sys.exit(UNKNOWN)
+
+    # The trials depend on the strategy (and helper) code, its fixed arguments and the data.
+    key = MemoKey(os.path.join(os.path.dirname(os.path.abspath(__file__)), args.file),
+                  {'ticker': ticker, 'shares': shares, 'capital': capital}, dataFile)
+    journal = TrialJournal(JournalFile(args.file, ticker), key, args.fresh)
+
+    resultsFile = args.output or ResultsFile(ticker, os.path.splitext(args.file)[0] + ".optimize")
+
+    sys.exit(run_optimizer(args.file, ticker, shares, capital, dataFile, grid, processes, journal, int(args.eta), int(args.candidates),
+                           int(args.rounds), int(args.patience), float(args.min_delta), int(args.min_bars), int(args.seed), resultsFile, int(args.top)))
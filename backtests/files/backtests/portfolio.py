@@ -0,0 +1,261 @@
+#!/usr/bin/python3.9
+
+# Portfolio backtest: the configured backtests of several instruments run as
+# one portfolio, sharing a feed and a broker, in a single event loop over
+# their aligned bars (see _portfolio.py). The report covers the portfolio as
+# a whole, plus a line per leg.
+#
+# Each leg is given as <strategy file>:<backtest script file>, the script file
+# holding the leg's arguments as convert_configuration.py writes them:
+#
+#   portfolio.py -l rsi2.py:/shark/.tmp/backtest.scriptFile.BTC-USD -l BBands.py:/shark/.tmp/backtest.scriptFile.ETH-USD
+#
+# convert_configuration.py also writes every configured backtest, with the
+# total capital, to /shark/.tmp/backtest.portfolio:
+#
+#   portfolio.py @/shark/.tmp/backtest.portfolio
+
+from __future__ import print_function
+
+from _functions import GenerateJSONReport
+from _functions import AttachAnalyzers
+from _functions import LoadBars
+from _functions import BuildFeed
+from _functions import CreatePlotter
+
+from _portfolio import Portfolio
+from _portfolio import PortfolioBroker
+from _portfolio import LegClass
+from _portfolio import Allocate
+from _portfolio import allocationPolicies
+
+from _profile import PhaseTimer
+from _profile import Perfdata
+from _profile import WriteProfile
+
+from _store import RecordRun
+from _store import RunRecord
+
+from _resample import Resample
+from _resample import DataFrequency
+from _resample import FrequencyLabel
+from _resample import frequencies
+
+from rsi2 import RSI2
+from BBands import BBands
+from moving_averages import MovingAverages
+
+import argparse
+import os
+import sys
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "Portfolio Backtest"
+
+# How each strategy is built as a leg from its script file arguments.
+legStrategies = {
+    "rsi2.py": (["entrySMA", "exitSMA", "rsiPeriod", "overSoldThreshold", "overBoughtThreshold"],
+        lambda feed, ticker, legBroker, dataFile, args: LegClass(RSI2)(feed, ticker, int(args['shares']), legBroker, dataFile,
+            int(args['entrySMA']), int(args['exitSMA']), int(args['rsiPeriod']), int(args['overSoldThreshold']), int(args['overBoughtThreshold']))),
+    "BBands.py": (["bandsPeriod"],
+        lambda feed, ticker, legBroker, dataFile, args: LegClass(BBands)(feed, ticker, int(args['shares']), legBroker, dataFile,
+            int(args['bandsPeriod']))),
+    "moving_averages.py": (["period"],
+        lambda feed, ticker, legBroker, dataFile, args: LegClass(MovingAverages)(feed, ticker, int(args['shares']), legBroker,
+            int(args['period']), dataFile)),
+}
+
+##############################################################
+# The --key=value arguments of a backtest script file.
+def read_script_file(scriptFile):
+
+    args = {}
+    with open(scriptFile, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("--") and "=" in line:
+                name, value = line[2:].split("=", 1)
+                args[name] = value
+
+    return args
+
+# Returns the legs as dicts, or raises ValueError naming the problem.
+def parse_legs(legSpecs):
+
+    legs = []
+    for legSpec in legSpecs:
+
+        if ":" not in legSpec:
+            raise ValueError("Leg " + legSpec + " is not <strategy file>:<script file>")
+
+        strategyFile, scriptFile = legSpec.split(":", 1)
+        if strategyFile not in legStrategies:
+            raise ValueError("Unsupported strategy " + strategyFile)
+
+        try:
+            args = read_script_file(scriptFile)
+        except OSError as e:
+            raise ValueError("Unable to read " + scriptFile + ": " + str(e))
+
+        for name in ["ticker", "shares", "capital", "data_format"] + legStrategies[strategyFile][0]:
+            if not args.get(name):
+                raise ValueError("No " + name + " specified in " + scriptFile)
+
+        dataFile = ""
+        if args['data_format'] == "yahoo_finance_data":
+            dataFile = "/shark/historical/yahoo_finance_data/" + args['ticker'] + ".csv"
+
+        legs.append({'file': strategyFile, 'script_file': scriptFile, 'ticker': args['ticker'], 'capital': int(args['capital']),
+                     'data_file': dataFile, 'args': args})
+
+    return legs
+
+##############################################################
+# Report sections beyond the usual ones: the legs and the aligned timeline.
+def portfolio_sections(portfolio, legs, allocations, dateTimes, dataFormats):
+
+    sections = {}
+    sections['portfolio_instruments'] = []
+
+    for leg, strat, allocation in zip(legs, portfolio.getLegs(), allocations):
+
+        finalValue = strat.getBroker().getEquity()
+
+        sections['portfolio_instruments'].append({
+            'ticker': leg['ticker'],
+            'file': leg['file'],
+            'allocation': "{:.2f}".format(allocation) if allocation is not None else "shared",
+            'final_value': "{:.2f}".format(finalValue),
+            'cumulative_returns': "{:.2f}".format((finalValue / allocation - 1) * 100) if allocation else "",
+            'filled_orders': str(strat.getBroker().getFilledOrders())
+            })
+
+    sections['dataframe_info'] = [{
+            'rows': len(dateTimes),
+            'frequency': ",".join(sorted(set(FrequencyLabel(DataFrequency(leg['data_file'])) for leg in legs))),
+            'start_date': dateTimes[0].strftime("%Y-%m-%d") if dateTimes else "",
+            'end_date': dateTimes[-1].strftime("%Y-%m-%d") if dateTimes else "",
+            'adjusted_close': "true",
+            'provider': ",".join(sorted(set(dataFormats))),
+            'instruments': str(len(legs))
+            }]
+
+    return sections
+
+##############################################################
+def run_portfolio(name, legs, capital, allocation, plot=True):
+
+    timer = PhaseTimer()
+
+    # One feed with every instrument's bars (the pyalgotrade feed aligns them on their dates).
+    with timer.phase("load"):
+        feed = None
+        for leg in legs:
+            if feed is None:
+                feed = BuildFeed(leg['ticker'], LoadBars(leg['data_file']))
+            elif leg['ticker'] not in feed.getRegisteredInstruments():
+                feed.addBarsFromSequence(leg['ticker'], LoadBars(leg['data_file']))
+
+    with timer.phase("setup"):
+
+        portfolio = Portfolio(feed, PortfolioBroker(capital, feed))
+
+        allocations = Allocate(allocation, capital, [leg['capital'] for leg in legs])
+        for leg, cash in zip(legs, allocations):
+            build = legStrategies[leg['file']][1]
+            portfolio.addLeg(leg['ticker'], cash, lambda legBroker, leg=leg: build(feed, leg['ticker'], legBroker, leg['data_file'], leg['args']))
+
+        # Attach  analyzers to the portfolio before executing it.
+        retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(portfolio)
+
+        # Keep the timeline for the report.
+        dateTimes = []
+        portfolio.getBarsProcessedEvent().subscribe(lambda strat, bars: dateTimes.append(bars.getDateTime()))
+
+        # Attach the plotter, with just the portfolio's value.
+        plt = None
+        if plot:
+            plt = CreatePlotter(portfolio, False, False, True)
+
+    with timer.phase("run"):
+        portfolio.run()
+
+    # Generate the JSON report, with the legs and the timeline.
+    sections = portfolio_sections(portfolio, legs, allocations, dateTimes, [leg['args']['data_format'] for leg in legs])
+    report = GenerateJSONReport(portfolio, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt, name, capital, None, timer, sections)
+
+    sharpeRatio = sharpeRatioAnalyzer.getSharpeRatio(0.05)
+    maxDrawDown = drawDownAnalyzer.getMaxDrawDown()
+    totalTrades = tradesAnalyzer.getCount()
+
+    # Keep the timings for graphing the backtest cost.
+    WriteProfile(name, __file__, "portfolio", timer, sharpeRatio, maxDrawDown, totalTrades)
+
+    # And the run's history (see _store.py).
+    RecordRun(RunRecord(name, __file__, "portfolio", {'capital': capital, 'allocation': allocation, 'legs': [leg['file'] + ":" + leg['ticker'] for leg in legs]},
+                        None, timer, report))
+
+    # Print out our findings, with the results and timings as Nagios perfdata.
+    print("Sharpe Ratio: %.2f, %d instruments, final value %.2f | %s" % (sharpeRatio, len(legs), portfolio.getResult(),
+          Perfdata(timer, sharpeRatio, maxDrawDown, totalTrades)))
+
+    if sharpeRatio > 0:
+       return OK
+    else:
+       return CRITICAL
+
+
+# Parse and validate the Nagios arguments, then run the backtest.
+# Returns the Nagios exit code.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-l", "--leg", help="A backtest of the portfolio, as <strategy file>:<backtest script file> (may be repeated).", action="append")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital of the portfolio (in dollars, defaults to the sum of the legs' capital).")
+    parser.add_argument("-a", "--allocation", help="How the capital is split between the legs: " + ", ".join(allocationPolicies) + " (default capital, i.e. as configured).",
+                        choices=allocationPolicies, default="capital")
+    parser.add_argument("--frequency", help="Run every leg on bars of another frequency, aggregated once from the historical data: " + ", ".join(frequencies) + " (default each leg's own --frequency, or its data's).")
+    parser.add_argument("--name", help="Name of the portfolio, used for the report files.", default="PORTFOLIO")
+    parser.add_argument("--no_plot", "--no-plot", help="Skip the plot (no <name>.png is written).", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if not args.leg:
+        print("UNKNOWN - No leg specified")
+        return UNKNOWN
+
+    try:
+        legs = parse_legs(args.leg)
+    except ValueError as e:
+        print("UNKNOWN - " + str(e))
+        return UNKNOWN
+
+    for leg in legs:
+        if not os.path.exists(leg['data_file']):
+            print("UNKNOWN - No historical data for " + leg['ticker'])
+            return UNKNOWN
+
+        # Weekly, monthly or N minute bars are built once, next to the historical data (see _resample.py).
+        frequency = args.frequency or leg['args'].get('frequency')
+        if frequency:
+            try:
+                leg['data_file'] = Resample(leg['data_file'], frequency)
+            except (OSError, ValueError) as e:
+                print("UNKNOWN - " + str(e))
+                return UNKNOWN
+
+    capital = int(args.capital) if args.capital else sum(leg['capital'] for leg in legs)
+
+    return run_portfolio(args.name, legs, capital, args.allocation, plot=not args.no_plot)
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/python3.9
+
+# Query the history of the backtest runs (see _store.py).
+#
+# By default prints, per ticker, strategy, parameters (frequency included) and
+# data file, how a metric went over the selected runs; --runs lists the runs
+# themselves. With --check it is a Nagios trend check, WARNING or CRITICAL when
+# the metric's mean over the runs of any of them falls below the thresholds.
+#
+#   results.py --last 90                          Sharpe ratio over the last 90 runs of every ticker
+#   results.py -t BTC-USD -m max_drawdown --days 30
+#   results.py -t BTC-USD --runs --format json    for the web report
+#   results.py --last 20 --check -w 0.5 -c 0
+
+from __future__ import print_function
+
+import _store
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+runFields = ["ticker", "strategy", "finished", "engine", "params", "data_file", "data_fingerprint"] + [name for name, kind in _store.metricColumns] + ["total_time"]
+
+trendFields = ["ticker", "strategy", "params", "data_file", "runs", "first", "last", "latest", "mean", "min", "max"]
+
+##############################################################
+# The metric of the runs (oldest first) of each ticker and strategy with the
+# same parameters and data in a line, as runs of other parameters or another
+# frequency aren't comparable.
+def trends(runs, metric):
+
+    groups = {}
+    for run in runs:
+        if run[metric] is not None:
+            groups.setdefault((run['ticker'], run['strategy'], run['params'] or "", run['data_file'] or ""), []).append(run)
+
+    rows = []
+    for (ticker, strategy, params, dataFile), group in sorted(groups.items()):
+        values = [run[metric] for run in group]
+        rows.append({
+            'ticker': ticker,
+            'strategy': strategy,
+            'params': params,
+            'data_file': dataFile,
+            'runs': len(values),
+            'first': time.strftime("%Y-%m-%d %H:%M", time.localtime(group[0]['finished'])),
+            'last': time.strftime("%Y-%m-%d %H:%M", time.localtime(group[-1]['finished'])),
+            'latest': values[-1],
+            'mean': sum(values) / len(values),
+            'min': min(values),
+            'max': max(values),
+        })
+
+    return rows
+
+def print_rows(rows, fields, outputFormat):
+
+    if outputFormat == "json":
+        print(json.dumps(rows))
+    elif outputFormat == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            print("  ".join("%s=%s" % (name, "%.4f" % row[name] if isinstance(row[name], float) else row[name]) for name in fields))
+
+##############################################################
+# The ticker and strategy of each trend, with the parameters (and data file)
+# it differs in from the other trends of the same ticker and strategy.
+def trend_labels(rows):
+
+    params = []
+    for row in rows:
+        params.append(json.loads(row['params']) if row['params'] else {})
+        params[-1]['data_file'] = os.path.basename(row['data_file'])
+
+    labels = []
+    for row, rowParams in zip(rows, params):
+        group = [other for r, other in zip(rows, params) if (r['ticker'], r['strategy']) == (row['ticker'], row['strategy'])]
+        differing = sorted(name for name in set().union(*group) if any(other.get(name) != rowParams.get(name) for other in group))
+        labels.append(" ".join([row['ticker'], row['strategy']] + ["%s=%s" % (name, rowParams.get(name)) for name in differing]))
+
+    return labels
+
+def check_trends(rows, metric, warning, critical):
+
+    if not rows:
+        print("UNKNOWN - No runs of %s recorded" % metric)
+        return UNKNOWN
+
+    critical_ = [row for row in rows if critical is not None and row['mean'] < critical]
+    warning_ = [row for row in rows if warning is not None and row['mean'] < warning and row not in critical_]
+
+    # Nagios labels, numbered after the first when a ticker and strategy has many trends.
+    perfdata = []
+    seen = {}
+    for row in rows:
+        label = "%s_%s" % (row['ticker'], row['strategy'].split('.')[0])
+        seen[label] = seen.get(label, 0) + 1
+        perfdata.append("%s=%.4f" % (label if seen[label] == 1 else "%s_%d" % (label, seen[label]), row['mean']))
+    perfdata = " ".join(perfdata)
+
+    labels = dict(zip(map(id, rows), trend_labels(rows)))
+
+    if critical_:
+        status, exitCode, below = "CRITICAL", CRITICAL, critical_
+    elif warning_:
+        status, exitCode, below = "WARNING", WARNING, warning_
+    else:
+        print("OK - Mean %s of %d trends within thresholds | %s" % (metric, len(rows), perfdata))
+        return OK
+
+    print("%s - Mean %s below threshold for %s | %s" % (status, metric, ", ".join("%s (%.2f)" % (labels[id(row)], row['mean']) for row in below), perfdata))
+    return exitCode
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-t", "--ticker", help="Only the runs of this ticker (may be repeated).", action="append")
+    parser.add_argument("-S", "--strategy", help="Only the runs of this strategy file (e.g. rsi2.py).")
+    parser.add_argument("--last", help="Only the last runs of each ticker, strategy, parameters and data file.")
+    parser.add_argument("--days", help="Only the runs of the last days.")
+    parser.add_argument("-m", "--metric", help="The metric to follow.", choices=[name for name, kind in _store.metricColumns], default="sharpe_ratio")
+    parser.add_argument("--runs", help="List the runs instead of the trends.", action="store_true")
+    parser.add_argument("--format", help="Output format.", choices=["table", "csv", "json"], default="table")
+    parser.add_argument("--check", help="Nagios check of the metric's mean against -w / -c.", action="store_true")
+    parser.add_argument("-w", "--warning", help="WARNING when the mean of a trend falls below this.")
+    parser.add_argument("-c", "--critical", help="CRITICAL when the mean of a trend falls below this.")
+    parser.add_argument("--drain", help="Only import the spooled runs.", action="store_true")
+
+    args = parser.parse_args()
+
+    try:
+
+        if args.drain:
+            print("Imported %d runs" % _store.DrainSpool())
+            sys.exit(OK)
+
+        since = time.time() - float(args.days) * 86400 if args.days else None
+        runs = _store.QueryRuns(args.ticker, args.strategy, since, int(args.last) if args.last else None, runFields)
+
+    except (OSError, sqlite3.Error) as e:
+        print("UNKNOWN - Unable to query " + _store.databaseFile + ": " + str(e))
+        sys.exit(UNKNOWN)
+
+    if args.check:
+        sys.exit(check_trends(trends(runs, args.metric), args.metric,
+                              float(args.warning) if args.warning else None, float(args.critical) if args.critical else None))
+
+    if args.runs:
+        print_rows(runs, runFields, args.format)
+    else:
+        print_rows(trends(runs, args.metric), trendFields, args.format)
+
+    sys.exit(OK)
@@ -0,0 +1,191 @@
+#!/usr/bin/python3.9
+
+# Parameter sweep for the RSI2 backtest.
+#
+# Loads the historical data once, then runs every combination of the given
+# parameter ranges through the RSI2 strategy on a process pool, and writes a
+# table of the results ranked by Sharpe ratio.
+#
+# Ranges are given as start:stop[:step] (inclusive) or as a comma separated list, e.g.
+#
+#   rsi2_sweep.py -t BTC-USD -c 10000000 -n yahoo_finance_data -e 150:250:25 -x 5,10 -r 2 -os 5:15:5 -ob 85:95:5
+
+from __future__ import print_function
+
+from _functions import LoadBars
+from _functions import BuildFeed
+from _functions import AttachAnalyzers
+
+from _report import ResultsFile
+
+from rsi2 import RSI2
+
+import argparse
+import itertools
+import multiprocessing
+import sys
+import os
+import csv
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "RSI2 Parameter Sweep"
+
+sweepParams = ["entrySMA", "exitSMA", "rsiPeriod", "overSoldThreshold", "overBoughtThreshold"]
+
+resultColumns = sweepParams + ["sharpe_ratio", "max_drawdown", "total_trades", "final_portfolio_value", "cumulative_returns"]
+
+##############################################################
+# Parse "start:stop[:step]" or "a,b,c" into a list of ints.
+def parse_range(value):
+
+    if ":" in value:
+        parts = [int(p) for p in value.split(":")]
+        if len(parts) == 2:
+            parts.append(1)
+        start, stop, step = parts
+        if step <= 0:
+            raise ValueError("step must be positive")
+        return list(range(start, stop + 1, step))
+
+    return [int(p) for p in value.split(",")]
+
+##############################################################
+# Worker state - the bars are loaded once by the parent and
+# handed to each worker process when the pool starts.
+_bars = None
+_ticker = None
+_shares = None
+_capital = None
+_dataFile = None
+
+def init_worker(bars, ticker, shares, capital, dataFile):
+
+    global _bars, _ticker, _shares, _capital, _dataFile
+
+    _bars = bars
+    _ticker = ticker
+    _shares = shares
+    _capital = capital
+    _dataFile = dataFile
+
+def run_combination(combination):
+
+    entrySMA, exitSMA, rsiPeriod, overSoldThreshold, overBoughtThreshold = combination
+
+    feed = BuildFeed(_ticker, _bars)
+    strat = RSI2(feed, _ticker, _shares, _capital, _dataFile, entrySMA, exitSMA, rsiPeriod, overSoldThreshold, overBoughtThreshold)
+
+    retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
+
+    strat.run()
+
+    result = dict(zip(sweepParams, combination))
+    result['sharpe_ratio'] = sharpeRatioAnalyzer.getSharpeRatio(0.05)
+    result['max_drawdown'] = drawDownAnalyzer.getMaxDrawDown() * 100
+    result['total_trades'] = tradesAnalyzer.getCount()
+    result['final_portfolio_value'] = strat.getResult()
+    result['cumulative_returns'] = retAnalyzer.getCumulativeReturns()[-1] * 100
+
+    return result
+
+##############################################################
+def run_sweep(ticker, shares, capital, dataFile, grid, processes, resultsFile, top):
+
+    combinations = list(itertools.product(*[grid[p] for p in sweepParams]))
+
+    # Parse the CSV once, every combination builds its feed from these bars.
+    bars = LoadBars(dataFile)
+
+    pool = multiprocessing.Pool(processes, init_worker, (bars, ticker, shares, capital, dataFile))
+    try:
+        results = pool.map(run_combination, combinations, chunksize=max(1, len(combinations) // (4 * (processes or os.cpu_count() or 1))))
+    finally:
+        pool.close()
+        pool.join()
+
+    results.sort(key=lambda r: r['sharpe_ratio'], reverse=True)
+
+    with open(resultsFile, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=["rank"] + resultColumns)
+        writer.writeheader()
+        for rank, result in enumerate(results, 1):
+            row = dict(result, rank=rank)
+            for col in ["sharpe_ratio", "max_drawdown", "final_portfolio_value", "cumulative_returns"]:
+                row[col] = "{:.2f}".format(row[col])
+            writer.writerow(row)
+
+    print("Ran %d combinations, results written to %s" % (len(results), resultsFile))
+    for rank, result in enumerate(results[:top], 1):
+        print("%3d. entrySMA=%d exitSMA=%d rsiPeriod=%d overSold=%d overBought=%d - Sharpe: %.2f, Max Drawdown: %.2f%%, Trades: %d" % (
+            rank, result['entrySMA'], result['exitSMA'], result['rsiPeriod'], result['overSoldThreshold'], result['overBoughtThreshold'],
+            result['sharpe_ratio'], result['max_drawdown'], result['total_trades']))
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the sweep against.")
+    parser.add_argument("-s", "--shares", help="The number of imaginary shares to purchase.", default="0")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.")
+    parser.add_argument("-e", "--entrySMA", help="Range of entry sma periods, start:stop[:step] or a,b,c")
+    parser.add_argument("-x", "--exitSMA", help="Range of exit sma periods, start:stop[:step] or a,b,c")
+    parser.add_argument("-r", "--rsiPeriod", help="Range of rsi periods, start:stop[:step] or a,b,c")
+    parser.add_argument("-os", "--overSoldThreshold", help="Range of over sold RSI thresholds, start:stop[:step] or a,b,c")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="Range of over bought RSI thresholds, start:stop[:step] or a,b,c")
+    parser.add_argument("-j", "--processes", help="Number of worker processes (defaults to the number of cores).")
+    parser.add_argument("-o", "--output", help="Where to write the ranked results table (CSV).")
+    parser.add_argument("--top", help="Number of ranked results to print.", default="10")
+
+    args = parser.parse_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    if not args.capital:
+        print("UNKNOWN - No capital amount specified")
+        sys.exit(UNKNOWN)
+
+    if not args.data_format:
+        print("UNKNOWN - No data_format specified")
+        sys.exit(UNKNOWN)
+
+    grid = {}
+    for param in sweepParams:
+
+        value = getattr(args, param)
+        if not value:
+            print("UNKNOWN - No " + param + " range specified")
+            sys.exit(UNKNOWN)
+
+        try:
+            grid[param] = parse_range(value)
+        except ValueError:
+            print("UNKNOWN - Invalid " + param + " range: " + value)
+            sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+    shares = int(args.shares)
+    capital = int(args.capital)
+    data_format = args.data_format
+    processes = int(args.processes) if args.processes else None
+
+    dataFile = ""
+    if data_format == "yahoo_finance_data":
+        dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
+
+    resultsFile = args.output or ResultsFile(ticker, "rsi2.sweep")
+
+    run_sweep(ticker, shares, capital, dataFile, grid, processes, resultsFile, int(args.top))
+
+    sys.exit(OK)
@@ -0,0 +1,178 @@
+#!/usr/bin/python3.9
+
+# Batch runner for every backtest in trading-config.yml.
+#
+# Reads the same configuration file as convert_configuration.py and runs every
+# "backtest" plugin entry in one process tree. The strategy modules are imported
+# once, up front, and the backtests are fanned out across a worker pool. Each
+# backtest writes the usual /shark/reports/<ticker>.* outputs and a result file
+# (see _results.py) that check_backtest_result.py turns into a Nagios status.
+
+from __future__ import print_function
+
+from _results import WriteResult
+
+from _store import DrainSpool
+
+import argparse
+import contextlib
+import importlib
+import io
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import yaml
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+statusNames = {OK: "OK", WARNING: "WARNING", CRITICAL: "CRITICAL", UNKNOWN: "UNKNOWN"}
+
+configFile = "/shark/Shark-Config/config/files/trading-config.yml"
+
+# Plugin keys that are not passed to the backtest script.
+nonArgumentKeys = ["name", "desc", "group", "file"]
+
+##############################################################
+# Build the list of (ticker, script, argv) jobs, using the same arguments
+# convert_configuration.py writes to /shark/.tmp/backtest.scriptFile.<ticker>.
+def load_jobs(configFile, tickers=None):
+
+    with open(configFile, "r") as f:
+        data = yaml.safe_load(f)
+
+    jobs = []
+    for i_data in data:
+
+        instrument = str(i_data['instrument'])
+        if tickers and instrument not in tickers:
+            continue
+
+        for plugin in i_data['plugin']:
+
+            if plugin["name"] != "backtest":
+                continue
+
+            argv = ["--ticker=" + instrument]
+            for argName, argValue in plugin.items():
+                if argName not in nonArgumentKeys:
+                    argv.append("--" + argName + "=" + str(argValue))
+
+            jobs.append((instrument, plugin["file"], argv))
+
+    return jobs
+
+# Modules the backtests import lazily, which long running processes load up front.
+lazyModules = ["pyalgotrade.barfeed.yahoofeed", "pyalgotrade.plotter"]
+
+def strategy_module(scriptFile):
+    return importlib.import_module(os.path.splitext(os.path.basename(scriptFile))[0])
+
+def preload_modules(scriptFiles):
+
+    for scriptFile in scriptFiles:
+        strategy_module(scriptFile)
+
+    for module in lazyModules:
+        importlib.import_module(module)
+
+##############################################################
+# Run a backtest script's main() in-process, capturing its Nagios output.
+# Returns (exit code, output).
+def run_script(scriptFile, argv):
+
+    output = io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            exitCode = strategy_module(scriptFile).main(argv)
+    except SystemExit as e:
+        # argparse exits (with 2, which would read as CRITICAL) on invalid arguments.
+        exitCode = OK if e.code == 0 else UNKNOWN
+    except Exception as e:
+        output.write("UNKNOWN - %s failed: %s: %s\n" % (scriptFile, type(e).__name__, e))
+        exitCode = UNKNOWN
+
+    if exitCode not in statusNames:
+        exitCode = UNKNOWN
+
+    return exitCode, output.getvalue().strip()
+
+def run_job(job):
+
+    ticker, scriptFile, argv = job
+
+    started = time.time()
+    exitCode, output = run_script(scriptFile, argv)
+
+    result = {
+        'ticker': ticker,
+        'file': scriptFile,
+        'args': argv,
+        'exit_code': exitCode,
+        'output': output,
+        'started': started,
+        'finished': time.time(),
+    }
+
+    WriteResult(ticker, result)
+
+    return result
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-f", "--config", help="The trading configuration file.", default=configFile)
+    parser.add_argument("-t", "--ticker", help="Only run the backtests of this instrument (may be repeated).", action="append")
+    parser.add_argument("-j", "--processes", help="Number of worker processes (defaults to the number of cores).")
+
+    args = parser.parse_args()
+
+    try:
+        jobs = load_jobs(args.config, args.ticker)
+    except (OSError, yaml.YAMLError) as e:
+        print("UNKNOWN - Unable to read " + args.config + ": " + str(e))
+        sys.exit(UNKNOWN)
+
+    if not jobs:
+        print("UNKNOWN - No backtests found in " + args.config)
+        sys.exit(UNKNOWN)
+
+    # Import the strategies (and with them pyalgotrade, pandas and matplotlib)
+    # once in the parent, so the workers start warm.
+    preload_modules(sorted(set(job[1] for job in jobs)))
+
+    processes = int(args.processes) if args.processes else None
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(run_job, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Land the batch's runs in the results store (see _store.py).
+    try:
+        DrainSpool()
+    except (OSError, sqlite3.Error):
+        pass
+
+    counts = {}
+    for result in results:
+        status = statusNames[result['exit_code']]
+        counts[status] = counts.get(status, 0) + 1
+        firstLine = result['output'].splitlines()[0] if result['output'] else ""
+        print("%s %s (%s): %s - %s" % (status, result['ticker'], result['file'], firstLine, "%.2fs" % (result['finished'] - result['started'])))
+
+    print("Ran %d backtests: %s" % (len(results), ", ".join("%d %s" % (counts[s], s) for s in sorted(counts))))
+
+    sys.exit(OK)
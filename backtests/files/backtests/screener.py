@@ -0,0 +1,286 @@
+#!/usr/bin/python3.9
+
+# Cross-sectional signal screener.
+#
+# Shows which instruments are signalling right now, without a backtest per
+# ticker: the last --bars bars of every instrument in trading-config.yml are
+# read (through the binary cache, see _datacache.py) into one ticker x time
+# array, and the entry and exit signals of the three strategies are evaluated
+# on the latest bar of every ticker in one vectorized pass:
+#
+#   rsi2_long / rsi2_short   RSI2.enterLongSignal / enterShortSignal
+#   bbands_buy / bbands_sell BBands.onBars (close below the lower band /
+#                            above the upper band)
+#   sma_cross_above / below  MovingAverages.onBars (price crossing the SMA)
+#
+# The same parameters apply to every ticker. The SMAs and bands only need
+# their period of bars; Wilder's RSI depends on all the bars before, but
+# forgets them within a few dozen bars for the usual periods, so --bars is
+# ample.
+#
+# Prints a Nagios status line (WARNING while any instrument signals) with the
+# counts as perfdata, then the ranked table.
+#
+#   screener.py
+#   screener.py -t BTC-USD -t ETH-USD -e 200 -x 5 -r 2 -os 10 -ob 90 -b 20 -p 20
+
+from __future__ import print_function
+
+from _datacache import ReadColumns
+
+from _profile import PhaseTimer
+
+import numpy as np
+
+from scipy import signal
+
+import argparse
+import yaml
+import sys
+import os
+import csv
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "Signal Screener"
+
+configFile = "/shark/Shark-Config/config/files/trading-config.yml"
+
+signalNames = ["rsi2_long", "rsi2_short", "bbands_buy", "bbands_sell", "sma_cross_above", "sma_cross_below"]
+
+tableColumns = ["rank", "ticker", "date", "close", "signals", "rsi", "entry_sma", "exit_sma", "lower_band", "upper_band", "sma"]
+
+##############################################################
+# The instruments of trading-config.yml.
+def read_instruments(path):
+
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f)
+
+    return [str(i_data['instrument']) for i_data in data or []]
+
+##############################################################
+# The last bars' dates and prices of every ticker, right aligned in one array
+# (NaN before the start of a shorter history). Tickers without data are left
+# out and returned apart.
+def load_prices(tickers, dataDir, bars):
+
+    loaded = []
+    missing = []
+    rows = []
+    dates = []
+
+    for ticker in tickers:
+
+        dataFile = os.path.join(dataDir, ticker + ".csv")
+        try:
+            columns = ReadColumns(dataFile, -bars, None, ['date', 'adj_close'])
+        except (OSError, ValueError, KeyError):
+            missing.append(ticker)
+            continue
+
+        if len(columns['date']) == 0:
+            missing.append(ticker)
+            continue
+
+        loaded.append(ticker)
+        rows.append(columns['adj_close'])
+        dates.append(columns['date'][-1])
+
+    prices = np.full((len(rows), bars), np.nan)
+    for i, row in enumerate(rows):
+        prices[i, bars - len(row):] = row
+
+    return loaded, missing, prices, np.array(dates, dtype='datetime64[s]')
+
+##############################################################
+# Indicators over the time axis of a ticker x time array, at the last bar (and
+# the one before, for the crosses). NaN where a ticker has too few bars.
+def LastSMA(prices, period, back=0):
+
+    end = prices.shape[1] - back
+    return prices[:, end - period:end].mean(axis=1) if end >= period else np.full(len(prices), np.nan)
+
+def LastStdDev(prices, period):
+    return prices[:, -period:].std(axis=1) if prices.shape[1] >= period else np.full(len(prices), np.nan)
+
+def _rsi_rows(prices, period):
+
+    # Wilder's RSI like pyalgotrade's: seeded with the simple average of the
+    # first period changes, then smoothed. Every row holds no NaN.
+    change = np.diff(prices, axis=1)
+    gains = np.where(change > 0, change, 0.0)
+    losses = np.where(change < 0, -change, 0.0)
+
+    b = [1.0 / period]
+    a = [1.0, -(period - 1) / float(period)]
+
+    avgGain = gains[:, :period].sum(axis=1) / float(period)
+    avgLoss = losses[:, :period].sum(axis=1) / float(period)
+    if change.shape[1] > period:
+        avgGain = signal.lfilter(b, a, gains[:, period:], axis=1, zi=(avgGain * (period - 1) / float(period))[:, None])[0][:, -1]
+        avgLoss = signal.lfilter(b, a, losses[:, period:], axis=1, zi=(avgLoss * (period - 1) / float(period))[:, None])[0][:, -1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + avgGain / avgLoss)
+    rsi[avgLoss == 0] = 100
+
+    return rsi
+
+def LastRSI(prices, period):
+
+    ret = np.full(len(prices), np.nan)
+
+    # Rows are grouped by the length of their history, the RSI depends on where it starts.
+    lengths = np.sum(~np.isnan(prices), axis=1)
+    for length in np.unique(lengths):
+        if length > period:
+            rows = lengths == length
+            ret[rows] = _rsi_rows(prices[rows][:, prices.shape[1] - length:], period)
+
+    return ret
+
+##############################################################
+# The signals of every ticker at its last bar, as a dict of boolean arrays,
+# and the indicator values behind them.
+def screen(prices, entrySMA, exitSMA, rsiPeriod, overSoldThreshold, overBoughtThreshold, bandsPeriod, smaPeriod):
+
+    close = prices[:, -1]
+    prevClose = prices[:, -2]
+
+    values = {
+        'close': close,
+        'rsi': LastRSI(prices, rsiPeriod),
+        'entry_sma': LastSMA(prices, entrySMA),
+        'exit_sma': LastSMA(prices, exitSMA),
+        'sma': LastSMA(prices, smaPeriod),
+    }
+
+    middle = LastSMA(prices, bandsPeriod)
+    stdDev = LastStdDev(prices, bandsPeriod)
+    values['upper_band'] = middle + stdDev * 2
+    values['lower_band'] = middle - stdDev * 2
+
+    # Crossing the SMA between the last two bars, as pyalgotrade's cross_above/below.
+    prevSMA = LastSMA(prices, smaPeriod, 1)
+
+    # NaN compares False, so tickers short of history don't signal.
+    with np.errstate(invalid='ignore'):
+        signals = {
+            'rsi2_long': (close > values['entry_sma']) & (values['rsi'] <= overSoldThreshold),
+            'rsi2_short': (close < values['entry_sma']) & (values['rsi'] >= overBoughtThreshold),
+            'bbands_buy': close < values['lower_band'],
+            'bbands_sell': close > values['upper_band'],
+            'sma_cross_above': (prevClose - prevSMA < 0) & (close - values['sma'] > 0),
+            'sma_cross_below': (prevClose - prevSMA > 0) & (close - values['sma'] < 0),
+        }
+
+    return signals, values
+
+##############################################################
+def run_screener(tickers, dataDir, bars, params, resultsFile, top, showAll):
+
+    timer = PhaseTimer()
+
+    with timer.phase("load"):
+        loaded, missing, prices, dates = load_prices(tickers, dataDir, bars)
+
+    if not loaded:
+        print("UNKNOWN - No historical data for any of %d instruments" % len(tickers))
+        return UNKNOWN
+
+    with timer.phase("run"):
+
+        signals, values = screen(prices, *params)
+
+        # Most signals first, then the most oversold.
+        counts = np.sum([signals[name] for name in signalNames], axis=0)
+        rsi = np.where(np.isnan(values['rsi']), np.inf, values['rsi'])
+        order = np.lexsort((rsi, -counts))
+
+    rows = []
+    for rank, i in enumerate(order, 1):
+
+        if counts[i] == 0 and not showAll:
+            continue
+
+        row = {'rank': rank, 'ticker': loaded[i], 'date': str(np.datetime_as_string(dates[i], unit='D')),
+               'signals': " ".join(name for name in signalNames if signals[name][i])}
+        for name in ["close", "rsi", "entry_sma", "exit_sma", "lower_band", "upper_band", "sma"]:
+            row[name] = "{:.2f}".format(values[name][i]) if not np.isnan(values[name][i]) else ""
+        rows.append(row)
+
+    if resultsFile:
+        with open(resultsFile, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=tableColumns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    signalling = int(np.sum(counts > 0))
+
+    perfdata = ["instruments=%d" % len(loaded), "missing=%d" % len(missing), "signalling=%d" % signalling]
+    perfdata += ["%s=%d" % (name, np.sum(signals[name])) for name in signalNames]
+    perfdata += ["%s_time=%.4fs" % (name, timer.phases.get(name, 0.0)) for name in ["load", "run"]]
+
+    status = "OK" if signalling == 0 else "WARNING"
+    print("%s - %d of %d instruments signalling | %s" % (status, signalling, len(loaded), " ".join(perfdata)))
+
+    for row in rows[:top]:
+        print("%3d. %-12s %s close %s rsi %s - %s" % (row['rank'], row['ticker'], row['date'], row['close'], row['rsi'], row['signals'] or "no signal"))
+    if missing:
+        print("No historical data for: " + ", ".join(missing))
+
+    return OK if signalling == 0 else WARNING
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-f", "--config", help="The trading configuration listing the instruments.", default=configFile)
+    parser.add_argument("-t", "--ticker", help="Screen this ticker instead of the configured instruments (may be repeated).", action="append")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.", default="yahoo_finance_data")
+    parser.add_argument("--bars", help="The latest bars of each instrument to screen.", default="512")
+    parser.add_argument("-e", "--entrySMA", help="The RSI2 entry sma period.", default="200")
+    parser.add_argument("-x", "--exitSMA", help="The RSI2 exit sma period.", default="5")
+    parser.add_argument("-r", "--rsiPeriod", help="The RSI2 rsi period.", default="2")
+    parser.add_argument("-os", "--overSoldThreshold", help="The RSI2 over sold threshold.", default="10")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="The RSI2 over bought threshold.", default="90")
+    parser.add_argument("-b", "--bandsPeriod", help="The bollinger bands period.", default="20")
+    parser.add_argument("-p", "--period", help="The moving averages sma period.", default="20")
+    parser.add_argument("-o", "--output", help="Where to write the ranked table (CSV).")
+    parser.add_argument("--top", help="Number of ranked instruments to print.", default="20")
+    parser.add_argument("--all", help="Rank every instrument, not just the signalling ones.", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.data_format != "yahoo_finance_data":
+        print("UNKNOWN - Unsupported data_format " + args.data_format)
+        sys.exit(UNKNOWN)
+
+    tickers = args.ticker
+    if not tickers:
+        try:
+            tickers = read_instruments(args.config)
+        except (OSError, yaml.YAMLError, KeyError, TypeError) as e:
+            print("UNKNOWN - Unable to read " + args.config + ": " + str(e))
+            sys.exit(UNKNOWN)
+
+    if not tickers:
+        print("UNKNOWN - No instruments specified")
+        sys.exit(UNKNOWN)
+
+    params = [int(args.entrySMA), int(args.exitSMA), int(args.rsiPeriod), int(args.overSoldThreshold), int(args.overBoughtThreshold),
+              int(args.bandsPeriod), int(args.period)]
+
+    bars = int(args.bars)
+    if bars < max(params[0], params[1], params[2] + 1, params[5], params[6] + 1):
+        print("UNKNOWN - Not enough bars (%d) for the indicator periods" % bars)
+        sys.exit(UNKNOWN)
+
+    sys.exit(run_screener(tickers, "/shark/historical/yahoo_finance_data", bars, params, args.output, int(args.top), args.all))
@@ -0,0 +1,145 @@
+#!/usr/bin/python3.9
+
+# Startup time benchmark for the backtest scripts.
+#
+# For every script, measures in fresh interpreters:
+#   - the cumulative import time of the script's module (python -X importtime),
+#     with the heaviest modules it pulls in, and
+#   - the wall time of running the script without arguments, i.e. the path a
+#     check takes up to its first UNKNOWN.
+# The medians can be written to a JSON file and compared against an earlier
+# one; a slowdown beyond the threshold is reported as WARNING.
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+backtestScripts = ["rsi2.py", "BBands.py", "moving_averages.py"]
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+
+##############################################################
+# Parse python -X importtime output into {module: cumulative microseconds}.
+def parse_importtime(stderr):
+
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        selfTime, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            imports[name.strip()] = int(cumulative)
+
+    return imports
+
+def measure_imports(scriptFile):
+
+    module = os.path.splitext(scriptFile)[0]
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=scriptDir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+
+    imports = parse_importtime(result.stderr)
+
+    return imports.get(module, 0) / 1000.0, imports
+
+def measure_startup(scriptFile):
+
+    started = time.perf_counter()
+    subprocess.run([sys.executable, scriptFile], cwd=scriptDir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return (time.perf_counter() - started) * 1000.0
+
+def run_benchmark(scripts, repeats, top):
+
+    results = {}
+    for scriptFile in scripts:
+
+        importTimes = []
+        startupTimes = []
+        for i in range(repeats):
+            importTime, imports = measure_imports(scriptFile)
+            importTimes.append(importTime)
+            startupTimes.append(measure_startup(scriptFile))
+
+        # Heaviest packages (top level names) the script pulled in on the last run.
+        module = os.path.splitext(scriptFile)[0]
+        packages = {name: micros for name, micros in imports.items() if "." not in name and not name.startswith("_") and name != module}
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+        results[scriptFile] = {
+            'import_ms': round(statistics.median(importTimes), 1),
+            'startup_ms': round(statistics.median(startupTimes), 1),
+            'heaviest_imports_ms': [[name, round(micros / 1000.0, 1)] for name, micros in heaviest],
+        }
+
+    return results
+
+##############################################################
+# Returns the list of regressions against a baseline result file.
+def compare(results, baseline, threshold):
+
+    regressions = []
+    for scriptFile, result in results.items():
+        if scriptFile not in baseline:
+            continue
+        for key in ['import_ms', 'startup_ms']:
+            if result[key] > baseline[scriptFile][key] * (1 + threshold):
+                regressions.append("%s %s %.1fms (baseline %.1fms)" % (scriptFile, key, result[key], baseline[scriptFile][key]))
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-s", "--script", help="Script to benchmark (may be repeated, defaults to the backtests).", action="append")
+    parser.add_argument("-n", "--repeats", help="Runs per script, the median is reported.", default="5")
+    parser.add_argument("--top", help="Number of heaviest imports to list per script.", default="5")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file.")
+    parser.add_argument("-b", "--baseline", help="Compare against the results in this JSON file.")
+    parser.add_argument("--threshold", help="Allowed slowdown against the baseline (0.2 = 20%%).", default="0.2")
+
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print("UNKNOWN - Unable to read baseline " + args.baseline + ": " + str(e))
+            sys.exit(UNKNOWN)
+
+    results = run_benchmark(args.script or backtestScripts, int(args.repeats), int(args.top))
+
+    for scriptFile, result in results.items():
+        print("%-20s import %7.1fms  startup %7.1fms  %s" % (scriptFile, result['import_ms'], result['startup_ms'],
+              ", ".join("%s %.1fms" % (name, ms) for name, ms in result['heaviest_imports_ms'])))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    perfdata = " ".join("'%s'=%.1fms" % (scriptFile, result['startup_ms']) for scriptFile, result in results.items())
+
+    regressions = compare(results, baseline, float(args.threshold)) if baseline else []
+    if regressions:
+        print("WARNING - Startup regressed: " + "; ".join(regressions) + " | " + perfdata)
+        sys.exit(WARNING)
+
+    print("OK - Startup within limits | " + perfdata)
+    sys.exit(OK)
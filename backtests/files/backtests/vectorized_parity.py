@@ -0,0 +1,153 @@
+#!/usr/bin/python3.9
+
+# Parity check between the pyalgotrade event loop and the vectorized engine.
+#
+# Runs the RSI2, BBands and Moving Averages strategies through both engines
+# against the same data file and compares trades, returns, drawdown and Sharpe.
+# Exits OK when every strategy matches, CRITICAL otherwise.
+
+from __future__ import print_function
+
+from _functions import LoadBars
+from _functions import BuildFeed
+from _functions import AttachAnalyzers
+
+from rsi2 import RSI2
+from BBands import BBands
+from moving_averages import MovingAverages
+
+import _vectorized
+
+import argparse
+import sys
+
+import numpy as np
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "Vectorized Engine Parity"
+
+##############################################################
+# Figures compared between the engines.
+def summarize(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer):
+
+    return {
+        'final_portfolio_value': strat.getResult(),
+        'cumulative_returns': retAnalyzer.getCumulativeReturns()[-1],
+        'sharpe_ratio': sharpeRatioAnalyzer.getSharpeRatio(0.05),
+        'max_drawdown': drawDownAnalyzer.getMaxDrawDown(),
+        'longest_drawdown_duration': drawDownAnalyzer.getLongestDrawDownDuration(),
+        'total_trades': tradesAnalyzer.getCount(),
+        'wins': tradesAnalyzer.getProfitableCount(),
+        'losses': tradesAnalyzer.getUnprofitableCount(),
+        'trade_profits': tradesAnalyzer.getAll(),
+        'trade_returns': tradesAnalyzer.getAllReturns(),
+    }
+
+def compare(name, event, vector, tolerance):
+
+    mismatches = []
+
+    for key in ['total_trades', 'wins', 'losses', 'longest_drawdown_duration']:
+        if event[key] != vector[key]:
+            mismatches.append("%s: %s != %s" % (key, event[key], vector[key]))
+
+    for key in ['final_portfolio_value', 'cumulative_returns', 'sharpe_ratio', 'max_drawdown']:
+        if not np.isclose(event[key], vector[key], rtol=tolerance, atol=tolerance):
+            mismatches.append("%s: %.8f != %.8f" % (key, event[key], vector[key]))
+
+    for key in ['trade_profits', 'trade_returns']:
+        if len(event[key]) != len(vector[key]) or not np.allclose(event[key], vector[key], rtol=tolerance, atol=tolerance):
+            mismatches.append("%s differ" % key)
+
+    if mismatches:
+        print("%s: MISMATCH - %s" % (name, ", ".join(mismatches)))
+    else:
+        print("%s: OK - %d trades, Sharpe %.2f, final value %.2f" % (
+            name, event['total_trades'], event['sharpe_ratio'], event['final_portfolio_value']))
+
+    return not mismatches
+
+##############################################################
+def run_event(bars, ticker, strategyClass, *args):
+
+    strat = strategyClass(BuildFeed(ticker, bars), ticker, *args)
+    analyzers = AttachAnalyzers(strat)
+    strat.run()
+
+    return summarize(strat, *analyzers)
+
+def run_vectorized(run, columns, *args):
+
+    strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer, plt = run(columns, *args)
+
+    return summarize(strat, retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer)
+
+def run_parity(ticker, shares, capital, dataFile, rsi2Params, bandsPeriod, smaPeriod, tolerance):
+
+    columns = _vectorized.LoadColumns(dataFile)
+    ok = True
+
+    bars = LoadBars(dataFile)
+    ok &= compare("RSI2",
+        run_event(bars, ticker, RSI2, shares, capital, dataFile, *rsi2Params),
+        run_vectorized(_vectorized.RunRSI2, columns, capital, *rsi2Params), tolerance)
+
+    ok &= compare("BBands",
+        run_event(bars, ticker, BBands, shares, capital, dataFile, bandsPeriod),
+        run_vectorized(_vectorized.RunBBands, columns, capital, bandsPeriod), tolerance)
+
+    ok &= compare("Moving Averages",
+        run_event(bars, ticker, MovingAverages, shares, capital, smaPeriod, dataFile),
+        run_vectorized(_vectorized.RunMovingAverages, columns, shares, capital, smaPeriod), tolerance)
+
+    return ok
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the check against.")
+    parser.add_argument("-s", "--shares", help="The number of imaginary shares to purchase.", default="100")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).", default="1000000")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.", default="yahoo_finance_data")
+    parser.add_argument("-f", "--file", help="Use this CSV file instead of the ticker's historical data.")
+    parser.add_argument("-e", "--entrySMA", help="RSI2 entry sma period.", default="200")
+    parser.add_argument("-x", "--exitSMA", help="RSI2 exit sma period.", default="5")
+    parser.add_argument("-r", "--rsiPeriod", help="RSI2 rsi period.", default="2")
+    parser.add_argument("-os", "--overSoldThreshold", help="RSI2 over sold threshold.", default="10")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="RSI2 over bought threshold.", default="90")
+    parser.add_argument("-b", "--bandsPeriod", help="BBands period.", default="20")
+    parser.add_argument("-p", "--period", help="Moving Averages sma period.", default="20")
+    parser.add_argument("--tolerance", help="Relative tolerance for the floating point figures.", default="1e-6")
+
+    args = parser.parse_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+
+    dataFile = args.file or ""
+    if not dataFile and args.data_format == "yahoo_finance_data":
+        dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
+
+    if not dataFile:
+        print("UNKNOWN - No data file for data_format " + str(args.data_format))
+        sys.exit(UNKNOWN)
+
+    rsi2Params = (int(args.entrySMA), int(args.exitSMA), int(args.rsiPeriod), int(args.overSoldThreshold), int(args.overBoughtThreshold))
+
+    if run_parity(ticker, int(args.shares), int(args.capital), dataFile, rsi2Params, int(args.bandsPeriod), int(args.period), float(args.tolerance)):
+        print("OK - vectorized engine matches the event driven engine")
+        sys.exit(OK)
+    else:
+        print("CRITICAL - vectorized engine differs from the event driven engine")
+        sys.exit(CRITICAL)
@@ -0,0 +1,332 @@
+#!/usr/bin/python3.9
+
+# Walk-forward optimization for the backtests (RSI2, BBands and Moving
+# Averages, with the parameters optimize.py tunes).
+#
+# The history is split into rolling windows: the parameters are optimized
+# (best Sharpe ratio over the given ranges, as rsi2_sweep.py) on a train window
+# of --train bars, then traded on the following --test bars, and the windows
+# move on by --test bars. Every window's test run is out of sample, and
+# together they make one out of sample equity curve.
+#
+# Both the train runs (every window and combination) and the test runs (every
+# window) are independent and run on a process pool.
+#
+# A test run is fed the train window before its test bars so that the
+# indicators are warmed up, but it only trades from the first test bar. Each
+# test run starts from the full capital; the stitched curve compounds their
+# returns, valuing a position still open at the end of a window at its last
+# close.
+#
+#   walk_forward.py -t BTC-USD -c 10000000 -n yahoo_finance_data -e 150:250:50 -x 5,10 -r 2 -os 5:15:5 -ob 85:95:5 --train 504 --test 126
+#   walk_forward.py -f BBands.py -t BTC-USD -c 10000000 -n yahoo_finance_data -b 10:40:5 --train 504 --test 126
+#   walk_forward.py -f moving_averages.py -t BTC-USD -s 100 -c 10000000 -n yahoo_finance_data -p 10:50:10 --train 504 --test 126
+
+from __future__ import print_function
+
+from _functions import LoadBars
+from _functions import BuildFeed
+from _functions import AttachAnalyzers
+from _functions import SharpeRatio
+
+from _resample import DataFrequency
+from _resample import TradingPeriods
+
+from _report import ResultsFile
+
+from optimize import optimizeStrategies
+from optimize import WarmedUpClass
+
+from rsi2_sweep import parse_range
+
+import argparse
+import itertools
+import multiprocessing
+import sys
+import os
+import csv
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "Walk-Forward"
+
+def window_columns(params):
+    return ["window", "train_start", "train_end", "test_start", "test_end"] + params + \
+        ["train_sharpe_ratio", "test_sharpe_ratio", "test_max_drawdown", "test_total_trades", "test_cumulative_returns"]
+
+##############################################################
+# The (train start, test start, test end) bar indexes of each window. The
+# last test window may be shorter.
+def make_windows(bars, trainBars, testBars):
+
+    windows = []
+
+    start = 0
+    while start + trainBars < bars:
+        windows.append((start, start + trainBars, min(start + trainBars + testBars, bars)))
+        start += testBars
+
+    return windows
+
+##############################################################
+# Worker state - the bars are loaded once by the parent and
+# handed to each worker process when the pool starts.
+_bars = None
+_strategyFile = None
+_ticker = None
+_shares = None
+_capital = None
+_dataFile = None
+
+def init_worker(bars, strategyFile, ticker, shares, capital, dataFile):
+
+    global _bars, _strategyFile, _ticker, _shares, _capital, _dataFile
+
+    _bars = bars
+    _strategyFile = strategyFile
+    _ticker = ticker
+    _shares = shares
+    _capital = capital
+    _dataFile = dataFile
+
+# The Sharpe ratio of one combination over a train window.
+def run_train(task):
+
+    window, combination = task
+    trainStart, testStart, testEnd = window
+
+    names, strategyClass, arguments = optimizeStrategies[_strategyFile]
+
+    feed = BuildFeed(_ticker, _bars[trainStart:testStart])
+    strat = strategyClass(feed, *arguments(_ticker, _shares, _capital, _dataFile, combination))
+
+    retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
+
+    strat.run()
+
+    return sharpeRatioAnalyzer.getSharpeRatio(0.05)
+
+# The test run of a window with its chosen combination: its equity at each
+# test bar and its analyzers' figures.
+def run_test(task):
+
+    window, combination = task
+    trainStart, testStart, testEnd = window
+
+    names, strategyClass, arguments = optimizeStrategies[_strategyFile]
+
+    # Only trading from the first test bar, the train bars warm up the indicators.
+    feed = BuildFeed(_ticker, _bars[trainStart:testEnd])
+    strat = WarmedUpClass(strategyClass)(feed, *arguments(_ticker, _shares, _capital, _dataFile, combination))
+    strat.tradeFrom = _bars[testStart].getDateTime()
+
+    retAnalyzer, sharpeRatioAnalyzer, drawDownAnalyzer, tradesAnalyzer = AttachAnalyzers(strat)
+
+    equity = []
+    strat.getBarsProcessedEvent().subscribe(lambda strat_, bars: equity.append(strat_.getBroker().getEquity()))
+
+    strat.run()
+
+    # Nothing is traded before the test bars, so the drawdown and trades
+    # are the test window's alone.
+    equity = equity[testStart - trainStart:]
+
+    return {
+        'equity': equity,
+        'max_drawdown': drawDownAnalyzer.getMaxDrawDown() * 100,
+        'total_trades': tradesAnalyzer.getCount(),
+        }
+
+##############################################################
+# The per-bar returns of an equity curve starting from capital.
+def curve_returns(capital, equity):
+    return [value / previous - 1 for previous, value in zip([capital] + equity[:-1], equity)]
+
+# Through the train runs' analyzer, so that both are per day and annualized
+# over the bars' returns per year.
+def sharpe_or_nan(dateTimes, returns, tradingPeriods):
+
+    sharpeRatioAnalyzer = SharpeRatio(tradingPeriods)
+    for dateTime, ret in zip(dateTimes, returns):
+        sharpeRatioAnalyzer.addReturn(dateTime, ret)
+
+    # Like pyalgotrade's SharpeRatio analyzer, NaN for a single day.
+    if len(sharpeRatioAnalyzer.getReturns()) < 2:
+        return float('nan')
+
+    return sharpeRatioAnalyzer.getSharpeRatio(0.05)
+
+# Rank NaN Sharpe ratios (no trades, or a single day) last.
+def sharpe_key(value):
+    return value if value == value else float('-inf')
+
+##############################################################
+def run_walk_forward(strategyFile, ticker, shares, capital, dataFile, grid, trainBars, testBars, processes, resultsFile, equityFile):
+
+    params = optimizeStrategies[strategyFile][0]
+    combinations = list(itertools.product(*[grid[p] for p in params]))
+
+    # Parse the CSV once, every run builds its feed from these bars.
+    bars = LoadBars(dataFile)
+
+    windows = make_windows(len(bars), trainBars, testBars)
+    if not windows:
+        print("UNKNOWN - Not enough history for a %d bar train window (%d bars)" % (trainBars, len(bars)))
+        return UNKNOWN
+
+    pool = multiprocessing.Pool(processes, init_worker, (bars, strategyFile, ticker, shares, capital, dataFile))
+    try:
+
+        # Optimize every window on its train bars.
+        trainTasks = [(window, combination) for window in windows for combination in combinations]
+        trainSharpes = pool.map(run_train, trainTasks, chunksize=max(1, len(trainTasks) // (4 * (processes or os.cpu_count() or 1))))
+
+        chosen = []
+        for i in range(len(windows)):
+            windowSharpes = trainSharpes[i * len(combinations):(i + 1) * len(combinations)]
+            best = max(range(len(combinations)), key=lambda j: sharpe_key(windowSharpes[j]))
+            chosen.append((combinations[best], windowSharpes[best]))
+
+        # Then trade each window's test bars with its parameters.
+        testResults = pool.map(run_test, [(window, combination) for window, (combination, trainSharpe) in zip(windows, chosen)], chunksize=1)
+
+    finally:
+        pool.close()
+        pool.join()
+
+    tradingPeriods = TradingPeriods(DataFrequency(dataFile))
+
+    # Stitch the test runs into one out of sample curve.
+    dates = []
+    curve = []
+    value = float(capital)
+
+    rows = []
+    for i, (window, (combination, trainSharpe), testResult) in enumerate(zip(windows, chosen, testResults), 1):
+
+        trainStart, testStart, testEnd = window
+        returns = curve_returns(capital, testResult['equity'])
+        testDates = [b.getDateTime() for b in bars[testStart:testEnd]]
+
+        for dateTime, ret in zip(testDates, returns):
+            value *= 1 + ret
+            dates.append(dateTime)
+            curve.append(value)
+
+        row = dict(zip(params, combination))
+        row['window'] = i
+        row['train_start'] = bars[trainStart].getDateTime().strftime("%Y-%m-%d")
+        row['train_end'] = bars[testStart - 1].getDateTime().strftime("%Y-%m-%d")
+        row['test_start'] = bars[testStart].getDateTime().strftime("%Y-%m-%d")
+        row['test_end'] = bars[testEnd - 1].getDateTime().strftime("%Y-%m-%d")
+        row['train_sharpe_ratio'] = "{:.2f}".format(trainSharpe)
+        row['test_sharpe_ratio'] = "{:.2f}".format(sharpe_or_nan(testDates, returns, tradingPeriods))
+        row['test_max_drawdown'] = "{:.2f}".format(testResult['max_drawdown'])
+        row['test_total_trades'] = testResult['total_trades']
+        row['test_cumulative_returns'] = "{:.2f}".format((testResult['equity'][-1] / capital - 1) * 100)
+        rows.append(row)
+
+    with open(resultsFile, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=window_columns(params))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    with open(equityFile, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "equity"])
+        for dateTime, value in zip(dates, curve):
+            writer.writerow([dateTime.strftime("%Y-%m-%d"), "{:.2f}".format(value)])
+
+    sharpeRatio = sharpe_or_nan(dates, curve_returns(capital, curve), tradingPeriods)
+
+    print("Ran %d windows of %d combinations, results written to %s and %s" % (len(windows), len(combinations), resultsFile, equityFile))
+    for row in rows:
+        print("%3d. %s - %s: %s - Train Sharpe: %s, Test Sharpe: %s, Trades: %d" % (
+            row['window'], row['test_start'], row['test_end'], " ".join("%s=%d" % (p, row[p]) for p in params),
+            row['train_sharpe_ratio'], row['test_sharpe_ratio'], row['test_total_trades']))
+
+    print("Out of sample Sharpe Ratio: %.2f, final value %.2f" % (sharpeRatio, curve[-1]))
+
+    if sharpeRatio > 0:
+       return OK
+    else:
+       return CRITICAL
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+
+    parser.add_argument("-f", "--file", help="The backtest to walk forward: " + ", ".join(sorted(optimizeStrategies)) + " (default rsi2.py).",
+                        choices=sorted(optimizeStrategies), default="rsi2.py")
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the walk-forward against.")
+    parser.add_argument("-s", "--shares", help="The number of imaginary shares to purchase.", default="0")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars).")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.")
+    parser.add_argument("-e", "--entrySMA", help="Range of entry sma periods, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-x", "--exitSMA", help="Range of exit sma periods, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-r", "--rsiPeriod", help="Range of rsi periods, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-os", "--overSoldThreshold", help="Range of over sold RSI thresholds, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="Range of over bought RSI thresholds, start:stop[:step] or a,b,c (rsi2.py)")
+    parser.add_argument("-b", "--bandsPeriod", help="Range of bollinger band periods, start:stop[:step] or a,b,c (BBands.py)")
+    parser.add_argument("-p", "--period", help="Range of sma periods, start:stop[:step] or a,b,c (moving_averages.py)")
+    parser.add_argument("--train", help="Bars in each train (optimization) window.", default="504")
+    parser.add_argument("--test", help="Bars in each test (out of sample) window, and the step between windows.", default="126")
+    parser.add_argument("-j", "--processes", help="Number of worker processes (defaults to the number of cores).")
+    parser.add_argument("-o", "--output", help="Where to write the per window results table (CSV).")
+    parser.add_argument("--equity_output", help="Where to write the stitched out of sample equity curve (CSV).")
+
+    args = parser.parse_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    if not args.capital:
+        print("UNKNOWN - No capital amount specified")
+        sys.exit(UNKNOWN)
+
+    if not args.data_format:
+        print("UNKNOWN - No data_format specified")
+        sys.exit(UNKNOWN)
+
+    grid = {}
+    for param in optimizeStrategies[args.file][0]:
+
+        value = getattr(args, param)
+        if not value:
+            print("UNKNOWN - No " + param + " range specified")
+            sys.exit(UNKNOWN)
+
+        try:
+            grid[param] = parse_range(value)
+        except ValueError:
+            print("UNKNOWN - Invalid " + param + " range: " + value)
+            sys.exit(UNKNOWN)
+
+    trainBars = int(args.train)
+    testBars = int(args.test)
+    if trainBars <= 0 or testBars <= 0:
+        print("UNKNOWN - Invalid train/test window sizes")
+        sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+    shares = int(args.shares)
+    capital = int(args.capital)
+    data_format = args.data_format
+    processes = int(args.processes) if args.processes else None
+
+    dataFile = ""
+    if data_format == "yahoo_finance_data":
+        dataFile = "/shark/historical/yahoo_finance_data/" + ticker + ".csv"
+
+    name = os.path.splitext(args.file)[0]
+    resultsFile = args.output or ResultsFile(ticker, name + ".walkforward")
+    equityFile = args.equity_output or ResultsFile(ticker, name + ".walkforward.equity")
+
+    sys.exit(run_walk_forward(args.file, ticker, shares, capital, dataFile, grid, trainBars, testBars, processes, resultsFile, equityFile))
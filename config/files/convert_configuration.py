@@ -108,6 +108,8 @@ def process_plugin_config(p_data, instrument):
 
 					f.write(btarg + "\n")
 
+			portfolioLegs.append(backtestFileName + ":" + scriptFile)
+
 			services.Add("\tcheck_command " + cmd_name + "!" + backtestFileName + "!" + scriptFile + "\n")
 			services.Add("\taction_url /framework/public/index.php/BacktestReport?ticker=" + instrument + "\n")
 		else:
@@ -140,6 +142,7 @@ services = StringBuilder();
 # Portfolio info
 total_capital = 0
 total_shares = 0
+portfolioLegs = []
 
 
 # log file - if it exists, delete.
@@ -195,5 +198,21 @@ print (hosts)
 # Print the services
 print (services)
 
+##############################################################
+# Write the portfolio backtest's script file (see portfolio.py).
+if portfolioLegs:
+
+    portfolioFile = "/shark/.tmp/backtest.portfolio"
+
+    with open(portfolioFile, "w") as f:
+
+        f.write("--capital=" + str(total_capital) + "\n")
+
+        for leg in portfolioLegs:
+
+            f.write("--leg=" + leg + "\n")
+
+    WriteLogFile("Created portfolio: " + str(len(portfolioLegs)) + " backtests, capital " + str(total_capital))
+
 # Finished!
 WriteLogFile("Finished")
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+
+# Indicators updated one value at a time, for the live strategy checks.
+#
+# A live check folds the newest bar into the state it kept from its last run
+# (see _livestate.py) instead of recomputing over the whole history, so every
+# indicator here costs O(1) per value and saves its state as a small dict.
+# They follow pyalgotrade's indicators the backtests use, so the live checks
+# take the same decisions as the backtest classes:
+#
+#   SMA           the mean of the first window, then a running update
+#   RSI           Wilder's RSI, seeded with the simple average of the first
+#                 period changes
+#   RollingStdDev the population standard deviation of the window, kept by a
+#                 windowed Welford update and recomputed once every window to
+#                 keep the rounding from drifting
+#
+# getValue() is None until an indicator has seen enough values.
+
+import collections
+import math
+
+import numpy as np
+
+##############################################################
+class SMA(object):
+
+    def __init__(self, period, state=None):
+
+        state = state or {}
+        self.__period = period
+        self.__values = collections.deque(state.get('values', []), period)
+        self.__value = state.get('value')
+
+    def add(self, value):
+
+        first = self.__values[0] if len(self.__values) == self.__period else None
+        self.__values.append(value)
+
+        if len(self.__values) == self.__period:
+            if self.__value is None:
+                self.__value = float(np.mean(self.__values))
+            else:
+                self.__value = self.__value + value / float(self.__period) - first / float(self.__period)
+
+        return self.__value
+
+    def getValue(self):
+        return self.__value
+
+    def getState(self):
+        return {'values': list(self.__values), 'value': self.__value}
+
+##############################################################
+class RSI(object):
+
+    def __init__(self, period, state=None):
+
+        state = state or {}
+        self.__period = period
+        self.__seed = state.get('seed', [])
+        self.__prev = state.get('prev')
+        self.__avgGain = state.get('avg_gain')
+        self.__avgLoss = state.get('avg_loss')
+        self.__value = state.get('value')
+
+    @staticmethod
+    def _gain_loss(prevValue, value):
+
+        change = value - prevValue
+        if change < 0:
+            return 0, abs(change)
+        return change, 0
+
+    def add(self, value):
+
+        if self.__avgGain is None:
+
+            # The first period changes need period + 1 values.
+            self.__seed.append(value)
+            if len(self.__seed) < self.__period + 1:
+                self.__prev = value
+                return None
+
+            gain = 0
+            loss = 0
+            for prevValue, nextValue in zip(self.__seed[:-1], self.__seed[1:]):
+                currGain, currLoss = self._gain_loss(prevValue, nextValue)
+                gain += currGain
+                loss += currLoss
+            self.__avgGain = gain / float(self.__period)
+            self.__avgLoss = loss / float(self.__period)
+            self.__seed = []
+
+        else:
+
+            currGain, currLoss = self._gain_loss(self.__prev, value)
+            self.__avgGain = (self.__avgGain * (self.__period - 1) + currGain) / float(self.__period)
+            self.__avgLoss = (self.__avgLoss * (self.__period - 1) + currLoss) / float(self.__period)
+
+        self.__prev = value
+
+        if self.__avgLoss == 0:
+            self.__value = 100
+        else:
+            self.__value = 100 - 100 / (1 + self.__avgGain / self.__avgLoss)
+
+        return self.__value
+
+    def getValue(self):
+        return self.__value
+
+    def getState(self):
+        return {'seed': self.__seed, 'prev': self.__prev, 'avg_gain': self.__avgGain, 'avg_loss': self.__avgLoss, 'value': self.__value}
+
+##############################################################
+class RollingStdDev(object):
+
+    def __init__(self, period, state=None):
+
+        state = state or {}
+        self.__period = period
+        self.__values = collections.deque(state.get('values', []), period)
+        self.__mean = state.get('mean', 0.0)
+        self.__m2 = state.get('m2', 0.0)
+        self.__updates = state.get('updates', 0)
+
+    def __resync(self):
+
+        values = np.array(self.__values)
+        self.__mean = float(values.mean())
+        self.__m2 = float(((values - self.__mean) ** 2).sum())
+        self.__updates = 0
+
+    def add(self, value):
+
+        if len(self.__values) < self.__period:
+            self.__values.append(value)
+            if len(self.__values) == self.__period:
+                self.__resync()
+            return self.getValue()
+
+        oldValue = self.__values[0]
+        self.__values.append(value)
+
+        oldMean = self.__mean
+        self.__mean += (value - oldValue) / float(self.__period)
+        self.__m2 += (value - oldValue) * (value - self.__mean + oldValue - oldMean)
+
+        self.__updates += 1
+        if self.__updates >= self.__period:
+            self.__resync()
+
+        return self.getValue()
+
+    def getValue(self):
+
+        if len(self.__values) < self.__period:
+            return None
+        return math.sqrt(max(self.__m2, 0.0) / self.__period)
+
+    def getState(self):
+        return {'values': list(self.__values), 'mean': self.__mean, 'm2': self.__m2, 'updates': self.__updates}
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+# Per ticker state of the live strategy checks, kept between Nagios runs.
+#
+# A check keeps its indicators' state (see _incremental.py), its position and
+# where it stopped reading the data file in
+# /shark/.tmp/live.<strategy>.<ticker>.state. The next run seeks to that line,
+# makes sure it is still there, and only folds in the bars after it. When the
+# data file was rewritten underneath (e.g. a re-download with new adjusted
+# closes) or the parameters changed, the state is rebuilt from the first bar.
+#
+# The bars are the data file's adjusted open and close, as the backtests' feed
+# uses them.
+
+import json
+import os
+
+stateVersion = 1
+
+stateDir = "/shark/.tmp"
+
+def StateFile(strategyName, ticker):
+    return os.path.join(stateDir, "live.%s.%s.state" % (strategyName, ticker))
+
+def _read_state(path, params):
+
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if state.get('version') != stateVersion or state.get('params') != params:
+        return None
+
+    return state
+
+def _write_atomic(path, state):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+##############################################################
+# The (date, adjusted open, adjusted close) rows of a data file after the last
+# line read (tail, as [offset, line] or None for the start of the file) and the
+# new tail, or (None, None) when that line is no longer where it was. A
+# trailing line still being written is left for the next run.
+def ReadRows(dataFile, tail):
+
+    with open(dataFile, 'rb') as f:
+
+        if tail is None:
+            f.readline()
+        else:
+            offset, line = tail
+            f.seek(offset)
+            if f.readline().decode('utf-8') != line:
+                return None, None
+
+        rows = []
+        while True:
+
+            start = f.tell()
+            raw = f.readline()
+            if not raw.endswith(b"\n"):
+                break
+
+            line = raw.decode('utf-8')
+            tail = [start, line]
+
+            fields = line.strip().split(',')
+            try:
+                rows.append((fields[0], float(fields[5]) * float(fields[1]) / float(fields[4]), float(fields[5])))
+            except (IndexError, ValueError, ZeroDivisionError):
+                # Yahoo's "null" rows have no prices.
+                continue
+
+    return rows, tail
+
+##############################################################
+# Fold the new bars of a data file into a live strategy's state. create(state)
+# builds the strategy from its saved state (None for a fresh one); it has
+# onBar(date, openPrice, price), returning the signal the bar raises (or None), and
+# getState(). Returns the strategy, the bars folded in and the signals they
+# raised, as (date, signal) pairs.
+def Advance(strategyName, ticker, dataFile, params, create, rebuild=False):
+
+    path = StateFile(strategyName, ticker)
+
+    state = None if rebuild else _read_state(path, params)
+
+    rows = None
+    if state is not None:
+        rows, tail = ReadRows(dataFile, state['tail'])
+        strat = create(state['strategy'])
+
+    if rows is None:
+        rows, tail = ReadRows(dataFile, None)
+        strat = create(None)
+
+    signals = []
+    for date, openPrice, price in rows:
+        signal = strat.onBar(date, openPrice, price)
+        if signal is not None:
+            signals.append((date, signal))
+
+    os.makedirs(stateDir, exist_ok=True)
+    _write_atomic(path, {'version': stateVersion, 'params': params, 'tail': tail, 'strategy': strat.getState()})
+
+    return strat, len(rows), signals
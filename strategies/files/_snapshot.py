@@ -0,0 +1,222 @@
+#!/usr/bin/python
+
+# Quote and SMA snapshot shared by the live strategy checks.
+#
+# Every check is its own process, so looking the price and the SMA up per
+# check costs two upstream calls per instrument and cycle. Instead, the first
+# check of a cycle fetches the price and the SMAs of all the instruments of
+# trading-config.yml in one batch into /shark/.tmp/quote.snapshot.json, and
+# the other checks read their quote from it until it is older than the TTL.
+# quote_snapshot.py refreshes it ahead of the checks (e.g. from cron).
+#
+# A lock file makes the concurrent checks of a stale snapshot wait for one
+# refresh instead of each doing their own, and the snapshot is replaced
+# atomically, so a check never reads it half written.
+#
+# Sources:
+#
+#   shark   Shark.Plugins.GetPrice / GetSMA, as the checks did
+#   local   the last close and SMAs of the historical data files, a stand-in
+#           for testing without the upstream feed
+
+import fcntl
+import json
+import os
+import time
+
+import yaml
+
+snapshotVersion = 1
+
+snapshotFile = "/shark/.tmp/quote.snapshot.json"
+
+lockFile = "/shark/.tmp/quote.snapshot.lock"
+
+configFile = "/shark/Shark-Config/config/files/trading-config.yml"
+
+dataDir = "/shark/historical/yahoo_finance_data"
+
+# Seconds a snapshot is served before the next check refreshes it.
+ttl = 60
+
+##############################################################
+# The instruments of trading-config.yml and the SMA periods their plugins use.
+def ConfiguredInstruments(path=configFile):
+
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f)
+
+    tickers = []
+    periods = set()
+
+    for i_data in data or []:
+        tickers.append(str(i_data['instrument']))
+        for plugin in i_data.get('plugin') or []:
+            if 'sma' in plugin:
+                periods.add(int(plugin['sma']))
+
+    return tickers, periods
+
+##############################################################
+# Sources, each returning {ticker: {'price': p, 'sma': {period: v}}} for a
+# batch, with None for what it couldn't get.
+def _shark_quotes(tickers, periods):
+
+    import Shark
+
+    quotes = {}
+    for ticker in tickers:
+        try:
+            quotes[ticker] = {'price': Shark.Plugins.GetPrice(ticker),
+                              'sma': dict((str(period), Shark.Plugins.GetSMA(ticker, period)) for period in periods)}
+        except Exception:
+            quotes[ticker] = None
+
+    return quotes
+
+# The last count closes of a data file, read from its end.
+def _tail_closes(path, count):
+
+    with open(path, 'rb') as f:
+
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+
+        data = b""
+        pos = end
+        while pos > 0 and data.count(b"\n") <= count + 1:
+            step = min(pos, 64 << 10)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+    lines = data.decode('utf-8').splitlines()
+    if pos == 0:
+        lines = lines[1:]
+
+    closes = []
+    for line in lines[-count:]:
+        fields = line.split(',')
+        try:
+            closes.append(float(fields[4]))
+        except (IndexError, ValueError):
+            continue
+
+    return closes
+
+def _local_quotes(tickers, periods):
+
+    quotes = {}
+    for ticker in tickers:
+        try:
+            closes = _tail_closes(os.path.join(dataDir, ticker + ".csv"), max(list(periods) + [1]))
+        except OSError:
+            closes = []
+
+        if not closes:
+            quotes[ticker] = None
+            continue
+
+        quotes[ticker] = {'price': closes[-1],
+                          'sma': dict((str(period), sum(closes[-period:]) / float(period) if len(closes) >= period else None) for period in periods)}
+
+    return quotes
+
+sources = {
+    'shark': _shark_quotes,
+    'local': _local_quotes,
+}
+
+##############################################################
+def ReadSnapshot(path=snapshotFile):
+
+    try:
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if snapshot.get('version') != snapshotVersion:
+        return None
+
+    return snapshot
+
+def _write_atomic(path, snapshot):
+
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+# Whether a snapshot can serve a ticker's quote with these SMA periods.
+def _serves(snapshot, source, ticker, periods, maxAge):
+
+    if snapshot is None or snapshot.get('source') != source:
+        return False
+    if time.time() - snapshot.get('created', 0) > maxAge:
+        return False
+    if ticker is not None and ticker not in snapshot['quotes']:
+        return False
+
+    return all(str(period) in snapshot['periods'] for period in periods)
+
+##############################################################
+# Fetch the quotes of the configured instruments (and of the given tickers and
+# periods, and whatever the last snapshot held) in one batch, and store them
+# as the new snapshot.
+def Refresh(source='shark', tickers=(), periods=(), config=configFile):
+
+    try:
+        configured, configuredPeriods = ConfiguredInstruments(config)
+    except (OSError, yaml.YAMLError, KeyError, TypeError, ValueError, AttributeError):
+        configured, configuredPeriods = [], set()
+
+    last = ReadSnapshot() or {'quotes': {}, 'periods': []}
+
+    batchTickers = sorted(set(configured) | set(last['quotes']) | set(tickers))
+    batchPeriods = sorted(set(configuredPeriods) | set(int(period) for period in last['periods']) | set(int(period) for period in periods))
+
+    snapshot = {
+        'version': snapshotVersion,
+        'source': source,
+        'created': time.time(),
+        'periods': [str(period) for period in batchPeriods],
+        'quotes': sources[source](batchTickers, batchPeriods),
+    }
+
+    os.makedirs(os.path.dirname(snapshotFile), exist_ok=True)
+    _write_atomic(snapshotFile, snapshot)
+
+    return snapshot
+
+##############################################################
+# A ticker's price and SMAs ({period: value}) from the snapshot, refreshing it
+# first when it is older than maxAge seconds or misses the quote. None for a
+# quote the source couldn't get.
+def GetQuote(ticker, periods, source='shark', maxAge=ttl):
+
+    snapshot = ReadSnapshot()
+
+    if not _serves(snapshot, source, ticker, periods, maxAge):
+
+        os.makedirs(os.path.dirname(lockFile), exist_ok=True)
+        with open(lockFile, 'a') as lock:
+
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another check may have refreshed it while this one waited.
+                snapshot = ReadSnapshot()
+                if not _serves(snapshot, source, ticker, periods, maxAge):
+                    snapshot = Refresh(source, [ticker], periods)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    quote = snapshot['quotes'].get(ticker)
+    if quote is None:
+        return None, dict((period, None) for period in periods)
+
+    return quote['price'], dict((period, quote['sma'].get(str(period))) for period in periods)
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+# Live counterpart of the BBands backtest (backtests/BBands.py): takes the same
+# buy and sell decisions on the newest bar of the historical data file, with
+# the bands and the position kept between runs (see _livestate.py).
+#
+# The backtest buys with all its cash at the next bar's open, and the broker
+# cancels the order when that open gapped up beyond the cash, leaving it flat
+# to buy again. The account is followed the same way here, so the decisions
+# stay the same.
+
+import argparse
+import _incremental
+import _livestate
+import sys
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "bbands"
+
+cmd_arg_help = "Strategy: Bollinger Bands. Alert when the newest bar closes below the lower band (buy) or, holding, above the upper band (sell)."
+
+# As BBands.py.
+numStdDev = 2
+
+class LiveBBands(object):
+
+    def __init__(self, bandsPeriod, capital, state=None):
+
+        state = state or {}
+        self.__sma = _incremental.SMA(bandsPeriod, state.get('sma'))
+        self.__stdDev = _incremental.RollingStdDev(bandsPeriod, state.get('std_dev'))
+        self.__cash = state.get('cash', float(capital))
+        self.__shares = state.get('shares', 0)
+        self.__order = state.get('order', 0)
+        self.__since = state.get('since')
+        self.__date = state.get('date')
+        self.__price = state.get('price')
+
+    def __bands(self):
+
+        sma = self.__sma.getValue()
+        stdDev = self.__stdDev.getValue()
+        if sma is None or stdDev is None:
+            return None, None
+
+        return sma - stdDev * numStdDev, sma + stdDev * numStdDev
+
+    # The market order of the bar before, at this bar's open.
+    def __fill(self, date, openPrice):
+
+        if self.__order * openPrice <= self.__cash:
+            self.__cash -= self.__order * openPrice
+            self.__shares += self.__order
+            self.__since = date
+
+        self.__order = 0
+
+    def onBar(self, date, openPrice, price):
+
+        if self.__order != 0:
+            self.__fill(date, openPrice)
+
+        self.__sma.add(price)
+        self.__stdDev.add(price)
+        self.__date = date
+        self.__price = price
+
+        lower, upper = self.__bands()
+        if lower is None:
+            return None
+
+        if self.__shares == 0 and price < lower:
+            self.__order = int(self.__cash / price)
+            return "BUY"
+        elif self.__shares > 0 and price > upper:
+            self.__order = -self.__shares
+            return "SELL"
+
+        return None
+
+    def describe(self):
+
+        lower, upper = self.__bands()
+        if lower is None:
+            return None
+
+        return "price $%.2f, lower band %.2f, upper band %.2f" % (self.__price, lower, upper)
+
+    def getDate(self):
+        return self.__date
+
+    def getPosition(self):
+        return "long" if self.__shares > 0 else "flat", self.__since
+
+    def getState(self):
+        return {'sma': self.__sma.getState(), 'std_dev': self.__stdDev.getState(), 'cash': self.__cash, 'shares': self.__shares,
+                'order': self.__order, 'since': self.__since, 'date': self.__date, 'price': self.__price}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=cmd_arg_help, fromfile_prefix_chars='@')
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the strategy against.")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.", default="yahoo_finance_data")
+    parser.add_argument("-c", "--capital", help="The imaginary amount of capital available (in dollars), as the backtest's.", default="10000000")
+    parser.add_argument("-b", "--bandsPeriod", help="The sma period that we will use as the basis for entry into a trade", default="20")
+    parser.add_argument("--rebuild", help="Replay the whole history instead of resuming from the saved state.", action="store_true")
+    args = parser.parse_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+    dataFile = "/shark/historical/" + args.data_format + "/" + ticker + ".csv"
+
+    params = [int(args.bandsPeriod), int(args.capital)]
+
+    try:
+        strat, bars, signals = _livestate.Advance(strategy_name, ticker, dataFile, params, lambda state: LiveBBands(*params, state=state), args.rebuild)
+    except OSError as e:
+        print ("UNKNOWN - Unable to read " + dataFile + ": " + str(e))
+        sys.exit(UNKNOWN)
+
+    status = strat.describe()
+    if status is None:
+        print ("UNKNOWN - Not enough bars for the bands")
+        sys.exit(UNKNOWN)
+
+    position, since = strat.getPosition()
+    perfdata = "new_bars=%d signals=%d" % (bars, len(signals))
+
+    # Alert on a signal of the newest bar only, not on the history a rebuild replays.
+    if signals and signals[-1][0] == strat.getDate():
+        print ("%s - %s on %s, %s | %s" % (signals[-1][1], ticker, strat.getDate(), status, perfdata))
+        sys.exit(CRITICAL)
+
+    print ("OK - %s %s since %s, %s | %s" % (ticker, position, since or "the start", status, perfdata))
+    sys.exit(OK)
@@ -1,9 +1,16 @@
 #!/usr/bin/python
 
 import argparse
-import Shark
+import _snapshot
 import sys
 
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
 cmd_arg_help = "Strategy: Moving Average Cross Over. Alert when the share price goes above/below the specified simple moving average period."
 
 if __name__ == "__main__":
@@ -11,6 +18,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=cmd_arg_help)
     parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the strategy against.")
     parser.add_argument("-s", "--sma", help="Simple Moving Averages Period.")
+    parser.add_argument("--source", help="Where the quote snapshot gets the prices from (shark or local).", default="shark", choices=sorted(_snapshot.sources))
+    parser.add_argument("--ttl", help="Seconds a quote snapshot is served before it is refreshed.", default=str(_snapshot.ttl))
     args = parser.parse_args()
 
     if not args.ticker:
@@ -22,10 +31,15 @@ if __name__ == "__main__":
         sys.exit(UNKNOWN)    
         
     ticker = args.ticker 
-    sma_period = args.sma
+    sma_period = int(args.sma)
 
-    sma = Shark.Plugins.GetSMA(ticker, sma_period)
-    price = Shark.Plugins.GetPrice(ticker)
+    # Read from the batched snapshot, not one upstream call per check (see _snapshot.py).
+    price, smas = _snapshot.GetQuote(ticker, [sma_period], args.source, int(args.ttl))
+    sma = smas[sma_period]
+
+    if price is None or sma is None:
+        print ("UNKNOWN - No quote for " + ticker)
+        sys.exit(UNKNOWN)
     
     if price > sma:
 
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+# Refresh the quote snapshot the live strategy checks read (see _snapshot.py),
+# for all the configured instruments in one batch. Run once per cycle, ahead of
+# the checks.
+#
+#   quote_snapshot.py
+#   quote_snapshot.py --source local -t BTC-USD -s 20 -s 50
+
+import argparse
+import _snapshot
+import time
+import sys
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+cmd_arg_help = "Refresh the quotes and SMAs of all the instruments the live strategies check."
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=cmd_arg_help)
+    parser.add_argument("-f", "--config", help="The trading configuration listing the instruments.", default=_snapshot.configFile)
+    parser.add_argument("--source", help="Where to get the prices from (shark or local).", default="shark", choices=sorted(_snapshot.sources))
+    parser.add_argument("-t", "--ticker", help="Also quote this ticker (may be repeated).", action="append", default=[])
+    parser.add_argument("-s", "--sma", help="Also compute this SMA period (may be repeated).", action="append", default=[])
+    args = parser.parse_args()
+
+    started = time.time()
+    snapshot = _snapshot.Refresh(args.source, args.ticker, [int(period) for period in args.sma], args.config)
+    elapsed = time.time() - started
+
+    quotes = snapshot['quotes']
+    if not quotes:
+        print ("UNKNOWN - No instruments to quote")
+        sys.exit(UNKNOWN)
+
+    missing = sorted(ticker for ticker, quote in quotes.items() if quote is None)
+
+    perfdata = "instruments=%d missing=%d periods=%d refresh_time=%.4fs" % (len(quotes), len(missing), len(snapshot['periods']), elapsed)
+
+    if missing:
+        print ("WARNING - No quote for " + ", ".join(missing) + " | " + perfdata)
+        sys.exit(WARNING)
+
+    print ("OK - Quoted %d instruments | %s" % (len(quotes), perfdata))
+    sys.exit(OK)
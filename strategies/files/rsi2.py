@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+# Live counterpart of the RSI2 backtest (backtests/rsi2.py): takes the same
+# entry and exit decisions on the newest bar of the historical data file, with
+# the indicators and the position kept between runs (see _livestate.py).
+
+import argparse
+import _incremental
+import _livestate
+import sys
+
+# Nagios constants.
+
+OK           = 0
+WARNING      = 1
+CRITICAL     = 2
+UNKNOWN      = 3
+
+strategy_name = "rsi2"
+
+cmd_arg_help = "Strategy: RSI2. Alert when the newest bar enters or exits a trade of the RSI2 backtest."
+
+class LiveRSI2(object):
+
+    def __init__(self, entrySMA, exitSMA, rsiPeriod, overSoldThreshold, overBoughtThreshold, state=None):
+
+        state = state or {}
+        self.__entrySMA = _incremental.SMA(entrySMA, state.get('entry_sma'))
+        self.__exitSMA = _incremental.SMA(exitSMA, state.get('exit_sma'))
+        self.__rsi = _incremental.RSI(rsiPeriod, state.get('rsi'))
+        self.__overSoldThreshold = overSoldThreshold
+        self.__overBoughtThreshold = overBoughtThreshold
+        self.__position = state.get('position', "flat")
+        self.__since = state.get('since')
+        self.__date = state.get('date')
+        self.__price = state.get('price')
+        self.__exitDiff = state.get('exit_diff')
+
+    def __enter(self, date, position):
+        self.__position = position
+        self.__since = date
+
+    def onBar(self, date, openPrice, price):
+
+        entrySMA = self.__entrySMA.add(price)
+        exitSMA = self.__exitSMA.add(price)
+        rsi = self.__rsi.add(price)
+
+        # The price against the exit SMA on the bar before, for the crosses.
+        prevDiff = self.__exitDiff
+        self.__exitDiff = price - exitSMA if exitSMA is not None else None
+        self.__date = date
+        self.__price = price
+
+        # Wait for enough bars to be available to calculate SMA and RSI.
+        if entrySMA is None or exitSMA is None or rsi is None:
+            return None
+
+        # cross_above / cross_below over the last two bars.
+        if self.__position == "long":
+            if prevDiff is not None and prevDiff < 0 and self.__exitDiff > 0:
+                self.__enter(date, "flat")
+                return "SELL"
+        elif self.__position == "short":
+            if prevDiff is not None and prevDiff > 0 and self.__exitDiff < 0:
+                self.__enter(date, "flat")
+                return "COVER"
+        else:
+            if price > entrySMA and rsi <= self.__overSoldThreshold:
+                self.__enter(date, "long")
+                return "BUY"
+            elif price < entrySMA and rsi >= self.__overBoughtThreshold:
+                self.__enter(date, "short")
+                return "SHORT"
+
+        return None
+
+    def describe(self):
+
+        values = (self.__price, self.__entrySMA.getValue(), self.__exitSMA.getValue(), self.__rsi.getValue())
+        if None in values:
+            return None
+
+        return "price $%.2f, entry SMA %.2f, exit SMA %.2f, RSI %.2f" % values
+
+    def getDate(self):
+        return self.__date
+
+    def getPosition(self):
+        return self.__position, self.__since
+
+    def getState(self):
+        return {'entry_sma': self.__entrySMA.getState(), 'exit_sma': self.__exitSMA.getState(), 'rsi': self.__rsi.getState(),
+                'position': self.__position, 'since': self.__since, 'date': self.__date, 'price': self.__price, 'exit_diff': self.__exitDiff}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=cmd_arg_help, fromfile_prefix_chars='@')
+    parser.add_argument("-t", "--ticker", help="Ticker of the stock to run the strategy against.")
+    parser.add_argument("-n", "--data_format", help="The provider of the historical data.", default="yahoo_finance_data")
+    parser.add_argument("-e", "--entrySMA", help="The sma period that we will use as the basis for entry into a trade", default="200")
+    parser.add_argument("-x", "--exitSMA", help="The sma period that we will use as the basis for exit from a trade", default="5")
+    parser.add_argument("-r", "--rsiPeriod", help="The rsi period that we will use as the basis for the trade", default="2")
+    parser.add_argument("-os", "--overSoldThreshold", help="The RSI indication that will be considered over sold.", default="10")
+    parser.add_argument("-ob", "--overBoughtThreshold", help="The RSI indication that will be considered over bought.", default="90")
+    parser.add_argument("--rebuild", help="Replay the whole history instead of resuming from the saved state.", action="store_true")
+    args = parser.parse_args()
+
+    if not args.ticker:
+        print ("UNKNOWN - No ticker specified")
+        sys.exit(UNKNOWN)
+
+    ticker = args.ticker
+    dataFile = "/shark/historical/" + args.data_format + "/" + ticker + ".csv"
+
+    params = [int(args.entrySMA), int(args.exitSMA), int(args.rsiPeriod), int(args.overSoldThreshold), int(args.overBoughtThreshold)]
+
+    try:
+        strat, bars, signals = _livestate.Advance(strategy_name, ticker, dataFile, params, lambda state: LiveRSI2(*params, state=state), args.rebuild)
+    except OSError as e:
+        print ("UNKNOWN - Unable to read " + dataFile + ": " + str(e))
+        sys.exit(UNKNOWN)
+
+    status = strat.describe()
+    if status is None:
+        print ("UNKNOWN - Not enough bars for the indicators")
+        sys.exit(UNKNOWN)
+
+    position, since = strat.getPosition()
+    perfdata = "new_bars=%d signals=%d" % (bars, len(signals))
+
+    # Alert on a signal of the newest bar only, not on the history a rebuild replays.
+    if signals and signals[-1][0] == strat.getDate():
+        print ("%s - %s on %s, %s | %s" % (signals[-1][1], ticker, strat.getDate(), status, perfdata))
+        sys.exit(CRITICAL)
+
+    print ("OK - %s %s since %s, %s | %s" % (ticker, position, since or "the start", status, perfdata))
+    sys.exit(OK)